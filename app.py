@@ -1,13 +1,51 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, send_file
-from utils.stock_data import get_stock_data, get_stocks_data, get_mutual_funds_data, find_and_test_mutual_funds, get_stock_history, get_upcoming_ipos, get_stock_dividends
+from flask import Flask, Response, g, render_template, jsonify, request, redirect, url_for, session
+from flask.json.provider import DefaultJSONProvider
+from utils.stock_data import (
+    PERIOD_INTERVALS, get_stock_data, get_stocks_data, get_upcoming_ipos, history_frame, history_window,
+    normalize_symbol, sync_stock_history
+)
+from utils.alert_book import alert_book
+from utils.async_stock_data import gather_limited, get_histories_async, get_stocks_data_async, sync_stock_history_async
+from utils.dividend_cache import dividend_cache, summarize_dividends
+from utils.fund_registry import fund_registry
+from utils.history_store import BAR_PYRAMID, history_store
+from utils.http_client import async_transport
+from utils.http_cache import COMPRESS_MIN_BYTES, compress, etag_matches, make_etag, negotiate_encoding
+from utils.indicators import indicator_cache, parse_indicator_params
+from utils.market_poller import market_poller
+from utils.metrics import current_route, metrics
+from utils.portfolio_engine import compute_portfolio_history
+from utils.profiling import memory_tracker, request_profiler
+from utils.quote import Quote, quote_columns
+from utils.rate_limit import UPSTREAM_BURST, UPSTREAM_RATE
+from utils.ledger_store import ledger
+from utils.report_export import stream_export
+from utils.shared_quotes import quote_table
+from utils.tax_lots import add_lot, financial_year, sell_fifo
+import asyncio
 import os
+import re
+import time
+import uuid
 from datetime import datetime, timedelta
-import pandas as pd
-import io
-import json
+from functools import wraps
+from inspect import iscoroutinefunction
+from itertools import chain
+import numpy as np
+
+class TradeXJSONProvider(DefaultJSONProvider):
+    """JSON provider that renders quote records, display strings included, at response time"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Quote):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+app.json = TradeXJSONProvider(app)
+# Set TRADEX_SECRET_KEY so session ids (and the ledger data behind them) survive restarts
+app.secret_key = os.environ.get('TRADEX_SECRET_KEY') or os.urandom(24)
 
 # Default stocks list
 DEFAULT_STOCKS = [
@@ -15,6 +53,25 @@ DEFAULT_STOCKS = [
     "SBIN.NS", "ICICIBANK.NS", "HINDUNILVR.NS", "ADANIENT.NS", "TATAMOTORS.NS"
 ]
 
+# Keys the cookie session held before state moved to the ledger store
+LEGACY_SESSION_KEYS = ('stocks', 'portfolio', 'sold_stocks', 'dividends', 'alerts')
+
+# Most symbols accepted in one ?stocks= list on the quote routes
+STOCKS_PARAM_MAX = 50
+
+# Ticker with an optional exchange suffix, e.g. TCS, M&M.NS or BAJAJ-AUTO.BO
+SYMBOL_PATTERN = re.compile(r'[A-Z0-9&-]{1,20}(\.(NS|BO))?')
+
+# Seconds between keep-alive comments on idle SSE streams
+STREAM_HEARTBEAT_SECONDS = 15
+
+# Seconds a cold /api/indicators batch may spend waiting on the upstream rate limiter
+INDICATOR_BATCH_SECONDS = 10
+
+# Most symbols accepted by one /api/indicators batch request: as many history
+# syncs as the process-wide limiter serves within INDICATOR_BATCH_SECONDS
+INDICATOR_BATCH_MAX = int(UPSTREAM_BURST + UPSTREAM_RATE * INDICATOR_BATCH_SECONDS)
+
 # Tax rates for capital gains in India
 TAX_RATES = {
     'short_term': 0.15,  # 15% for holdings less than 1 year
@@ -23,56 +80,266 @@ TAX_RATES = {
  
 # Initialize session data
 def initialize_session():
-    if 'stocks' not in session:
-        session['stocks'] = DEFAULT_STOCKS.copy()
-    if 'portfolio' not in session:
-        session['portfolio'] = []
-    if 'sold_stocks' not in session:
-        session['sold_stocks'] = []
-    if 'alerts' not in session:
-        session['alerts'] = []
-    if 'dividends' not in session:
-        session['dividends'] = []
+    """Get the current user id, creating the user on first visit
+
+    The session cookie only carries this id; portfolio, watchlist, sales,
+    dividends and alerts live in the server-side ledger store.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        user_id = uuid.uuid4().hex
+        session['user_id'] = user_id
+    ledger.ensure_user(user_id, DEFAULT_STOCKS)
+    # Sessions from before the ledger still carry their data in the cookie;
+    # move it into the ledger once and drop it from the cookie
+    legacy = {key: session.pop(key) for key in LEGACY_SESSION_KEYS if key in session}
+    if legacy:
+        imported_alerts = ledger.import_session(user_id, legacy)
+        if alert_book.loaded:
+            for alert in imported_alerts:
+                alert_book.add(user_id, dict(alert))
+    if not alert_book.loaded:
+        load_alert_book()
+    return user_id
+
+def load_alert_book():
+    """Index every stored alert and evaluate it whenever the poller publishes new quotes"""
+    alert_book.on_trigger = persist_triggered_alerts
+    alert_book.load(ledger.iter_all_alerts())
+    market_poller.add_listener(alert_book.on_quotes)
+    market_poller.add_symbol_source(alert_book.symbols)
+    alert_book.on_quotes(list(market_poller.snapshot.quotes.values()))
+
+def persist_triggered_alerts(triggered):
+    ledger.mark_alerts_triggered(triggered)
+
+# With TRADEX_SHARED_QUOTES=1 the worker holding the shared quote table also
+# refreshes the symbols the other workers could not find in it
+market_poller.add_symbol_source(quote_table.wanted_symbols)
+
+@app.before_request
+def start_shared_quote_refresh():
+    if quote_table.enabled:
+        market_poller.ensure_started()
+
+REQUEST_SECONDS = metrics.histogram(
+    'tradex_http_request_seconds', 'Time to build each response, by route template', ['route', 'method'])
+RESPONSES = metrics.counter(
+    'tradex_http_responses_total', 'Responses by route template and status code', ['route', 'method', 'status'])
+
+@app.before_request
+def start_request_metrics():
+    # Route templates keep label cardinality bounded; upstream calls made while
+    # serving the request are attributed to this route
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_token = current_route.set(g.metrics_route)
+    g.metrics_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    route = g.get('metrics_route', 'unmatched')
+    if 'metrics_started' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.metrics_started, route=route, method=request.method)
+    RESPONSES.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.teardown_request
+def reset_request_metrics(exc):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        current_route.reset(token)
+
+@app.before_request
+def start_request_profile():
+    # Opt-in: TRADEX_PROFILING=1 plus an X-Profile header or the sampled fraction
+    if request_profiler.wants(request.headers.get('X-Profile')):
+        g.profiler = request_profiler.start()
+
+def profile_async_view(view):
+    """
+    Wrap an async view so a profiled request also captures the view itself
+
+    Flask runs async views to completion on an event loop in another thread,
+    which the profiler started in before_request does not see. The wrapper
+    profiles that thread while the view runs and leaves the result on g for
+    finish_request_profile to merge.
+    """
+    @wraps(view)
+    async def profiled(*args, **kwargs):
+        if g.get('profiler') is None:
+            return await view(*args, **kwargs)
+        profiler = request_profiler.attach()
+        try:
+            return await view(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                g.setdefault('thread_profilers', []).append(profiler)
+    return profiled
+
+flask_ensure_sync = app.ensure_sync
+
+def ensure_sync(func):
+    if iscoroutinefunction(func):
+        func = profile_async_view(func)
+    return flask_ensure_sync(func)
+
+app.ensure_sync = ensure_sync
+
+@app.after_request
+def finish_request_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        result = request_profiler.finish(
+            profiler, g.get('metrics_route') or request.path, g.pop('thread_profilers', ())
+        )
+        response.headers['X-Profile-File'] = os.path.basename(result['file'])
+        response.headers['X-Profile-Total-Ms'] = f"{result['total'] * 1000:.1f}"
+        response.headers['X-Profile-Top'] = request_profiler.header_summary(result['top'])
+    return response
+
+@app.teardown_request
+def discard_request_profile(exc):
+    # A request that failed before after_request still has to release the profiler
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        request_profiler.finish(profiler, g.get('metrics_route') or request.path, g.pop('thread_profilers', ()))
+
+def profiling_allowed():
+    if not request_profiler.enabled:
+        return False
+    return request_profiler.token is None or request.headers.get('X-Profile') == request_profiler.token
+
+@app.route('/debug/memory/snapshot', methods=['POST'])
+def memory_snapshot():
+    """Take a tracemalloc snapshot and make it the baseline for /debug/memory/diff"""
+    if not profiling_allowed():
+        return jsonify({'status': 'error', 'message': 'Not found'}), 404
+    
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({'status': 'success', 'snapshot': memory_tracker.snapshot(limit)})
+
+@app.route('/debug/memory/diff')
+def memory_diff():
+    """Show allocation growth since the last /debug/memory/snapshot"""
+    if not profiling_allowed():
+        return jsonify({'status': 'error', 'message': 'Not found'}), 404
+    
+    diff = memory_tracker.diff(request.args.get('limit', 20, type=int))
+    if diff is None:
+        return jsonify({'status': 'error', 'message': 'Take a snapshot first with POST /debug/memory/snapshot'}), 400
+    return jsonify({'status': 'success', 'diff': diff})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose process metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def conditional_json(etag, build):
+    """
+    Answer a polled JSON endpoint, skipping serialization when the client is current
+
+    Parameters:
+    etag (str): Validator derived from the versions the payload is built from
+    build (callable): Returns the payload; only called when it has to be sent
+
+    Returns:
+    Response: 304 Not Modified if If-None-Match matches, otherwise the JSON
+    body, gzip- or brotli-encoded when large enough and accepted
+    """
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        body = response.get_data()
+        if encoding and len(body) >= COMPRESS_MIN_BYTES:
+            response.set_data(compress(body, encoding))
+            response.headers['Content-Encoding'] = encoding
+    response.headers['ETag'] = etag
+    # Always revalidate; an unchanged result costs a 304 with no body
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding, Cookie'
+    return response
+
+def requested_stocks(user_id):
+    """
+    Get the symbols a quote route serves: the ?stocks= list or the user's watchlist
+
+    Raises:
+    ValueError: If the list is too long or contains a malformed symbol
+    """
+    stocks_param = request.args.get('stocks')
+    if not stocks_param:
+        return ledger.get_watchlist(user_id)
+    
+    stocks = list(dict.fromkeys(s.strip().upper() for s in stocks_param.split(',') if s.strip()))
+    if len(stocks) > STOCKS_PARAM_MAX:
+        raise ValueError(f'At most {STOCKS_PARAM_MAX} symbols per request')
+    invalid = [s for s in stocks if not SYMBOL_PATTERN.fullmatch(s)]
+    if invalid:
+        raise ValueError(f'Invalid stock symbol: {invalid[0][:20]}')
+    return stocks
+
+# Register every symbol the user cares about with the background poller
+def track_session_symbols(user_id):
+    symbols = ledger.get_watchlist(user_id)
+    symbols += [p['symbol'] for p in ledger.get_portfolio(user_id)]
+    symbols += [a['symbol'] for a in ledger.get_alerts(user_id)]
+    market_poller.track(symbols)
 
 @app.route('/')
 def index():
     """Render the main dashboard page"""
-    initialize_session()
-    return render_template('index.html', stocks=session['stocks'])
+    user_id = initialize_session()
+    return render_template('index.html', stocks=ledger.get_watchlist(user_id))
 
 @app.route('/api/stocks')
 def get_stocks():
     """API endpoint to get stock data"""
-    stocks_param = request.args.get('stocks')
-    if stocks_param:
-        stocks = stocks_param.split(',')
-    else:
-        stocks = session.get('stocks', DEFAULT_STOCKS)
+    user_id = initialize_session()
+    try:
+        stocks = requested_stocks(user_id)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
     try:
-        stocks_data = get_stocks_data(stocks)
-        total_market_cap = sum(stock['market_cap'] for stock in stocks_data if isinstance(stock.get('market_cap'), (int, float)))
-        sector_distribution = {}
-        for stock in stocks_data:
-            sector = stock.get('sector', 'Unknown')
-            sector_distribution[sector] = sector_distribution.get(sector, 0) + 1
+        track_session_symbols(user_id)
+        snapshot = market_poller.get_snapshot(stocks)
         
         # Portfolio summary for dashboard
-        portfolio = session.get('portfolio', [])
+        portfolio = ledger.get_portfolio(user_id)
         portfolio_value = sum(p['quantity'] * p['current_price'] for p in portfolio)
         portfolio_pl = sum(p['quantity'] * (p['current_price'] - p['buy_price']) for p in portfolio)
         
-        return jsonify({
-            'data': stocks_data,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'metrics': {
-                'total_stocks': len(stocks_data),
-                'total_market_cap': total_market_cap,
-                'sector_distribution': sector_distribution,
-                'portfolio_value': portfolio_value,
-                'portfolio_pl': portfolio_pl
+        # The quotes only differ from the client's copy if one of them changed since
+        etag = make_etag('stocks', snapshot.changed_version(stocks), tuple(stocks), portfolio_value, portfolio_pl)
+        
+        def build():
+            stocks_data = snapshot.get_quotes(stocks)
+            market_caps, = quote_columns(stocks_data, 'market_cap')
+            total_market_cap = float(np.nansum(market_caps))
+            sector_distribution = {}
+            for stock in stocks_data:
+                sector_distribution[stock.sector] = sector_distribution.get(stock.sector, 0) + 1
+            
+            return {
+                'data': stocks_data,
+                'timestamp': snapshot.formatted_timestamp() or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'snapshot': {
+                    'version': snapshot.version,
+                    'timestamp': snapshot.timestamp
+                },
+                'metrics': {
+                    'total_stocks': len(stocks_data),
+                    'total_market_cap': total_market_cap,
+                    'sector_distribution': sector_distribution,
+                    'portfolio_value': portfolio_value,
+                    'portfolio_pl': portfolio_pl
+                }
             }
-        })
+        
+        return conditional_json(etag, build)
     except Exception as e:
         return jsonify({
             'data': [],
@@ -81,6 +348,66 @@ def get_stocks():
             'message': 'Error fetching stock data'
         }), 500
 
+def format_quote_event(version, timestamp, quotes, full=False):
+    """Format a Server-Sent Event carrying quotes for a snapshot version"""
+    payload = app.json.dumps({
+        'version': version,
+        'timestamp': datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S') if timestamp else None,
+        'full': full,
+        'data': quotes
+    })
+    return f"id: {version}\nevent: quotes\ndata: {payload}\n\n"
+
+@app.route('/api/stream/stocks')
+def stream_stocks():
+    """Server-Sent Events stream pushing watchlist quotes as they change"""
+    user_id = initialize_session()
+    try:
+        stocks = requested_stocks(user_id)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    track_session_symbols(user_id)
+    snapshot = market_poller.get_snapshot(stocks)
+    symbols = set(normalize_symbol(s) for s in stocks)
+    last_event_id = request.headers.get('Last-Event-ID', '')
+
+    def generate():
+        yield "retry: 5000\n\n"
+
+        # Resume from the client's last seen version when the change log still covers it
+        resumed = market_poller.changes_since(int(last_event_id), symbols) if last_event_id.isdigit() else None
+        if resumed is not None:
+            version, quotes = resumed
+            if quotes:
+                yield format_quote_event(version, market_poller.snapshot.timestamp, quotes)
+        else:
+            version = snapshot.version
+            yield format_quote_event(version, snapshot.timestamp, snapshot.get_quotes(symbols), full=True)
+
+        while True:
+            if not market_poller.wait_for_update(version, STREAM_HEARTBEAT_SECONDS):
+                yield ": keep-alive\n\n"
+                continue
+
+            market_poller.track(symbols)
+            changes = market_poller.changes_since(version, symbols)
+            if changes is None:
+                # Fell behind the change log, resend everything
+                current = market_poller.snapshot
+                version = current.version
+                yield format_quote_event(version, current.timestamp, current.get_quotes(symbols), full=True)
+                continue
+
+            version, quotes = changes
+            if quotes:
+                yield format_quote_event(version, market_poller.snapshot.timestamp, quotes)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/add_stock', methods=['POST'])
 def add_stock():
     """Add a stock to the watchlist"""
@@ -91,17 +418,17 @@ def add_stock():
     if not (stock.endswith('.NS') or stock.endswith('.BO')):
         stock = f"{stock}.NS"
     
-    current_stocks = session.get('stocks', DEFAULT_STOCKS.copy())
+    user_id = initialize_session()
+    current_stocks = ledger.get_watchlist(user_id)
     if stock in current_stocks:
         return jsonify({'status': 'error', 'message': 'Stock already in watchlist'}), 400
     
     stock_data = get_stock_data(stock)
-    if not stock_data or stock_data.get('price') == 'Error':
+    if not stock_data or stock_data.price is None:
         return jsonify({'status': 'error', 'message': 'Invalid stock symbol'}), 400
     
-    current_stocks.append(stock)
-    session['stocks'] = current_stocks
-    session.modified = True
+    ledger.add_to_watchlist(user_id, stock)
+    market_poller.track([stock])
     return jsonify({'status': 'success', 'message': f'Added {stock} to watchlist'})
 
 @app.route('/buy_stock', methods=['POST'])
@@ -111,7 +438,6 @@ def buy_stock():
     quantity = request.form.get('quantity', type=int)
     buy_price = request.form.get('buy_price', type=float)  # Optional manual price entry
     transaction_date = request.form.get('transaction_date')  # Format: YYYY-MM-DD
-    transaction_type = request.form.get('transaction_type', 'buy').lower()  # 'buy' or 'average'
     notes = request.form.get('notes', '')  # Any additional notes about the transaction
     
     if not stock or not quantity or quantity <= 0:
@@ -122,11 +448,11 @@ def buy_stock():
     
     # Get current stock data
     stock_data = get_stock_data(stock)
-    if not stock_data or stock_data.get('price') == 'Error':
+    if not stock_data or stock_data.price is None:
         return jsonify({'status': 'error', 'message': 'Invalid stock symbol'}), 400
     
     # Use provided price or current market price
-    actual_buy_price = buy_price if buy_price else stock_data['price']
+    actual_buy_price = buy_price if buy_price else stock_data.price
     
     # Format transaction date or use current date
     try:
@@ -137,51 +463,55 @@ def buy_stock():
     except ValueError:
         return jsonify({'status': 'error', 'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
     
-    # Get portfolio and check if stock already exists
-    portfolio = session.get('portfolio', [])
-    existing_position = next((p for p in portfolio if p['symbol'] == stock), None)
+    user_id = initialize_session()
     
     # Calculate transaction costs (example: 0.5% of transaction value)
     transaction_cost = round(actual_buy_price * quantity * 0.005, 2)
     total_cost = round(actual_buy_price * quantity + transaction_cost, 2)
     
-    if existing_position and transaction_type == 'average':
-        # Average down/up calculation
-        total_shares = existing_position['quantity'] + quantity
-        total_investment = (existing_position['quantity'] * existing_position['buy_price']) + (quantity * actual_buy_price)
-        new_average_price = round(total_investment / total_shares, 2)
-        
-        # Update existing position
-        existing_position['quantity'] = total_shares
-        existing_position['buy_price'] = new_average_price
-        existing_position['current_price'] = stock_data['price']
-        existing_position['last_transaction_date'] = formatted_date
-        
-        # Append to transaction history if not present
-        if 'transaction_history' not in existing_position:
-            existing_position['transaction_history'] = []
-        
-        existing_position['transaction_history'].append({
-            'date': formatted_date,
-            'type': 'buy',
-            'quantity': quantity,
-            'price': actual_buy_price,
-            'transaction_cost': transaction_cost,
-            'notes': notes
-        })
+    def buy(existing_position):
+        if existing_position:
+            # Buying more of a holding (transaction_type 'buy' or 'average') adds a FIFO lot
+            # for tax purposes, in buy-date order; the position keeps the running average
+            add_lot(existing_position, formatted_date, quantity, actual_buy_price)
+            
+            # Average down/up calculation
+            total_shares = existing_position['quantity'] + quantity
+            total_investment = (existing_position['quantity'] * existing_position['buy_price']) + (quantity * actual_buy_price)
+            new_average_price = round(total_investment / total_shares, 2)
+            
+            # Update existing position
+            existing_position['quantity'] = total_shares
+            existing_position['buy_price'] = new_average_price
+            existing_position['current_price'] = stock_data.price
+            existing_position['last_transaction_date'] = formatted_date
+            
+            # Append to transaction history if not present
+            if 'transaction_history' not in existing_position:
+                existing_position['transaction_history'] = []
+            
+            existing_position['transaction_history'].append({
+                'date': formatted_date,
+                'type': 'buy',
+                'quantity': quantity,
+                'price': actual_buy_price,
+                'transaction_cost': transaction_cost,
+                'notes': notes
+            })
+            
+            message = f'Added {quantity} more shares of {stock} at ₹{actual_buy_price}. New average: ₹{new_average_price}'
+            return existing_position, [], message
         
-        message = f'Added {quantity} more shares of {stock} at ₹{actual_buy_price}. New average: ₹{new_average_price}'
-    else:
         # New position
         new_position = {
             'symbol': stock,
-            'company_name': stock_data.get('name', stock),
+            'company_name': stock_data.name,
             'quantity': quantity,
             'buy_price': actual_buy_price,
-            'current_price': stock_data['price'],
+            'current_price': stock_data.price,
             'purchase_date': formatted_date,
             'last_transaction_date': formatted_date,
-            'sector': stock_data.get('sector', 'Unknown'),
+            'sector': stock_data.sector,
             'transaction_cost': transaction_cost,
             'total_cost': total_cost,
             'notes': notes,
@@ -192,13 +522,15 @@ def buy_stock():
                 'price': actual_buy_price,
                 'transaction_cost': transaction_cost,
                 'notes': notes
-            }]
+            }],
+            'lots': [{'date': formatted_date, 'quantity': quantity, 'price': actual_buy_price}]
         }
-        portfolio.append(new_position)
-        message = f'Bought {quantity} shares of {stock} at ₹{actual_buy_price}'
+        return new_position, [], f'Bought {quantity} shares of {stock} at ₹{actual_buy_price}'
+    
+    # The existing holding is read and updated under one write lock
+    message = ledger.update_position(user_id, stock, buy)
     
-    session['portfolio'] = portfolio
-    session.modified = True
+    market_poller.track([stock])
     
     return jsonify({
         'status': 'success', 
@@ -220,82 +552,267 @@ def remove_stock():
     if not stock:
         return jsonify({'status': 'error', 'message': 'No stock symbol provided'}), 400
     
-    current_stocks = session.get('stocks', DEFAULT_STOCKS.copy())
-    if stock in current_stocks:
-        current_stocks.remove(stock)
-        session['stocks'] = current_stocks
-        session.modified = True
+    user_id = initialize_session()
+    if ledger.remove_from_watchlist(user_id, stock):
         return jsonify({'status': 'success', 'message': f'Removed {stock} from watchlist'})
     return jsonify({'status': 'error', 'message': 'Stock not in watchlist'}), 400
 
 @app.route('/reset_watchlist', methods=['POST'])
 def reset_watchlist():
     """Reset the watchlist to default stocks"""
-    session['stocks'] = DEFAULT_STOCKS.copy()
-    session.modified = True
+    user_id = initialize_session()
+    ledger.set_watchlist(user_id, DEFAULT_STOCKS)
     return jsonify({'status': 'success', 'message': 'Watchlist reset to defaults'})
 
+# Response keys for the OHLCV columns returned by history_frame
+HISTORY_FIELDS = {
+    'date': 'Date',
+    'open': 'Open',
+    'high': 'High',
+    'low': 'Low',
+    'close': 'Close',
+    'volume': 'Volume'
+}
+
+def history_to_columns(history):
+    """Convert a history DataFrame into a dict of plain Python lists, one per field"""
+    return {key: history[column].tolist() for key, column in HISTORY_FIELDS.items()}
+
+def history_to_records(history):
+    """Convert a history DataFrame into a list of row dicts without iterating rows in pandas"""
+    columns = history_to_columns(history)
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+def history_interval(period):
+    """
+    Read the bar interval of a history request
+
+    Defaults to the resolution PERIOD_INTERVALS gives the period (intraday
+    bars for short periods, daily bars otherwise).
+
+    Raises:
+    ValueError: If the interval is not one of BAR_PYRAMID
+    """
+    interval = request.args.get('interval') or PERIOD_INTERVALS.get(period, '1d')
+    if interval not in BAR_PYRAMID:
+        raise ValueError(f"'interval' must be one of {', '.join(BAR_PYRAMID)}")
+    return interval
+
 @app.route('/api/stock_history/<symbol>')
 def stock_history_api(symbol):
-    """API endpoint to get historical stock data"""
+    """API endpoint to get historical stock data
+
+    Pass format=columnar to get {"date": [...], "close": [...], ...}
+    instead of a list of row objects, and interval=1m/5m/15m/1h/1d to pick
+    the bar size. Every interval is stored precomputed, so any zoom level
+    is a range read of its own resolution.
+    """
     period = request.args.get('period', '1y')
+    history_format = 'columnar' if request.args.get('format') == 'columnar' else 'records'
+    try:
+        interval = history_interval(period)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
     try:
-        history = get_stock_history(symbol, period)
-        history = history.sort_index(ascending=False)
-        history_data = [
-            {
-                'date': row['Date'],
-                'open': row['Open'],
-                'high': row['High'],
-                'low': row['Low'],
-                'close': row['Close'],
-                'volume': row['Volume']
+        stored_symbol = normalize_symbol(symbol)
+        start_time, end_time = history_window(period, interval)
+        try:
+            sync_stock_history(stored_symbol, start_time, end_time, interval)
+        except Exception as e:
+            # Serve what is stored, as get_stock_history would
+            print(f"Error fetching historical data for {stored_symbol}: {e}")
+        
+        # The stored bars only change when a sync appends to them or the window
+        # start crosses into another day
+        coverage = history_store.get_coverage(stored_symbol, interval) or {}
+        etag = make_etag('history', stored_symbol, period, interval, history_format, start_time // 86400,
+                         coverage.get('last_ts'), coverage.get('synced_at'))
+        
+        def build():
+            history = history_frame(stored_symbol, start_time, end_time, interval).sort_index(ascending=False)
+            if history_format == 'columnar':
+                history_data = history_to_columns(history)
+            else:
+                history_data = history_to_records(history)
+            return {
+                'symbol': symbol,
+                'period': period,
+                'interval': interval,
+                'format': history_format,
+                'data': history_data
             }
-            for index, row in history.iterrows()
-        ]
+        
+        return conditional_json(etag, build)
+    except Exception as e:
         return jsonify({
             'symbol': symbol,
             'period': period,
-            'data': history_data
-        })
+            'data': [],
+            'message': f'Error fetching history: {str(e)}'
+        }), 500
+
+def indicator_request_options():
+    """
+    Read the period, interval, parameters and row limit shared by the indicator routes
+
+    Returns:
+    tuple: (period, interval, IndicatorParams, last row count or None)
+
+    Raises:
+    ValueError: If a parameter is malformed
+    """
+    period = request.args.get('period', '1y')
+    interval = history_interval(period)
+    params = parse_indicator_params(request.args)
+    last = request.args.get('last')
+    if last is not None:
+        try:
+            last = int(last)
+        except ValueError:
+            raise ValueError("'last' must be a whole number")
+        if last < 1:
+            raise ValueError("'last' must be at least 1")
+    return period, interval, params, last
+
+@app.route('/api/indicators/<symbol>')
+def indicators_api(symbol):
+    """API endpoint to get technical indicators computed over the stock history
+
+    Returns columns of SMA, EMA, RSI, MACD, Bollinger bands, ATR and VWAP
+    aligned with the dates of the period, on the same bar interval as
+    /api/stock_history. Windows can be set with sma=20,50, ema=20, rsi=14,
+    macd=12,26,9, bb=20,2 and atr=14; last=N returns only the latest N bars.
+    """
+    try:
+        period, interval, params, last = indicator_request_options()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    try:
+        stored_symbol = normalize_symbol(symbol)
+        start_time, end_time = history_window(period, interval)
+        try:
+            sync_stock_history(stored_symbol, start_time, end_time, interval)
+        except Exception as e:
+            print(f"Error fetching historical data for {stored_symbol}: {e}")
+        
+        coverage = history_store.get_coverage(stored_symbol, interval) or {}
+        etag = make_etag('indicators', stored_symbol, period, interval, params, last, start_time // 86400,
+                         coverage.get('last_ts'), coverage.get('synced_at'))
+        
+        def build():
+            series = indicator_cache.get(stored_symbol, start_time, period, params, interval)
+            return {
+                'symbol': symbol,
+                'period': period,
+                'interval': interval,
+                'params': params._asdict(),
+                'data': series.window(start_time, last) if series is not None else {}
+            }
+        
+        return conditional_json(etag, build)
     except Exception as e:
         return jsonify({
             'symbol': symbol,
             'period': period,
-            'data': [],
-            'message': f'Error fetching history: {str(e)}'
+            'data': {},
+            'message': f'Error computing indicators: {str(e)}'
         }), 500
 
+@app.route('/api/indicators')
+async def indicators_batch_api():
+    """API endpoint to get technical indicators for many symbols in one call
+
+    Takes symbols=A,B,C (up to INDICATOR_BATCH_MAX) and the same options as
+    /api/indicators/<symbol>. Histories are synced concurrently; symbols
+    without any stored bars are listed under 'missing'.
+    """
+    symbols = [s.strip() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    if not symbols:
+        return jsonify({'status': 'error', 'message': 'No stock symbols provided'}), 400
+    if len(symbols) > INDICATOR_BATCH_MAX:
+        return jsonify({'status': 'error', 'message': f'At most {INDICATOR_BATCH_MAX} symbols per request'}), 400
+    try:
+        period, interval, params, last = indicator_request_options()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    stored_symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols))
+    start_time, end_time = history_window(period, interval)
+
+    async def sync(stored_symbol):
+        try:
+            await sync_stock_history_async(stored_symbol, start_time, end_time, interval)
+        except Exception as e:
+            print(f"Error fetching historical data for {stored_symbol}: {e}")
+
+    async with async_transport.scope():
+        await gather_limited([sync(stored_symbol) for stored_symbol in stored_symbols])
+
+    # Coverage reads and the indicator maths touch SQLite and the CPU; keep them off the event loop
+    def versions():
+        coverages = [history_store.get_coverage(stored_symbol, interval) or {} for stored_symbol in stored_symbols]
+        return tuple((c.get('last_ts'), c.get('synced_at')) for c in coverages)
+
+    etag = make_etag('indicators', tuple(stored_symbols), period, interval, params, last, start_time // 86400,
+                     await asyncio.to_thread(versions))
+    series = {}
+    if not etag_matches(request.headers.get('If-None-Match'), etag):
+        series = await asyncio.to_thread(indicator_cache.get_many, stored_symbols, start_time, period, params,
+                                         interval)
+
+    def build():
+        return {
+            'period': period,
+            'interval': interval,
+            'params': params._asdict(),
+            'data': {stored_symbol: series[stored_symbol].window(start_time, last)
+                     for stored_symbol in stored_symbols if stored_symbol in series},
+            'missing': [stored_symbol for stored_symbol in stored_symbols if stored_symbol not in series]
+        }
+
+    return conditional_json(etag, build)
+
 @app.route('/api/mutualfunds')
-def get_mutual_funds():
+async def get_mutual_funds():
     """API endpoint to get mutual fund data"""
     try:
-        mutual_fund_info = find_and_test_mutual_funds()
-        working_symbols = mutual_fund_info.get('working_symbols', [])
+        # Symbol discovery runs in the background; the request only reads NAVs
+        fund_registry.ensure_started()
+        registry_status = fund_registry.status()
+        working_symbols = fund_registry.working_symbols()
         
         if not working_symbols:
+            message = 'Mutual fund list is being refreshed, please try again shortly' if fund_registry.is_stale() else 'No valid mutual fund symbols found'
             return jsonify({
                 'data': [],
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 'metrics': {'total_funds': 0},
-                'message': 'No valid mutual fund symbols found'
+                'registry': registry_status,
+                'message': message
             }), 200
         
-        funds_data = get_mutual_funds_data(working_symbols)
+        funds_data = await fund_registry.get_funds_data_async()
+        nav_version = fund_registry.nav_version()
         if not funds_data:
             return jsonify({
                 'data': [],
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 'metrics': {'total_funds': 0},
+                'registry': registry_status,
                 'message': 'Failed to fetch mutual fund data from source'
             }), 200
         
-        return jsonify({
+        etag = make_etag('funds', nav_version, registry_status['total_symbols'], registry_status['last_revalidated'])
+        return conditional_json(etag, lambda: {
             'data': funds_data,
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'metrics': {
                 'total_funds': len(funds_data)
-            }
+            },
+            'registry': registry_status
         })
     except Exception as e:
         print(f"Error in /api/mutualfunds: {str(e)}")
@@ -316,7 +833,9 @@ def get_ipos():
     """API endpoint to get upcoming IPO data"""
     try:
         ipos_data = get_upcoming_ipos()
-        return jsonify({
+        # IPO listings carry no version, so the validator is a hash of the listing itself
+        etag = make_etag('ipos', app.json.dumps(ipos_data))
+        return conditional_json(etag, lambda: {
             'data': ipos_data,
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'metrics': {
@@ -332,95 +851,81 @@ def get_ipos():
         }), 500
 
 @app.route('/portfolio')
-def portfolio_page():
+async def portfolio_page():
     """Render portfolio overview page"""
-    initialize_session()
-    portfolio = session.get('portfolio', [])
-    stocks_data = get_stocks_data([p['symbol'] for p in portfolio])
+    user_id = initialize_session()
+    portfolio = ledger.get_portfolio(user_id)
+    stocks_data = await get_stocks_data_async([p['symbol'] for p in portfolio])
     for p in portfolio:
-        stock = next((s for s in stocks_data if s['symbol'] == p['symbol']), None)
-        if stock:
-            p['current_price'] = stock['price']
+        stock = next((s for s in stocks_data if s.symbol == p['symbol']), None)
+        if stock and stock.price is not None:
+            p['current_price'] = stock.price
     return render_template('portfolio.html', portfolio=portfolio)
 
 @app.route('/tax_calculator')
-def tax_calculator_page():
+async def tax_calculator_page():
     """Render tax calculator page"""
-    initialize_session()
-    portfolio = session.get('portfolio', [])
-    sold_stocks = session.get('sold_stocks', [])  # Include sold stocks
-    stocks_data = get_stocks_data([p['symbol'] for p in portfolio])
+    user_id = initialize_session()
+    portfolio = ledger.get_portfolio(user_id)
+    sold_stocks = ledger.get_sold_stocks(user_id)  # Include sold stocks
+    stocks_data = await get_stocks_data_async([p['symbol'] for p in portfolio])
     for p in portfolio:
-        stock = next((s for s in stocks_data if s['symbol'] == p['symbol']), None)
-        if stock:
-            p['current_price'] = stock['price']
+        stock = next((s for s in stocks_data if s.symbol == p['symbol']), None)
+        if stock and stock.price is not None:
+            p['current_price'] = stock.price
     return render_template('tax_calculator.html', portfolio=portfolio, sold_stocks=sold_stocks)
 
 @app.route('/money_management')
-def money_management_page():
+async def money_management_page():
     """Render money management page"""
-    initialize_session()
-    portfolio = session.get('portfolio', [])
-    stocks_data = get_stocks_data([p['symbol'] for p in portfolio])
+    user_id = initialize_session()
+    portfolio = ledger.get_portfolio(user_id)
+    stocks_data = await get_stocks_data_async([p['symbol'] for p in portfolio])
     for p in portfolio:
-        stock = next((s for s in stocks_data if s['symbol'] == p['symbol']), None)
-        if stock:
-            p['current_price'] = stock['price']
+        stock = next((s for s in stocks_data if s.symbol == p['symbol']), None)
+        if stock and stock.price is not None:
+            p['current_price'] = stock.price
     return render_template('money_management.html', portfolio=portfolio)
 
 @app.route('/sell_stock', methods=['POST'])
-def sell_stock():
+async def sell_stock():
     """Sell a stock from the portfolio"""
     symbol = request.form.get('symbol').upper()
     quantity = int(request.form.get('quantity', 1))
     trigger_price = float(request.form.get('trigger_price', 0))
-    initialize_session()
-    portfolio = session.get('portfolio', [])
-    stock = next((p for p in portfolio if p['symbol'] == symbol), None)
+    user_id = initialize_session()
+    stock = ledger.get_position(user_id, symbol)
     
     if not stock or stock['quantity'] < quantity:
         return jsonify({'status': 'error', 'message': 'Invalid stock or quantity'})
     
-    stocks_data = get_stocks_data([symbol])
-    current_price = stocks_data[0]['price'] if stocks_data else stock['current_price']
+    stocks_data = await get_stocks_data_async([symbol])
+    current_price = stocks_data[0].price if stocks_data and stocks_data[0].price is not None else stock['current_price']
     
     if trigger_price > 0 and current_price < trigger_price:
         return jsonify({'status': 'pending', 'message': f'Sell order for {symbol} set at ₹{trigger_price}'})
     
     sell_price = current_price if trigger_price == 0 or current_price >= trigger_price else trigger_price
-    sold_value = quantity * sell_price
-    pl = (sell_price - stock['buy_price']) * quantity
+    sell_date = datetime.now().strftime('%Y-%m-%d')
     
-    # Record sold stock
-    session['sold_stocks'].append({
-        'symbol': symbol,
-        'company_name': stock.get('company_name', symbol),
-        'quantity': quantity,
-        'buy_price': stock['buy_price'],
-        'sell_price': sell_price,
-        'sell_date': datetime.now().strftime('%Y-%m-%d'),
-        'buy_date': stock.get('purchase_date', 'Unknown'),
-        'holding_period': calculate_holding_period(stock.get('purchase_date')),
-        'profit_loss': pl,
-        'tax_category': 'short_term' if calculate_holding_period(stock.get('purchase_date')) < 365 else 'long_term'
-    })
+    def sell(position):
+        # Checked again under the write lock: another sale may have landed while the price was fetched
+        if not position or position['quantity'] < quantity:
+            return None, [], False
+        # Consume the oldest lots first; each lot becomes its own sold record with
+        # its own holding period and tax category
+        return position, sell_fifo(position, quantity, sell_price, sell_date), True
     
-    # Update portfolio
-    if stock['quantity'] == quantity:
-        portfolio.remove(stock)
-    else:
-        stock['quantity'] -= quantity
-    session['portfolio'] = portfolio
-    session['sold_stocks'] = session.get('sold_stocks', [])
-    session.modified = True
+    if not ledger.update_position(user_id, symbol, sell):
+        return jsonify({'status': 'error', 'message': 'Invalid stock or quantity'})
     return jsonify({'status': 'success', 'message': f'Sold {quantity} shares of {symbol} at ₹{sell_price}'})
 
 # NEW FEATURE: Portfolio diversification analysis
 @app.route('/api/portfolio/diversification')
-def portfolio_diversification():
+async def portfolio_diversification():
     """Get portfolio diversification metrics"""
-    initialize_session()
-    portfolio = session.get('portfolio', [])
+    user_id = initialize_session()
+    portfolio = ledger.get_portfolio(user_id)
     
     if not portfolio:
         return jsonify({
@@ -429,11 +934,11 @@ def portfolio_diversification():
         }), 400
     
     # Get current stock prices
-    stocks_data = get_stocks_data([p['symbol'] for p in portfolio])
+    stocks_data = await get_stocks_data_async([p['symbol'] for p in portfolio])
     for p in portfolio:
-        stock = next((s for s in stocks_data if s['symbol'] == p['symbol']), None)
-        if stock:
-            p['current_price'] = stock['price']
+        stock = next((s for s in stocks_data if s.symbol == p['symbol']), None)
+        if stock and stock.price is not None:
+            p['current_price'] = stock.price
     
     # Calculate total portfolio value
     total_value = sum(p['quantity'] * p['current_price'] for p in portfolio)
@@ -496,10 +1001,11 @@ def portfolio_diversification():
 @app.route('/api/tax/calculate')
 def calculate_taxes():
     """Calculate capital gains taxes based on portfolio and sold stocks"""
-    initialize_session()
-    sold_stocks = session.get('sold_stocks', [])
+    user_id = initialize_session()
+    year = request.args.get('financial_year') or get_current_financial_year()
+    totals = ledger.get_tax_totals(user_id, year)
     
-    if not sold_stocks:
+    if not totals['sales']:
         return jsonify({
             'status': 'success',
             'message': 'No sold stocks to calculate taxes',
@@ -514,20 +1020,17 @@ def calculate_taxes():
                     'taxable_gain': 0,
                     'tax_amount': 0
                 },
-                'total_tax': 0
+                'total_tax': 0,
+                'financial_year': year
             }
         })
     
-    # Group by tax category
-    short_term_gains = [s for s in sold_stocks if s.get('tax_category') == 'short_term']
-    long_term_gains = [s for s in sold_stocks if s.get('tax_category') == 'long_term']
-    
     # Calculate short-term gains (taxed at 15%)
-    short_term_total = sum(s['profit_loss'] for s in short_term_gains)
+    short_term_total = totals['short_term_gain']
     short_term_tax = max(0, short_term_total * TAX_RATES['short_term'])
     
     # Calculate long-term gains (10% above 1 lakh exemption)
-    long_term_total = sum(s['profit_loss'] for s in long_term_gains)
+    long_term_total = totals['long_term_gain']
     # In India, exemption of ₹1,00,000 for long term capital gains
     exemption = 100000 
     long_term_taxable = max(0, long_term_total - exemption)
@@ -550,21 +1053,24 @@ def calculate_taxes():
             'tax_amount': long_term_tax
         },
         'total_tax': total_tax,
-        'financial_year': get_current_financial_year()
+        'financial_year': year
     }
     
-    return jsonify({
+    response = {
         'status': 'success',
-        'tax_data': tax_data,
-        'sold_stocks': sold_stocks
-    })
+        'tax_data': tax_data
+    }
+    # The individual sales are only read when asked for
+    if request.args.get('include_sales', '').lower() in ('1', 'true', 'yes'):
+        response['sold_stocks'] = ledger.get_sold_stocks(user_id, year)
+    return jsonify(response)
 
 # NEW FEATURE: Portfolio historical performance chart
 @app.route('/api/portfolio/history')
-def portfolio_history():
+async def portfolio_history():
     """Get historical performance data for the portfolio"""
-    initialize_session()
-    portfolio = session.get('portfolio', [])
+    user_id = initialize_session()
+    portfolio = ledger.get_portfolio(user_id)
     
     if not portfolio:
         return jsonify({
@@ -572,62 +1078,11 @@ def portfolio_history():
             'message': 'Portfolio is empty'
         }), 400
     
-    # Get historical data for each stock
-    combined_history = {}
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=365)  # Default to 1 year
-    
-    for stock in portfolio:
-        symbol = stock['symbol']
-        quantity = stock['quantity']
-        purchase_date = stock.get('purchase_date')
-        
-        try:
-            # Get historical data since purchase or last year
-            history = get_stock_history(symbol, '1y')
-            
-            for _, row in history.iterrows():
-                date = row['Date']
-                if date not in combined_history:
-                    combined_history[date] = {'date': date, 'value': 0}
-                combined_history[date]['value'] += row['Close'] * quantity
-        except Exception as e:
-            print(f"Error getting history for {symbol}: {e}")
-    
-    # Convert to list and sort by date
-    history_list = list(combined_history.values())
-    history_list.sort(key=lambda x: x['date'])
-    
-    # Calculate performance metrics
-    if history_list:
-        current_value = history_list[-1]['value'] if history_list else 0
-        initial_value = history_list[0]['value'] if history_list else 0
-        value_change = current_value - initial_value
-        percent_change = (value_change / initial_value * 100) if initial_value > 0 else 0
-        
-        # Calculate max drawdown
-        max_drawdown = 0
-        max_value = initial_value
-        for item in history_list:
-            max_value = max(max_value, item['value'])
-            drawdown = (max_value - item['value']) / max_value if max_value > 0 else 0
-            max_drawdown = max(max_drawdown, drawdown)
-        
-        metrics = {
-            'current_value': current_value,
-            'initial_value': initial_value,
-            'value_change': value_change,
-            'percent_change': percent_change,
-            'max_drawdown': max_drawdown * 100
-        }
-    else:
-        metrics = {
-            'current_value': 0,
-            'initial_value': 0,
-            'value_change': 0,
-            'percent_change': 0,
-            'max_drawdown': 0
-        }
+    # Aligned date x symbol price matrix; histories are fetched concurrently on the event loop
+    histories = await get_histories_async([normalize_symbol(p['symbol']) for p in portfolio], '1y')
+    result = compute_portfolio_history(portfolio, '1y', histories)
+    history_list = result['history']
+    metrics = result['metrics']
     
     return jsonify({
         'status': 'success',
@@ -639,8 +1094,16 @@ def portfolio_history():
 @app.route('/api/alerts')
 def get_alerts():
     """Get all price alerts"""
-    initialize_session()
-    alerts = session.get('alerts', [])
+    user_id = initialize_session()
+    alerts = ledger.get_alerts(user_id)
+    
+    # Show the latest known price without writing it back; error quotes carry
+    # no price, so the stored one is kept
+    quotes = market_poller.snapshot.quotes
+    for alert in alerts:
+        quote = quotes.get(alert['symbol'])
+        if not alert.get('triggered') and quote is not None and not quote.error and quote.price is not None:
+            alert['current_price'] = quote.price
     
     return jsonify({
         'status': 'success',
@@ -662,10 +1125,10 @@ def add_alert():
     
     # Get current price
     stock_data = get_stock_data(symbol)
-    if not stock_data or stock_data.get('price') == 'Error':
+    if not stock_data or stock_data.price is None:
         return jsonify({'status': 'error', 'message': 'Invalid stock symbol'}), 400
     
-    current_price = stock_data['price']
+    current_price = stock_data.price
     
     # Validate alert price based on type
     if alert_type == 'above' and price <= current_price:
@@ -674,12 +1137,12 @@ def add_alert():
         return jsonify({'status': 'error', 'message': 'Alert price must be below current price'}), 400
     
     # Create alert
-    alerts = session.get('alerts', [])
+    user_id = initialize_session()
     
     new_alert = {
         'id': str(datetime.now().timestamp()),
         'symbol': symbol,
-        'name': stock_data.get('name', symbol),
+        'name': stock_data.name,
         'price': price,
         'current_price': current_price,
         'type': alert_type,
@@ -687,9 +1150,9 @@ def add_alert():
         'triggered': False
     }
     
-    alerts.append(new_alert)
-    session['alerts'] = alerts
-    session.modified = True
+    ledger.save_alert(user_id, new_alert)
+    alert_book.add(user_id, dict(new_alert))
+    market_poller.track([symbol])
     
     return jsonify({
         'status': 'success',
@@ -705,15 +1168,10 @@ def delete_alert():
     if not alert_id:
         return jsonify({'status': 'error', 'message': 'No alert ID provided'}), 400
     
-    alerts = session.get('alerts', [])
-    original_length = len(alerts)
-    alerts = [a for a in alerts if a.get('id') != alert_id]
-    
-    if len(alerts) == original_length:
+    user_id = initialize_session()
+    if not ledger.delete_alert(user_id, alert_id):
         return jsonify({'status': 'error', 'message': 'Alert not found'}), 404
-    
-    session['alerts'] = alerts
-    session.modified = True
+    alert_book.remove(user_id, alert_id)
     
     return jsonify({
         'status': 'success',
@@ -723,8 +1181,8 @@ def delete_alert():
 @app.route('/check_alerts')
 def check_alerts():
     """Check all alerts against current prices"""
-    initialize_session()
-    alerts = session.get('alerts', [])
+    user_id = initialize_session()
+    alerts = ledger.get_alerts(user_id)
     
     if not alerts:
         return jsonify({
@@ -733,39 +1191,17 @@ def check_alerts():
             'triggered': []
         })
     
-    # Get current prices for all alert symbols
-    symbols = list(set(a['symbol'] for a in alerts))
-    stocks_data = get_stocks_data(symbols)
-    
-    # Check each alert
-    triggered_alerts = []
-    updated_alerts = []
-    
-    for alert in alerts:
-        symbol = alert['symbol']
-        stock = next((s for s in stocks_data if s['symbol'] == symbol), None)
-        
-        if not stock:
-            updated_alerts.append(alert)
-            continue
-        
-        current_price = stock['price']
-        
-        # Update current price in alert
-        alert['current_price'] = current_price
-        
-        # Check if alert is triggered
-        if (alert['type'] == 'above' and current_price >= alert['price']) or \
-           (alert['type'] == 'below' and current_price <= alert['price']):
-            alert['triggered'] = True
-            alert['triggered_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            triggered_alerts.append(alert)
-        
-        updated_alerts.append(alert)
-    
-    # Update alerts in session
-    session['alerts'] = updated_alerts
-    session.modified = True
+    # Alerts are evaluated against the global alert book as the poller publishes
+    # quotes. Alerts created through another worker are indexed here too, their
+    # symbols are put in the snapshot, and whatever fired in any worker is
+    # collected from the ledger
+    pending = [a for a in alerts if not a.get('triggered')]
+    for alert in pending:
+        alert_book.add(user_id, alert)
+    symbols = list(set(a['symbol'] for a in pending))
+    if symbols:
+        alert_book.on_quotes(market_poller.get_snapshot(symbols).get_quotes(symbols))
+    triggered_alerts = ledger.take_triggered_alerts(user_id)
     
     return jsonify({
         'status': 'success',
@@ -789,19 +1225,15 @@ def calculate_holding_period(purchase_date_str):
 # Helper function for getting current financial year
 def get_current_financial_year():
     """Get current financial year in India format (YYYY-YY)"""
-    today = datetime.now()
-    if today.month < 4:  # Financial year in India runs from April to March
-        return f"{today.year-1}-{str(today.year)[2:]}"
-    else:
-        return f"{today.year}-{str(today.year+1)[2:]}"
+    return financial_year(datetime.now())
 
 # NEW FEATURE: Dividend Tracking
 @app.route('/api/dividends')
-def get_dividends():
+async def get_dividends():
     """Get dividend information for portfolio stocks"""
-    initialize_session()
-    portfolio = session.get('portfolio', [])
-    dividends = session.get('dividends', [])
+    user_id = initialize_session()
+    portfolio = ledger.get_portfolio(user_id)
+    dividends = ledger.get_dividends(user_id)
     
     if not portfolio:
         return jsonify({
@@ -810,66 +1242,39 @@ def get_dividends():
             'dividends': dividends
         })
     
-    # Get symbols from portfolio
-    symbols = [stock['symbol'] for stock in portfolio]
-    
-    # Attempt to get dividend data for each stock
-    for symbol in symbols:
-        try:
-            # Skip if we already have recent dividend data for this stock
-            existing = next((d for d in dividends if d['symbol'] == symbol), None)
-            if existing and (datetime.now() - datetime.strptime(existing['updated_at'], '%Y-%m-%d')).days < 30:
-                continue
-                
-            dividend_data = get_stock_dividends(symbol)
-            if dividend_data and not dividend_data.empty:
-                # Filter last 12 months of dividends
-                one_year_ago = datetime.now() - timedelta(days=365)
-                recent_dividends = dividend_data[dividend_data.index >= one_year_ago]
-                
-                if not recent_dividends.empty:
-                    # Calculate annual dividend yield and amount
-                    stock_data = get_stock_data(symbol)
-                    current_price = stock_data['price']
-                    annual_dividend_amount = recent_dividends['Dividends'].sum()
-                    dividend_yield = (annual_dividend_amount / current_price) * 100 if current_price > 0 else 0
-                    
-                    # Find portfolio quantity
-                    stock_position = next((s for s in portfolio if s['symbol'] == symbol), None)
-                    quantity = stock_position['quantity'] if stock_position else 0
-                    dividend_income = annual_dividend_amount * quantity
-                    
-                    # Create or update dividend entry
-                    if existing:
-                        existing.update({
-                            'annual_dividend': annual_dividend_amount,
-                            'dividend_yield': dividend_yield,
-                            'projected_income': dividend_income,
-                            'last_dividend_date': recent_dividends.index.max().strftime('%Y-%m-%d') if not recent_dividends.empty else None,
-                            'last_dividend_amount': recent_dividends['Dividends'].iloc[-1] if not recent_dividends.empty else 0,
-                            'dividend_frequency': estimate_dividend_frequency(recent_dividends),
-                            'history': recent_dividends.reset_index().to_dict('records'),
-                            'updated_at': datetime.now().strftime('%Y-%m-%d')
-                        })
-                    else:
-                        dividends.append({
-                            'symbol': symbol,
-                            'company_name': stock_data.get('name', symbol),
-                            'annual_dividend': annual_dividend_amount,
-                            'dividend_yield': dividend_yield,
-                            'projected_income': dividend_income,
-                            'last_dividend_date': recent_dividends.index.max().strftime('%Y-%m-%d') if not recent_dividends.empty else None,
-                            'last_dividend_amount': recent_dividends['Dividends'].iloc[-1] if not recent_dividends.empty else 0,
-                            'dividend_frequency': estimate_dividend_frequency(recent_dividends),
-                            'history': recent_dividends.reset_index().to_dict('records'),
-                            'updated_at': datetime.now().strftime('%Y-%m-%d')
-                        })
-        except Exception as e:
-            print(f"Error fetching dividend data for {symbol}: {str(e)}")
-    
-    # Save to session
-    session['dividends'] = dividends
-    session.modified = True
+    # Only refresh entries that have not been updated in the last 30 days
+    existing = {d['symbol']: d for d in dividends}
+    today = datetime.now()
+    stale = [
+        p for p in portfolio
+        if p['symbol'] not in existing
+        or (today - datetime.strptime(existing[p['symbol']]['updated_at'], '%Y-%m-%d')).days >= 30
+    ]
+    
+    if stale:
+        symbols = [p['symbol'] for p in stale]
+        # Dividend histories come from the shared cache (fetched concurrently when
+        # missing) and prices from the market snapshot, so there is no per-stock call
+        histories = await dividend_cache.get_many_async(symbols)
+        quotes = market_poller.get_snapshot(symbols).quotes
+        summaries = summarize_dividends(
+            histories,
+            {s: quotes[s].price for s in symbols if s in quotes},
+            {p['symbol']: p['quantity'] for p in stale},
+            today - timedelta(days=365)
+        )
+        
+        for symbol, summary in summaries.items():
+            entry = existing.get(symbol)
+            if entry is None:
+                entry = {
+                    'symbol': symbol,
+                    'company_name': quotes[symbol].name if symbol in quotes else symbol
+                }
+                dividends.append(entry)
+            entry.update(summary)
+            entry['updated_at'] = today.strftime('%Y-%m-%d')
+            ledger.save_dividend(user_id, entry)
     
     # Calculate summary metrics
     total_annual_income = sum(d.get('projected_income', 0) for d in dividends)
@@ -885,29 +1290,6 @@ def get_dividends():
         }
     })
 
-def estimate_dividend_frequency(dividend_data):
-    """Estimate dividend payment frequency based on historical data"""
-    if dividend_data is None or dividend_data.empty or len(dividend_data) < 2:
-        return "Unknown"
-    
-    # Calculate average days between dividends
-    dates = sorted(dividend_data.index)
-    if len(dates) < 2:
-        return "Unknown"
-    
-    intervals = [(dates[i+1] - dates[i]).days for i in range(len(dates)-1)]
-    avg_interval = sum(intervals) / len(intervals)
-    
-    # Determine frequency
-    if avg_interval <= 40:  # Monthly
-        return "Monthly"
-    elif avg_interval <= 100:  # Quarterly
-        return "Quarterly"
-    elif avg_interval <= 200:  # Semi-annual
-        return "Semi-annual"
-    else:  # Annual
-        return "Annual"
-
 @app.route('/add_dividend', methods=['POST'])
 def add_dividend():
     """Manually add dividend payment record"""
@@ -924,17 +1306,17 @@ def add_dividend():
         return jsonify({'status': 'error', 'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
     
     # Initialize session
-    initialize_session()
-    dividends = session.get('dividends', [])
-    portfolio = session.get('portfolio', [])
+    user_id = initialize_session()
+    dividends = ledger.get_dividends(user_id)
     
     # Check if stock is in portfolio
-    stock_position = next((s for s in portfolio if s['symbol'] == symbol), None)
+    stock_position = ledger.get_position(user_id, symbol)
     if not stock_position:
         return jsonify({'status': 'error', 'message': 'Stock not in portfolio'}), 400
     
     # Get current stock data
     stock_data = get_stock_data(symbol)
+    current_price = stock_data.price if stock_data else None
     
     # Find or create dividend entry
     dividend_entry = next((d for d in dividends if d['symbol'] == symbol), None)
@@ -957,7 +1339,7 @@ def add_dividend():
         
         dividend_entry.update({
             'annual_dividend': annual_dividend,
-            'dividend_yield': (annual_dividend / stock_data['price']) * 100 if stock_data['price'] > 0 else 0,
+            'dividend_yield': (annual_dividend / current_price) * 100 if current_price else 0,
             'projected_income': annual_dividend * stock_position['quantity'],
             'last_dividend_date': payment_date,
             'last_dividend_amount': amount,
@@ -965,11 +1347,11 @@ def add_dividend():
         })
     else:
         # Create new entry
-        dividends.append({
+        dividend_entry = {
             'symbol': symbol,
-            'company_name': stock_data.get('name', symbol),
+            'company_name': stock_data.name if stock_data else symbol,
             'annual_dividend': amount,  # Initial annual is just this payment
-            'dividend_yield': (amount / stock_data['price']) * 100 if stock_data['price'] > 0 else 0,
+            'dividend_yield': (amount / current_price) * 100 if current_price else 0,
             'projected_income': amount * stock_position['quantity'],
             'last_dividend_date': payment_date,
             'last_dividend_amount': amount,
@@ -979,11 +1361,9 @@ def add_dividend():
                 'Dividends': amount
             }],
             'updated_at': datetime.now().strftime('%Y-%m-%d')
-        })
+        }
     
-    # Save to session
-    session['dividends'] = dividends
-    session.modified = True
+    ledger.save_dividend(user_id, dividend_entry)
     
     return jsonify({
         'status': 'success',
@@ -993,172 +1373,141 @@ def add_dividend():
 @app.route('/dividends')
 def dividends_page():
     """Render dividends tracking page"""
-    initialize_session()
-    portfolio = session.get('portfolio', [])
+    user_id = initialize_session()
+    portfolio = ledger.get_portfolio(user_id)
     return render_template('dividends.html', portfolio=portfolio)
 
 # NEW FEATURE: Portfolio Export Functionality
+# Report columns as (name, type) for the CSV, Parquet and Arrow exports
+PORTFOLIO_EXPORT_COLUMNS = [
+    ('Symbol', 'string'), ('Company Name', 'string'), ('Quantity', 'int64'), ('Buy Price', 'float64'),
+    ('Current Price', 'float64'), ('Buy Date', 'string'), ('Holding Period (Days)', 'int64'),
+    ('Current Value', 'float64'), ('Cost Basis', 'float64'), ('Profit/Loss', 'float64'),
+    ('Profit/Loss %', 'float64'), ('Sector', 'string')
+]
+TAX_EXPORT_COLUMNS = [
+    ('Symbol', 'string'), ('Company Name', 'string'), ('Quantity', 'int64'), ('Buy Price', 'float64'),
+    ('Sell Price', 'float64'), ('Buy Date', 'string'), ('Sell Date', 'string'), ('Holding Period (Days)', 'int64'),
+    ('Tax Category', 'string'), ('Profit/Loss', 'float64'), ('Tax Rate (%)', 'float64'), ('Estimated Tax', 'float64')
+]
+DIVIDEND_EXPORT_COLUMNS = [
+    ('Symbol', 'string'), ('Company Name', 'string'), ('Annual Dividend (₹)', 'float64'),
+    ('Dividend Yield (%)', 'float64'), ('Projected Annual Income (₹)', 'float64'), ('Last Dividend Date', 'string'),
+    ('Last Dividend Amount (₹)', 'float64'), ('Dividend Frequency', 'string')
+]
+
+def export_response(rows, columns, filename, empty_message):
+    """
+    Stream a report as a download in the format given by ?format= (csv, parquet or arrow)
+
+    Rows are read lazily from the ledger and written out in chunks, so the
+    report is never held in memory as a whole.
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return jsonify({'status': 'error', 'message': empty_message}), 400
+    
+    try:
+        stream, mimetype, extension = stream_export(fmt, columns, chain([first], rows))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    return Response(
+        stream,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}.{extension}'}
+    )
+
 @app.route('/export_portfolio')
 def export_portfolio():
-    """Export portfolio data to CSV file"""
-    initialize_session()
-    portfolio = session.get('portfolio', [])
-    
-    if not portfolio:
-        return jsonify({
-            'status': 'error',
-            'message': 'Portfolio is empty'
-        }), 400
+    """Export portfolio data as a CSV, Parquet or Arrow file"""
+    user_id = initialize_session()
     
     # Get current prices
-    symbols = [p['symbol'] for p in portfolio]
-    stocks_data = get_stocks_data(symbols)
-    
-    # Update portfolio with current prices
-    for p in portfolio:
-        stock = next((s for s in stocks_data if s['symbol'] == p['symbol']), None)
-        if stock:
-            p['current_price'] = stock['price']
-    
-    # Create DataFrame
-    portfolio_data = []
-    for p in portfolio:
-        current_value = p['quantity'] * p['current_price']
-        cost_basis = p['quantity'] * p['buy_price']
-        profit_loss = current_value - cost_basis
-        profit_loss_pct = (profit_loss / cost_basis) * 100 if cost_basis > 0 else 0
-        
-        portfolio_data.append({
-            'Symbol': p['symbol'],
-            'Company Name': p.get('company_name', p['symbol']),
-            'Quantity': p['quantity'],
-            'Buy Price': p['buy_price'],
-            'Current Price': p['current_price'],
-            'Buy Date': p.get('purchase_date', 'Unknown'),
-            'Holding Period (Days)': calculate_holding_period(p.get('purchase_date')),
-            'Current Value': current_value,
-            'Cost Basis': cost_basis,
-            'Profit/Loss': profit_loss,
-            'Profit/Loss %': profit_loss_pct,
-            'Sector': p.get('sector', 'Unknown')
-        })
-    
-    # Convert to DataFrame and then to CSV
-    df = pd.DataFrame(portfolio_data)
-    csv_data = df.to_csv(index=False)
-    
-    # Create buffer for CSV file
-    buffer = io.BytesIO()
-    buffer.write(csv_data.encode('utf-8'))
-    buffer.seek(0)
+    # Stays synchronous: the response streams ledger rows after the view returns,
+    # and the ledger's per-thread connection must not be handed to an event loop thread
+    stocks_data = get_stocks_data(ledger.get_position_symbols(user_id))
+    prices = {s.symbol: s.price for s in stocks_data if s.price is not None}
+    
+    def rows():
+        for p in ledger.iter_portfolio(user_id):
+            current_price = prices.get(p['symbol'], p['current_price'])
+            current_value = p['quantity'] * current_price
+            cost_basis = p['quantity'] * p['buy_price']
+            profit_loss = current_value - cost_basis
+            profit_loss_pct = (profit_loss / cost_basis) * 100 if cost_basis > 0 else 0
+            
+            yield (
+                p['symbol'],
+                p.get('company_name', p['symbol']),
+                p['quantity'],
+                p['buy_price'],
+                current_price,
+                p.get('purchase_date', 'Unknown'),
+                calculate_holding_period(p.get('purchase_date')),
+                current_value,
+                cost_basis,
+                profit_loss,
+                profit_loss_pct,
+                p.get('sector', 'Unknown')
+            )
     
     # Generate filename with current date
-    filename = f"portfolio_export_{datetime.now().strftime('%Y%m%d')}.csv"
-    
-    return send_file(
-        buffer,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=filename
-    )
+    filename = f"portfolio_export_{datetime.now().strftime('%Y%m%d')}"
+    return export_response(rows(), PORTFOLIO_EXPORT_COLUMNS, filename, 'Portfolio is empty')
 
 @app.route('/export_tax_report')
 def export_tax_report():
-    """Export capital gains tax report to CSV file"""
-    initialize_session()
-    sold_stocks = session.get('sold_stocks', [])
-    
-    if not sold_stocks:
-        return jsonify({
-            'status': 'error',
-            'message': 'No sold stocks to generate tax report'
-        }), 400
-    
-    # Create DataFrame
-    tax_data = []
-    for s in sold_stocks:
-        holding_period = s.get('holding_period', 0)
-        tax_category = 'Short-term' if holding_period < 365 else 'Long-term'
-        tax_rate = TAX_RATES['short_term'] * 100 if tax_category == 'Short-term' else TAX_RATES['long_term'] * 100
-        
-        tax_data.append({
-            'Symbol': s['symbol'],
-            'Company Name': s.get('company_name', s['symbol']),
-            'Quantity': s['quantity'],
-            'Buy Price': s['buy_price'],
-            'Sell Price': s['sell_price'],
-            'Buy Date': s.get('buy_date', 'Unknown'),
-            'Sell Date': s.get('sell_date', 'Unknown'),
-            'Holding Period (Days)': holding_period,
-            'Tax Category': tax_category,
-            'Profit/Loss': s['profit_loss'],
-            'Tax Rate (%)': tax_rate,
-            'Estimated Tax': s['profit_loss'] * (TAX_RATES['short_term'] if tax_category == 'Short-term' else TAX_RATES['long_term']) if s['profit_loss'] > 0 else 0
-        })
-    
-    # Convert to DataFrame and then to CSV
-    df = pd.DataFrame(tax_data)
-    csv_data = df.to_csv(index=False)
+    """Export capital gains tax report as a CSV, Parquet or Arrow file"""
+    user_id = initialize_session()
+    year = request.args.get('financial_year') or get_current_financial_year()
     
-    # Create buffer for CSV file
-    buffer = io.BytesIO()
-    buffer.write(csv_data.encode('utf-8'))
-    buffer.seek(0)
-    
-    # Generate filename with current date and financial year
-    filename = f"tax_report_{get_current_financial_year()}.csv"
-    
-    return send_file(
-        buffer,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=filename
-    )
+    def rows():
+        for s in ledger.iter_sold_stocks(user_id, year):
+            category = 'long_term' if s.get('tax_category') == 'long_term' else 'short_term'
+            
+            yield (
+                s['symbol'],
+                s.get('company_name', s['symbol']),
+                s['quantity'],
+                s['buy_price'],
+                s['sell_price'],
+                s.get('buy_date', 'Unknown'),
+                s.get('sell_date', 'Unknown'),
+                s.get('holding_period', 0),
+                'Long-term' if category == 'long_term' else 'Short-term',
+                s['profit_loss'],
+                TAX_RATES[category] * 100,
+                s['profit_loss'] * TAX_RATES[category] if s['profit_loss'] > 0 else 0
+            )
+    
+    # Generate filename with the financial year
+    filename = f"tax_report_{year}"
+    return export_response(rows(), TAX_EXPORT_COLUMNS, filename, 'No sold stocks to generate tax report')
 
 @app.route('/export_dividends')
 def export_dividends():
-    """Export dividend data to CSV file"""
-    initialize_session()
-    dividends = session.get('dividends', [])
-    
-    if not dividends:
-        return jsonify({
-            'status': 'error',
-            'message': 'No dividend data to export'
-        }), 400
-    
-    # Create DataFrame
-    dividend_data = []
-    for d in dividends:
-        dividend_data.append({
-            'Symbol': d['symbol'],
-            'Company Name': d.get('company_name', d['symbol']),
-            'Annual Dividend (₹)': d.get('annual_dividend', 0),
-            'Dividend Yield (%)': d.get('dividend_yield', 0),
-            'Projected Annual Income (₹)': d.get('projected_income', 0),
-            'Last Dividend Date': d.get('last_dividend_date', 'Unknown'),
-            'Last Dividend Amount (₹)': d.get('last_dividend_amount', 0),
-            'Dividend Frequency': d.get('dividend_frequency', 'Unknown')
-        })
-    
-    # Convert to DataFrame and then to CSV
-    df = pd.DataFrame(dividend_data)
-    csv_data = df.to_csv(index=False)
-    
-    # Create buffer for CSV file
-    buffer = io.BytesIO()
-    buffer.write(csv_data.encode('utf-8'))
-    buffer.seek(0)
+    """Export dividend data as a CSV, Parquet or Arrow file"""
+    user_id = initialize_session()
+    
+    def rows():
+        for d in ledger.iter_dividends(user_id):
+            yield (
+                d['symbol'],
+                d.get('company_name', d['symbol']),
+                d.get('annual_dividend', 0),
+                d.get('dividend_yield', 0),
+                d.get('projected_income', 0),
+                d.get('last_dividend_date', 'Unknown'),
+                d.get('last_dividend_amount', 0),
+                d.get('dividend_frequency', 'Unknown')
+            )
     
     # Generate filename with current date
-    filename = f"dividend_report_{datetime.now().strftime('%Y%m%d')}.csv"
-    
-    return send_file(
-        buffer,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=filename
-    )
+    filename = f"dividend_report_{datetime.now().strftime('%Y%m%d')}"
+    return export_response(rows(), DIVIDEND_EXPORT_COLUMNS, filename, 'No dividend data to export')
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
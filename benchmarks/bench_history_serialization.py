@@ -0,0 +1,70 @@
+"""
+Benchmark /api/stock_history serialization on a large history frame
+
+Compares the old iterrows() row building with the bulk record and columnar
+builders used by app.stock_history_api, including JSON encoding.
+
+Usage:
+    python benchmarks/bench_history_serialization.py [rows] [repeats]
+"""
+import json
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import history_to_columns, history_to_records
+
+def make_history(rows):
+    rng = np.random.default_rng(42)
+    close = 1000 + rng.standard_normal(rows).cumsum()
+    return pd.DataFrame({
+        'Date': pd.date_range('1990-01-01', periods=rows, freq='D').strftime('%Y-%m-%d'),
+        'Open': close + rng.random(rows),
+        'High': close + 2,
+        'Low': close - 2,
+        'Close': close,
+        'Volume': rng.integers(1000, 1000000, rows)
+    })
+
+def iterrows_records(history):
+    # Serialization used before the endpoint was vectorized
+    return [
+        {
+            'date': row['Date'],
+            'open': row['Open'],
+            'high': row['High'],
+            'low': row['Low'],
+            'close': row['Close'],
+            'volume': row['Volume']
+        }
+        for index, row in history.iterrows()
+    ]
+
+def encode(data):
+    return json.dumps(data, default=lambda value: value.item())
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    history = make_history(rows).sort_index(ascending=False)
+
+    builders = [
+        ('iterrows records', iterrows_records),
+        ('bulk records', history_to_records),
+        ('columnar', history_to_columns)
+    ]
+
+    print(f"Serializing {rows} rows, best of {repeats}")
+    baseline = None
+    for name, builder in builders:
+        seconds = min(timeit.repeat(lambda: encode(builder(history)), number=1, repeat=repeats))
+        baseline = baseline or seconds
+        print(f"{name:<18} {seconds * 1000:9.2f} ms  {baseline / seconds:6.1f}x")
+
+if __name__ == '__main__':
+    main()
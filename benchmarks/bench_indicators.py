@@ -0,0 +1,88 @@
+"""
+Benchmark the indicator cache on a batch of symbols
+
+Times a full computation of every series, an incremental extension by one
+new bar per symbol, and a lookup with unchanged bars, against recomputing
+the same indicators from scratch with pandas rolling/ewm.
+
+Usage:
+    python benchmarks/bench_indicators.py [symbols] [bars]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.history_store import HistoryStore
+from utils.indicators import IndicatorCache
+
+DAY = 86400
+
+def fill_store(store, symbols, bars, start_ts):
+    rng = np.random.default_rng(7)
+    for symbol in symbols:
+        close = 1000 + rng.standard_normal(bars).cumsum()
+        timestamps = start_ts + np.arange(bars) * DAY
+        store.append(symbol, '1d', timestamps.tolist(), close.tolist(), (close + 3).tolist(), (close - 3).tolist(),
+                     close.tolist(), rng.integers(1000, 1000000, bars).tolist())
+
+def append_bar(store, symbols, ts):
+    for symbol in symbols:
+        bars = store.get_bars(symbol, '1d', ts - DAY)
+        close = float(bars['Close'].iloc[-1]) + 1
+        store.append(symbol, '1d', [ts], [close], [close + 3], [close - 3], [close], [5000])
+
+def pandas_indicators(bars):
+    # Reference: the same indicators rebuilt from the whole frame every time
+    close, high, low = bars['Close'], bars['High'], bars['Low']
+    result = {
+        'sma_20': close.rolling(20).mean(),
+        'sma_50': close.rolling(50).mean(),
+        'ema_20': close.ewm(span=20, adjust=False).mean(),
+        'bb_std': close.rolling(20).std(ddof=0)
+    }
+    macd = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    result['macd_signal'] = macd.ewm(span=9, adjust=False).mean()
+    change = close.diff()
+    gain = change.clip(lower=0).ewm(alpha=1 / 14, adjust=False).mean()
+    loss = (-change).clip(lower=0).ewm(alpha=1 / 14, adjust=False).mean()
+    result['rsi_14'] = 100 * gain / (gain + loss)
+    prior = close.shift()
+    true_range = pd.concat([high - low, (high - prior).abs(), (low - prior).abs()], axis=1).max(axis=1)
+    result['atr_14'] = true_range.ewm(alpha=1 / 14, adjust=False).mean()
+    typical = (high + low + close) / 3
+    result['vwap'] = (typical * bars['Volume']).cumsum() / bars['Volume'].cumsum()
+    return result
+
+def timed(label, function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed * 1000:9.1f} ms")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    bars = int(sys.argv[2]) if len(sys.argv) > 2 else 750
+    symbols = [f"SYM{i}.NS" for i in range(count)]
+    start_ts = 1_600_000_000 - 1_600_000_000 % DAY
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = HistoryStore(os.path.join(directory, 'history.db'))
+        fill_store(store, symbols, bars, start_ts)
+        cache = IndicatorCache(store)
+        print(f"{count} symbols x {bars} daily bars")
+
+        timed('pandas, full recompute', lambda: [pandas_indicators(store.get_bars(s, '1d')) for s in symbols])
+        timed('indicator cache, first build', lambda: cache.get_many(symbols, start_ts, 'max'))
+        timed('indicator cache, unchanged', lambda: cache.get_many(symbols, start_ts, 'max'))
+        append_bar(store, symbols, start_ts + bars * DAY)
+        timed('indicator cache, one new bar', lambda: cache.get_many(symbols, start_ts, 'max'))
+        print(cache.stats())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Local stand-in for the Yahoo Finance endpoints used by TradeX
+
+Serves v8/finance/chart, v7/finance/quote, v1/finance/search and the
+v1/finance/screener IPO list with synthetic but deterministic data, so the
+app can be exercised and load-tested without touching Yahoo. Latency,
+server errors and 429 throttling can be injected.
+
+Point the app at it with YAHOO_BASE_URL, e.g.:
+    python benchmarks/fake_yahoo.py --port 8765 --latency 40 --error-rate 0.01 --throttle-rate 0.02
+    YAHOO_BASE_URL=http://127.0.0.1:8765 python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DAY = 86400
+
+# Longest history served for a single chart request, in bars
+MAX_CHART_BARS = 5000
+
+INTERVAL_SECONDS = {
+    '1m': 60, '5m': 300, '15m': 900, '30m': 1800, '1h': 3600, '60m': 3600,
+    '1d': DAY, '1wk': 7 * DAY, '1mo': 30 * DAY
+}
+
+RANGE_SECONDS = {
+    '1d': DAY, '5d': 5 * DAY, '1mo': 30 * DAY, '3mo': 90 * DAY, '6mo': 180 * DAY,
+    '1y': 365 * DAY, '2y': 730 * DAY, '5y': 1825 * DAY, '10y': 3650 * DAY, 'max': 7300 * DAY
+}
+
+def symbol_seed(symbol):
+    return zlib.crc32(symbol.encode('utf-8'))
+
+def base_price(symbol):
+    return 50 + symbol_seed(symbol) % 3000
+
+def price_at(symbol, ts):
+    """Deterministic price path for a symbol, so repeated requests agree"""
+    day = ts // DAY
+    rng = random.Random(symbol_seed(symbol) ^ day)
+    drift = ((day % 400) - 200) / 2000
+    return round(base_price(symbol) * (1 + drift) * (1 + rng.uniform(-0.02, 0.02)), 2)
+
+def chart_body(symbol, query):
+    now = int(time.time())
+    interval = query.get('interval', ['1d'])[0]
+    step = INTERVAL_SECONDS.get(interval, DAY)
+    if 'period1' in query:
+        start = int(query['period1'][0])
+        end = int(query.get('period2', [now])[0])
+    else:
+        end = now
+        start = end - RANGE_SECONDS.get(query.get('range', ['1mo'])[0], 30 * DAY)
+    start = max(start, end - step * MAX_CHART_BARS)
+
+    timestamps = list(range(start - start % step + step, end + 1, step))
+    closes = [price_at(symbol, ts) for ts in timestamps]
+    price = price_at(symbol, now)
+
+    dividends = {}
+    if symbol_seed(symbol) % 3 == 0:
+        for ts in range(now - now % (91 * DAY), start, -91 * DAY):
+            dividends[str(ts)] = {'amount': round(base_price(symbol) * 0.004, 2), 'date': ts}
+
+    return {'chart': {'result': [{
+        'meta': {
+            'symbol': symbol,
+            'regularMarketPrice': price,
+            'previousClose': price_at(symbol, now - DAY),
+            'regularMarketVolume': 100000 + symbol_seed(symbol) % 900000,
+            'dayHigh': round(price * 1.01, 2),
+            'dayLow': round(price * 0.99, 2)
+        },
+        'timestamp': timestamps,
+        'events': {'dividends': dividends},
+        'indicators': {'quote': [{
+            'open': [round(c * 0.998, 2) for c in closes],
+            'high': [round(c * 1.01, 2) for c in closes],
+            'low': [round(c * 0.99, 2) for c in closes],
+            'close': closes,
+            'volume': [100000 + (ts // step) % 50000 for ts in timestamps]
+        }]}
+    }], 'error': None}}
+
+def quote_body(query):
+    now = int(time.time())
+    symbols = [s for s in query.get('symbols', [''])[0].split(',') if s]
+    result = []
+    for symbol in symbols:
+        price = price_at(symbol, now)
+        result.append({
+            'symbol': symbol,
+            'shortName': symbol.split('.')[0],
+            'regularMarketPrice': price,
+            'regularMarketPreviousClose': price_at(symbol, now - DAY),
+            'regularMarketVolume': 100000 + symbol_seed(symbol) % 900000,
+            'regularMarketDayHigh': round(price * 1.01, 2),
+            'regularMarketDayLow': round(price * 0.99, 2),
+            'marketCap': base_price(symbol) * 10 ** 8
+        })
+    return {'quoteResponse': {'result': result, 'error': None}}
+
+def search_body(query):
+    term = query.get('q', [''])[0]
+    slug = ''.join(c for c in term.upper() if c.isalnum())[:8] or 'FUND'
+    return {'quotes': [{'symbol': f"{slug}{i}.BO", 'quoteType': 'MUTUALFUND'} for i in range(3)], 'news': []}
+
+def screener_body():
+    now = int(time.time())
+    return {'finance': {'result': [{'quotes': [
+        {
+            'symbol': f"IPO{i}.NS",
+            'shortName': f"Sample IPO {i} Ltd",
+            'exchange': 'NSE',
+            'priceHint': 100 + i * 10,
+            'navPrice': 110 + i * 10,
+            'firstTradeDateEpochUtc': now + i * 7 * DAY,
+            'marketCap': (i + 1) * 5 * 10 ** 9,
+            'averageVolume': 50 + i,
+            'sector': 'Technology'
+        }
+        for i in range(5)
+    ]}], 'error': None}}
+
+class FakeYahooServer:
+    """
+    Threaded fake Yahoo Finance server
+
+    Parameters:
+    port (int): Port to listen on. 0 picks a free port
+    latency (float): Mean added latency per request, in milliseconds
+    jitter (float): Uniform +/- jitter on the latency, in milliseconds
+    error_rate (float): Fraction of requests answered with HTTP 500
+    throttle_rate (float): Fraction of requests answered with HTTP 429
+    retry_after (float): Retry-After seconds sent with 429 responses
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-yahoo', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if server.latency or server.jitter:
+                    delay = server.latency + random.uniform(-server.jitter, server.jitter)
+                    time.sleep(max(0.0, delay) / 1000)
+
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                endpoint = url.path.strip('/').split('/')
+                endpoint = '/'.join(endpoint[:3])
+                server.count(endpoint)
+
+                roll = random.random()
+                if roll < server.throttle_rate:
+                    server.count('status_429')
+                    return self._send(429, {'finance': {'error': 'Too Many Requests'}},
+                                      {'Retry-After': str(server.retry_after)})
+                if roll < server.throttle_rate + server.error_rate:
+                    server.count('status_500')
+                    return self._send(500, {'finance': {'error': 'Internal Server Error'}})
+
+                if url.path.startswith('/v8/finance/chart/'):
+                    body = chart_body(url.path.rsplit('/', 1)[-1], query)
+                elif url.path.startswith('/v7/finance/quote'):
+                    body = quote_body(query)
+                elif url.path.startswith('/v1/finance/search'):
+                    body = search_body(query)
+                elif url.path.startswith('/v1/finance/screener'):
+                    body = screener_body()
+                else:
+                    server.count('status_404')
+                    return self._send(404, {'error': 'Not Found'})
+                server.count('status_200')
+                self._send(200, body)
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve fake Yahoo Finance responses')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='mean added latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='latency jitter in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of HTTP 500 responses')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of HTTP 429 responses')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds on 429')
+    args = parser.parse_args()
+
+    server = FakeYahooServer(args.host, args.port, args.latency, args.jitter, args.error_rate,
+                             args.throttle_rate, args.retry_after).start()
+    print(f"Fake Yahoo Finance listening on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Multi-user load test for the TradeX routes
+
+Runs the app in-process against the local fake Yahoo server (or against an
+already running app with --app-url), simulates independent users with
+their own sessions and reports p50/p95/p99 latency and throughput per route.
+
+Each simulated user first builds a small portfolio and a price alert, then
+repeatedly hits /api/stocks, /portfolio, /api/portfolio/history,
+/check_alerts and the CSV exports until the duration is over.
+
+Usage:
+    python benchmarks/load_test.py --users 20 --duration 30
+    python benchmarks/load_test.py --users 50 --latency 80 --error-rate 0.02 --throttle-rate 0.01
+    python benchmarks/load_test.py --app-url http://127.0.0.1:5000 --users 10
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_yahoo import FakeYahooServer
+
+SYMBOLS = [
+    'RELIANCE.NS', 'TCS.NS', 'HDFCBANK.NS', 'INFY.NS', 'ICICIBANK.NS', 'HINDUNILVR.NS', 'ITC.NS',
+    'SBIN.NS', 'BHARTIARTL.NS', 'KOTAKBANK.NS', 'LT.NS', 'AXISBANK.NS', 'ASIANPAINT.NS', 'MARUTI.NS',
+    'SUNPHARMA.NS', 'TITAN.NS', 'BAJFINANCE.NS', 'WIPRO.NS', 'HCLTECH.NS', 'ULTRACEMCO.NS'
+]
+
+# Route name -> (method, path, relative weight)
+WORKLOAD = {
+    '/api/stocks': ('GET', '/api/stocks', 10),
+    '/portfolio': ('GET', '/portfolio', 3),
+    '/api/portfolio/history': ('GET', '/api/portfolio/history?period=1y', 2),
+    '/check_alerts': ('GET', '/check_alerts', 4),
+    '/export_portfolio': ('GET', '/export_portfolio', 1),
+    '/export_tax_report': ('GET', '/export_tax_report', 1),
+    '/export_dividends': ('GET', '/export_dividends', 1)
+}
+
+class Recorder:
+    """Collect per-route latencies and failures from all user threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, seconds, ok):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+def start_app(yahoo_url, upstream_rate):
+    """Import the app against the fake server and serve it on a free local port"""
+    data_dir = tempfile.mkdtemp(prefix='tradex-load-')
+    os.environ['YAHOO_BASE_URL'] = yahoo_url
+    os.environ.setdefault('TRADEX_HISTORY_DB', os.path.join(data_dir, 'history.db'))
+    os.environ.setdefault('TRADEX_LEDGER_DB', os.path.join(data_dir, 'ledger.db'))
+    os.environ.setdefault('TRADEX_FUND_REGISTRY', os.path.join(data_dir, 'fund_registry.json'))
+
+    from werkzeug.serving import make_server
+
+    from app import app
+    from utils.rate_limit import upstream_limiter
+
+    if upstream_rate:
+        upstream_limiter.configure(rate=upstream_rate, capacity=max(1, int(upstream_rate)))
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='tradex-app', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+def setup_user(session, base_url, holdings):
+    """Give a new user a portfolio and a price alert"""
+    for symbol in random.sample(SYMBOLS, holdings):
+        session.post(f"{base_url}/buy_stock", data={
+            'stock': symbol,
+            'quantity': random.randint(1, 50),
+            'buy_price': random.randint(100, 3000),
+            'transaction_date': f"202{random.randint(2, 5)}-0{random.randint(1, 9)}-1{random.randint(0, 9)}"
+        })
+    symbol = random.choice(SYMBOLS)
+    quotes = session.get(f"{base_url}/api/stocks", params={'stocks': symbol}).json().get('data') or [{}]
+    price = quotes[0].get('price')
+    if isinstance(price, (int, float)):
+        session.post(f"{base_url}/add_alert", data={'symbol': symbol, 'price': price * 1.5, 'alert_type': 'above'})
+
+def run_user(base_url, deadline, recorder, holdings, think_time):
+    session = requests.Session()
+    try:
+        setup_user(session, base_url, holdings)
+    except requests.RequestException as e:
+        print(f"User setup failed: {e}")
+
+    routes = list(WORKLOAD)
+    weights = [WORKLOAD[r][2] for r in routes]
+    while time.monotonic() < deadline:
+        route = random.choices(routes, weights)[0]
+        method, path, _ = WORKLOAD[route]
+        start = time.perf_counter()
+        try:
+            response = session.request(method, f"{base_url}{path}", timeout=60)
+            response.content
+            ok = response.status_code < 500
+        except requests.RequestException:
+            ok = False
+        recorder.record(route, time.perf_counter() - start, ok)
+        if think_time:
+            time.sleep(random.uniform(0, 2 * think_time))
+
+def report(recorder, elapsed):
+    print(f"\n{'route':<26}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    total = 0
+    for route in WORKLOAD:
+        samples = np.array(recorder.latencies.get(route, []))
+        if not samples.size:
+            continue
+        total += samples.size
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+        print(f"{route:<26}{samples.size:>9}{recorder.errors.get(route, 0):>8}{samples.size / elapsed:>9.1f}"
+              f"{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}")
+    print(f"\n{total} requests in {elapsed:.1f}s, {total / elapsed:.1f} req/s overall")
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-user load test for TradeX')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load after setup')
+    parser.add_argument('--holdings', type=int, default=5, help='positions bought by each user')
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean pause between a user\'s requests in seconds')
+    parser.add_argument('--app-url', help='load an already running app instead of starting one in-process')
+    parser.add_argument('--yahoo-url', help='use an already running fake Yahoo server')
+    parser.add_argument('--latency', type=float, default=20.0, help='fake Yahoo mean latency in ms')
+    parser.add_argument('--jitter', type=float, default=10.0, help='fake Yahoo latency jitter in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fake Yahoo HTTP 500 fraction')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fake Yahoo HTTP 429 fraction')
+    parser.add_argument('--upstream-rate', type=float, help='override the upstream token bucket rate (requests/s)')
+    args = parser.parse_args()
+
+    fake = None
+    base_url = args.app_url
+    if not base_url:
+        yahoo_url = args.yahoo_url
+        if not yahoo_url:
+            fake = FakeYahooServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                   throttle_rate=args.throttle_rate, retry_after=0.5).start()
+            yahoo_url = fake.url
+        base_url, _ = start_app(yahoo_url, args.upstream_rate)
+
+    print(f"Loading {base_url} with {args.users} users for {args.duration:.0f}s")
+    recorder = Recorder()
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=run_user, args=(base_url, deadline, recorder, args.holdings, args.think_time), daemon=True)
+        for _ in range(args.users)
+    ]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(recorder, time.monotonic() - start)
+
+    if fake is not None:
+        print(f"Fake Yahoo calls: {dict(fake.counts)}")
+
+if __name__ == '__main__':
+    main()
@@ -17,24 +17,20 @@ function loadStockHistory(symbol, period) {
     
     chartTitle.innerText = `Loading data for ${symbol}...`;
     
-    fetch(`/api/stock_history/${symbol}?period=${period}`)
-        .then(response => {
-            console.log('Fetch response status:', response.status);
-            if (!response.ok) throw new Error('Network response was not ok');
-            return response.json();
-        })
+    // fetchJSONConditional (main.js) revalidates with If-None-Match on repeat loads
+    fetchJSONConditional(`/api/stock_history/${symbol}?period=${period}&format=columnar`)
         .then(data => {
             console.log('Data received:', data);
-            if (!data.data || data.data.length === 0) {
+            if (!data.data || !data.data.date || data.data.date.length === 0) {
                 chartTitle.innerText = `No historical data available for ${symbol}`;
                 return;
             }
             
             chartTitle.innerText = `Historical Price Movement - ${symbol} (${period.toUpperCase()})`;
             
-            // Data is newest first from API, reverse for ascending chart
-            const chartLabels = data.data.map(item => item.date).reverse();
-            const chartData = data.data.map(item => item.close).reverse();
+            // Columns are newest first from API, reverse copies for ascending chart
+            const chartLabels = data.data.date.slice().reverse();
+            const chartData = data.data.close.slice().reverse();
             
             createHistoryChart(chartLabels, chartData);
             updateMetrics(chartData); // Pass reversed chartData (oldest first) for metrics
@@ -166,10 +162,10 @@ function updateMetrics(chartData) {
 
 /**
  * Populate table with all historical data fields (newest first)
- * @param {Array} data - Historical data with all fields
+ * @param {Object} data - Columnar historical data ({date: [...], close: [...], ...})
  */
 function populateHistoryTable(data) {
-    console.log('Populating table with', data.length, 'rows');
+    console.log('Populating table with', data.date.length, 'rows');
     const tbody = document.querySelector('#historyTable tbody');
     if (!tbody) {
         console.error('historyTable tbody not found');
@@ -178,15 +174,15 @@ function populateHistoryTable(data) {
     
     tbody.innerHTML = '';
     
-    data.forEach(item => {
+    data.date.forEach((date, i) => {
         const row = document.createElement('tr');
         row.innerHTML = `
-            <td>${item.date}</td>
-            <td class="number">₹${item.open.toFixed(2)}</td>
-            <td class="number">₹${item.high.toFixed(2)}</td>
-            <td class="number">₹${item.low.toFixed(2)}</td>
-            <td class="number">₹${item.close.toFixed(2)}</td>
-            <td class="number">${item.volume.toLocaleString()}</td>
+            <td>${date}</td>
+            <td class="number">₹${data.open[i].toFixed(2)}</td>
+            <td class="number">₹${data.high[i].toFixed(2)}</td>
+            <td class="number">₹${data.low[i].toFixed(2)}</td>
+            <td class="number">₹${data.close[i].toFixed(2)}</td>
+            <td class="number">${data.volume[i].toLocaleString()}</td>
         `;
         tbody.appendChild(row);
     });
@@ -6,6 +6,29 @@ let isAutoRefreshEnabled = true;
 let sectorChart = null;
 let ipoData = [];
 let mutualFundsData = [];
+let stockStream = null;
+let stockStreamFailures = 0;
+const MAX_STREAM_FAILURES = 3;
+
+// Last ETag and payload per URL; polls send the ETag back and reuse the
+// payload when the server answers 304 Not Modified
+const conditionalCache = new Map();
+
+function fetchJSONConditional(url) {
+    const cached = conditionalCache.get(url);
+    const headers = cached ? {'If-None-Match': cached.etag} : {};
+    // no-store keeps the browser cache out of the way so the 304 reaches us
+    return fetch(url, {headers: headers, cache: 'no-store'})
+        .then(response => {
+            if (response.status === 304 && cached) return cached.data;
+            if (!response.ok) throw new Error('Network response was not ok');
+            const etag = response.headers.get('ETag');
+            return response.json().then(data => {
+                if (etag) conditionalCache.set(url, {etag: etag, data: data});
+                return data;
+            });
+        });
+}
 
 document.addEventListener('DOMContentLoaded', function() {
     initializeApp();
@@ -21,6 +44,7 @@ function initializeApp() {
     fetchStockData();
     fetchIPOData();
     fetchMutualFundsData();
+    openStockStream();
     startAutoRefresh();
 }
 
@@ -41,10 +65,12 @@ function setupRefreshControls() {
     toggleAutoRefresh.addEventListener('click', function() {
         if (isAutoRefreshEnabled) {
             stopAutoRefresh();
+            closeStockStream();
             this.textContent = 'Resume Auto-Refresh';
             this.classList.remove('secondary');
             this.classList.add('primary');
         } else {
+            openStockStream();
             startAutoRefresh();
             this.textContent = 'Pause Auto-Refresh';
             this.classList.remove('primary');
@@ -169,11 +195,7 @@ function setupFilters() {
 function fetchStockData() {
     updateStatus('Fetching stock data...');
     
-    fetch('/api/stocks')
-        .then(response => {
-            if (!response.ok) throw new Error('Network response was not ok');
-            return response.json();
-        })
+    fetchJSONConditional('/api/stocks')
         .then(data => {
             updateStatus('');
             stocks = data.data;
@@ -189,6 +211,45 @@ function fetchStockData() {
         });
 }
 
+function isStockStreamActive() {
+    return stockStream !== null && stockStream.readyState !== EventSource.CLOSED;
+}
+
+function openStockStream() {
+    // Live updates over Server-Sent Events; polling stays as the fallback
+    if (!window.EventSource || stockStreamFailures >= MAX_STREAM_FAILURES) return;
+    closeStockStream();
+
+    stockStream = new EventSource('/api/stream/stocks');
+    stockStream.addEventListener('quotes', function(event) {
+        stockStreamFailures = 0;
+        const update = JSON.parse(event.data);
+        if (update.full) {
+            stocks = update.data;
+        } else {
+            update.data.forEach(quote => {
+                const index = stocks.findIndex(s => s.symbol === quote.symbol);
+                if (index !== -1) stocks[index] = quote;
+            });
+        }
+        populateStockTable(stocks);
+        if (update.timestamp) updateLastUpdated(update.timestamp);
+    });
+    stockStream.onerror = function() {
+        // EventSource reconnects by itself and resends Last-Event-ID
+        if (stockStream.readyState === EventSource.CLOSED || ++stockStreamFailures >= MAX_STREAM_FAILURES) {
+            closeStockStream();
+        }
+    };
+}
+
+function closeStockStream() {
+    if (stockStream) {
+        stockStream.close();
+        stockStream = null;
+    }
+}
+
 function populateStockTable(stocks) {
     const tbody = document.getElementById('stockTableBody');
     tbody.innerHTML = '';
@@ -331,7 +392,7 @@ function sortTable(key, header) {
 function startAutoRefresh() {
     if (autoRefreshInterval) clearInterval(autoRefreshInterval);
     autoRefreshInterval = setInterval(() => {
-        fetchStockData();
+        if (!isStockStreamActive()) fetchStockData();
         if (Math.floor(Date.now() / 1000) % (refreshIntervalSeconds * 5) < refreshIntervalSeconds) {
             fetchIPOData();
             fetchMutualFundsData();
@@ -360,7 +421,10 @@ function addStockToWatchlist(stock) {
     .then(response => response.json())
     .then(data => {
         updateStatus(data.message);
-        if (data.status === 'success') fetchStockData();
+        if (data.status === 'success') {
+            fetchStockData();
+            if (isStockStreamActive()) openStockStream();
+        }
     })
     .catch(error => {
         console.error('Error adding stock:', error);
@@ -380,7 +444,10 @@ function removeStock(symbol) {
     .then(response => response.json())
     .then(data => {
         updateStatus(data.message);
-        if (data.status === 'success') fetchStockData();
+        if (data.status === 'success') {
+            fetchStockData();
+            if (isStockStreamActive()) openStockStream();
+        }
     })
     .catch(error => {
         console.error('Error removing stock:', error);
@@ -390,11 +457,7 @@ function removeStock(symbol) {
 
 function fetchIPOData() {
     updateIPOStatus('Fetching upcoming IPO data...');
-    fetch('/api/ipos')
-        .then(response => {
-            if (!response.ok) throw new Error('Network response was not ok');
-            return response.json();
-        })
+    fetchJSONConditional('/api/ipos')
         .then(data => {
             updateIPOStatus('');
             ipoData = data.data;
@@ -439,11 +502,7 @@ function updateIPOStatus(message) {
 
 function fetchMutualFundsData() {
     updateFundsStatus('Fetching mutual fund data...');
-    fetch('/api/mutualfunds')
-        .then(response => {
-            if (!response.ok) throw new Error('Network response was not ok');
-            return response.json();
-        })
+    fetchJSONConditional('/api/mutualfunds')
         .then(data => {
             console.log('Received mutual fund data:', data);
             updateFundsStatus('');
@@ -0,0 +1,146 @@
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime
+
+class _ThresholdBook:
+    """Sorted thresholds for one symbol and direction, with parallel alert keys"""
+
+    __slots__ = ('thresholds', 'keys')
+
+    def __init__(self):
+        self.thresholds = []
+        self.keys = []
+
+    def add(self, threshold, key):
+        index = bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(index, threshold)
+        self.keys.insert(index, key)
+
+    def remove(self, threshold, key):
+        start = bisect_left(self.thresholds, threshold)
+        end = bisect_right(self.thresholds, threshold)
+        for index in range(start, end):
+            if self.keys[index] == key:
+                del self.thresholds[index]
+                del self.keys[index]
+                return True
+        return False
+
+    def pop_range(self, start, end):
+        keys = self.keys[start:end]
+        del self.thresholds[start:end]
+        del self.keys[start:end]
+        return keys
+
+class AlertBook:
+    """
+    Global index of untriggered price alerts across all users
+
+    For every symbol, 'above' and 'below' thresholds are kept in sorted
+    arrays. A new price is checked by bisection, so only the alerts whose
+    thresholds were crossed are touched: 'above' alerts with threshold <=
+    price form a prefix, 'below' alerts with threshold >= price a suffix.
+    Triggered alerts leave the index and are handed to `on_trigger`, which
+    stores them; delivery reads them back from storage, so it does not
+    matter which worker process saw the price move.
+    """
+
+    def __init__(self, on_trigger=None):
+        self.on_trigger = on_trigger
+        self._lock = threading.Lock()
+        self._books = defaultdict(lambda: {'above': _ThresholdBook(), 'below': _ThresholdBook()})
+        self._alerts = {}
+        self._loaded = False
+
+    def load(self, user_alerts):
+        """
+        Index alerts from storage once per process
+
+        Parameters:
+        user_alerts (iterable): (user_id, alert) pairs
+        """
+        with self._lock:
+            if self._loaded:
+                return
+            for user_id, alert in user_alerts:
+                self._add(user_id, alert)
+            self._loaded = True
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def add(self, user_id, alert):
+        with self._lock:
+            self._add(user_id, alert)
+
+    def _add(self, user_id, alert):
+        if alert.get('triggered') or alert.get('type') not in ('above', 'below'):
+            return
+        key = (user_id, alert['id'])
+        if key in self._alerts:
+            return
+        self._alerts[key] = alert
+        self._books[alert['symbol']][alert['type']].add(alert['price'], key)
+
+    def remove(self, user_id, alert_id):
+        with self._lock:
+            alert = self._alerts.pop((user_id, alert_id), None)
+            if alert is None:
+                return False
+            self._books[alert['symbol']][alert['type']].remove(alert['price'], (user_id, alert_id))
+            return True
+
+    def on_quotes(self, quotes):
+        """
+        Evaluate new quotes against the index
+
+        Parameters:
+        quotes (list): Quote records
+
+        Returns:
+        list: (user_id, alert) pairs triggered by these quotes
+        """
+        triggered = []
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            for quote in quotes:
+                price = quote.price
+                book = self._books.get(quote.symbol)
+                if book is None or price is None:
+                    continue
+
+                above = book['above']
+                below = book['below']
+                keys = above.pop_range(0, bisect_right(above.thresholds, price))
+                keys += below.pop_range(bisect_left(below.thresholds, price), len(below.thresholds))
+
+                for key in keys:
+                    alert = self._alerts.pop(key)
+                    alert['current_price'] = price
+                    alert['triggered'] = True
+                    alert['triggered_at'] = now
+                    triggered.append((key[0], alert))
+
+        if triggered and self.on_trigger is not None:
+            try:
+                self.on_trigger(triggered)
+            except Exception as e:
+                print(f"Error delivering triggered alerts: {e}")
+        return triggered
+
+    def symbols(self):
+        """Get every symbol with at least one untriggered alert"""
+        with self._lock:
+            return [symbol for symbol, book in self._books.items() if book['above'].keys or book['below'].keys]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active_alerts': len(self._alerts),
+                'symbols': sum(1 for book in self._books.values() if book['above'].keys or book['below'].keys)
+            }
+
+# Process-wide alert index used by the Flask routes
+alert_book = AlertBook()
@@ -0,0 +1,214 @@
+import asyncio
+
+from utils.http_client import async_transport
+from utils.stock_data import (
+    MAX_FETCH_WORKERS, batch_quote_chunks, cached_stock_quotes, combine_stock_quotes, dividends_path, error_quote,
+    history_fetch_from, history_frame, history_path, history_source, history_window, normalize_symbol,
+    parse_batch_quotes, parse_chart_quote, parse_dividends, parse_mutual_fund,
+    store_fetched_quotes, store_history_bars
+)
+
+# asyncio versions of the utils.stock_data fetchers. Responses are parsed by
+# the same functions as the blocking versions, so both return identical data;
+# only the waiting differs. Fan-outs are bounded by a semaphore instead of a
+# thread pool, and SQLite reads and writes of the bar store run on a worker
+# thread so they never block the event loop.
+#
+# Under a WSGI server Flask runs each async view to completion on its own
+# event loop, and the request holds its worker thread until then. What this
+# buys is concurrency inside one request (fan-outs without a thread pool),
+# not more concurrent requests per worker; that needs an ASGI server.
+
+async def gather_limited(coroutines, limit=None):
+    """Await coroutines concurrently, at most `limit` (default MAX_FETCH_WORKERS) at a time, keeping their order"""
+    semaphore = asyncio.Semaphore(max(1, limit or MAX_FETCH_WORKERS))
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(c) for c in coroutines))
+
+async def get_stock_data_async(symbol, use_cache=True):
+    """
+    Get stock data, served from the process-wide quote cache when fresh
+
+    Parameters:
+    symbol (str): Stock symbol
+    use_cache (bool): If False, always fetch from Yahoo Finance
+
+    Returns:
+    Quote: Stock quote record
+    """
+    symbol = normalize_symbol(symbol)
+    if use_cache:
+        cached, _ = cached_stock_quotes([symbol])
+        if cached:
+            return cached[symbol]
+
+    data = await fetch_stock_data_async(symbol)
+    if data and not data.error:
+        store_fetched_quotes({symbol: data})
+    return data
+
+async def fetch_stock_data_async(symbol):
+    """Get stock data directly from the Yahoo Finance chart endpoint"""
+    symbol = normalize_symbol(symbol)
+    try:
+        response = await async_transport.get(f"v8/finance/chart/{symbol}?interval=1d")
+        if response.status_code != 200:
+            return None
+        return parse_chart_quote(symbol, response.json())
+    except Exception as e:
+        print(f"Error fetching {symbol}: {e}")
+        return error_quote(symbol)
+
+async def get_batch_quotes_async(symbols, chunk_size=None):
+    """
+    Get quotes for many symbols from the v7/finance/quote batch endpoint, all chunks at once
+
+    Returns:
+    dict: Mapping of symbol to quote record. Symbols missing from a response are absent
+    """
+    async def fetch(chunk):
+        try:
+            response = await async_transport.get(f"v7/finance/quote?symbols={','.join(chunk)}")
+            if response.status_code != 200:
+                return {}
+            return parse_batch_quotes(chunk, response.json())
+        except Exception as e:
+            print(f"Error fetching batch quotes for {len(chunk)} symbols: {e}")
+            return {}
+
+    quotes = {}
+    for chunk_quotes in await gather_limited([fetch(chunk) for chunk in batch_quote_chunks(symbols, chunk_size)]):
+        quotes.update(chunk_quotes)
+    return quotes
+
+async def get_stocks_data_async(symbols, max_concurrency=None, use_cache=True):
+    """
+    Get data for multiple Indian stocks
+
+    Same lookup order as get_stocks_data: quote cache, then the batch
+    endpoint, then per-symbol chart calls for whatever the batch missed.
+
+    Parameters:
+    symbols (list): List of stock symbols
+    max_concurrency (int): Maximum in-flight fetches. Defaults to MAX_FETCH_WORKERS
+    use_cache (bool): If False, always fetch from Yahoo Finance
+
+    Returns:
+    list: List of quote records sorted by market cap (descending)
+    """
+    symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols))
+    if not symbols:
+        return []
+
+    cached_quotes, uncached = cached_stock_quotes(symbols, use_cache)
+    async with async_transport.scope():
+        batch_quotes = await get_batch_quotes_async(uncached) if uncached else {}
+        missing = [symbol for symbol in uncached if symbol not in batch_quotes]
+        results = await gather_limited([fetch_stock_data_async(symbol) for symbol in missing], max_concurrency)
+
+    return combine_stock_quotes(symbols, cached_quotes, batch_quotes, results)
+
+async def get_stock_dividends_async(symbol):
+    """
+    Get dividend history for a stock from Yahoo Finance
+
+    Returns:
+    pandas.DataFrame: Dividend history with Date index, None if the fetch failed
+    """
+    symbol = normalize_symbol(symbol)
+    try:
+        response = await async_transport.get(dividends_path(symbol))
+        if response.status_code != 200:
+            return None
+        return parse_dividends(response.json())
+    except Exception as e:
+        print(f"Error fetching dividend data for {symbol}: {e}")
+        return None
+
+async def get_stock_history_async(symbol, period="1y", interval='1d'):
+    """
+    Get historical stock data, served from the local bar store
+
+    Parameters:
+    symbol (str): Stock symbol
+    period (str): Time period - 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, max
+    interval (str): Bar interval - 1m, 5m, 15m, 1h or 1d
+
+    Returns:
+    pandas.DataFrame: Historical OHLCV price data
+    """
+    symbol = normalize_symbol(symbol)
+    start_time, now = history_window(period, interval)
+
+    try:
+        await sync_stock_history_async(symbol, start_time, now, interval)
+    except Exception as e:
+        print(f"Error fetching historical data for {symbol}: {e}")
+    return await asyncio.to_thread(history_frame, symbol, start_time, now, interval)
+
+async def sync_stock_history_async(symbol, start_time, end_time, interval='1d'):
+    """
+    Bring the stored bars for a symbol up to date
+
+    Returns:
+    bool: True if upstream was called
+    """
+    source = history_source(interval, start_time)
+    fetch_from = await asyncio.to_thread(history_fetch_from, symbol, start_time, source)
+    if fetch_from is None:
+        return False
+
+    response = await async_transport.get(history_path(symbol, source, fetch_from, end_time))
+    if response.status_code != 200:
+        return True
+
+    await asyncio.to_thread(store_history_bars, symbol, source, response.json(), fetch_from)
+    return True
+
+async def get_histories_async(symbols, period='1y', max_concurrency=None):
+    """
+    Fetch price histories for several symbols concurrently
+
+    Returns:
+    dict: Mapping of symbol to history DataFrame. Failed symbols are omitted
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+
+    async with async_transport.scope():
+        results = await gather_limited([get_stock_history_async(symbol, period) for symbol in symbols], max_concurrency)
+
+    return {symbol: history for symbol, history in zip(symbols, results)
+            if history is not None and not history.empty}
+
+async def get_mutual_funds_data_async(fund_list, max_concurrency=None):
+    """
+    Get mutual fund data for several fund symbols concurrently
+
+    Chart and quote calls of each fund are issued together.
+
+    Returns:
+    list: Mutual fund data dictionaries, in fund_list order, for funds with a NAV
+    """
+    async def fetch(fund):
+        try:
+            chart_response, quote_response = await asyncio.gather(
+                async_transport.get(f"v8/finance/chart/{fund}?interval=1d"),
+                async_transport.get(f"v7/finance/quote?symbols={fund}")
+            )
+            if chart_response.status_code != 200:
+                return None
+            quote_data = quote_response.json() if quote_response.status_code == 200 else None
+            return parse_mutual_fund(fund, chart_response.json(), quote_data)
+        except Exception as e:
+            print(f"Error processing mutual fund {fund}: {e}")
+            return None
+
+    async with async_transport.scope():
+        results = await gather_limited([fetch(fund) for fund in fund_list], max_concurrency)
+    return [fund_data for fund_data in results if fund_data]
@@ -0,0 +1,168 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.async_stock_data import gather_limited, get_stock_dividends_async
+from utils.http_client import async_transport
+from utils.metrics import in_current_context
+from utils.stock_data import MAX_FETCH_WORKERS, get_stock_dividends, normalize_symbol
+
+# Seconds a symbol's dividend history is served before it is fetched again
+DIVIDEND_REFRESH_SECONDS = 86400
+
+# Average days between payments up to which each frequency applies; longer is Annual
+FREQUENCY_BOUNDS = [(40, 'Monthly'), (100, 'Quarterly'), (200, 'Semi-annual')]
+
+class DividendCache:
+    """
+    Process-wide cache of dividend histories keyed by symbol
+
+    Each symbol is refreshed on its own schedule, `refresh_seconds` after it
+    was last fetched, independently of which user asked for it. Symbols
+    that are missing or stale are fetched concurrently. Failed fetches are
+    not cached: the symbol keeps its previous history, if any, and is
+    fetched again on the next request.
+    """
+
+    def __init__(self, refresh_seconds=DIVIDEND_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get_many(self, symbols, max_workers=None):
+        """
+        Get dividend histories for several symbols
+
+        Parameters:
+        symbols (list): Stock symbols
+        max_workers (int): Maximum concurrent fetches. Defaults to MAX_FETCH_WORKERS
+
+        Returns:
+        dict: Mapping of symbol to a DataFrame with a 'Dividends' column and a Date index;
+              symbols whose fetch failed and that have no cached history are left out
+        """
+        result, stale = self._lookup(symbols)
+        if stale:
+            workers = max(1, min(max_workers or MAX_FETCH_WORKERS, len(stale)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                fetched = list(executor.map(in_current_context(get_stock_dividends), stale))
+            self._store(stale, fetched, result)
+        return result
+
+    async def get_many_async(self, symbols, max_concurrency=None):
+        """get_many() for async callers; stale symbols are fetched on the event loop"""
+        result, stale = self._lookup(symbols)
+        if stale:
+            async with async_transport.scope():
+                fetched = await gather_limited([get_stock_dividends_async(s) for s in stale], max_concurrency)
+            self._store(stale, fetched, result)
+        return result
+
+    def _lookup(self, symbols):
+        symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols))
+        now = time.monotonic()
+        with self._lock:
+            result = {s: self._entries[s][1] for s in symbols if s in self._entries}
+            stale = [s for s in symbols if s not in self._entries or now - self._entries[s][0] >= self.refresh_seconds]
+        return result, stale
+
+    def _store(self, symbols, histories, result):
+        now = time.monotonic()
+        with self._lock:
+            for symbol, history in zip(symbols, histories):
+                if history is None:
+                    continue
+                self._entries[symbol] = (now, history)
+                result[symbol] = history
+
+    def invalidate(self, symbol=None):
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(normalize_symbol(symbol), None)
+
+def summarize_dividends(histories, prices, quantities, since):
+    """
+    Compute dividend metrics for many holdings in one pass
+
+    All dividend events are stacked into a single frame and reduced per
+    symbol with grouped aggregates, so yield, frequency and projected
+    income are array operations instead of a loop over holdings.
+
+    Parameters:
+    histories (dict): Mapping of symbol to dividend history DataFrame
+    prices (dict): Mapping of symbol to current price, None when unknown
+    quantities (dict): Mapping of symbol to held quantity
+    since (datetime): Only dividends on or after this date are counted
+
+    Returns:
+    dict: Mapping of symbol to metrics for symbols that paid a dividend since
+    the given date: annual_dividend, dividend_yield, projected_income,
+    last_dividend_date, last_dividend_amount, dividend_frequency and history
+    """
+    frames = [
+        pd.DataFrame({'symbol': symbol, 'Date': history.index, 'Dividends': history['Dividends'].to_numpy(dtype=float)})
+        for symbol, history in histories.items()
+        if history is not None and not history.empty
+    ]
+    if not frames:
+        return {}
+
+    events = pd.concat(frames, ignore_index=True)
+    events['Date'] = pd.to_datetime(events['Date'])
+    events = events[events['Date'] >= pd.Timestamp(since)].sort_values(['symbol', 'Date'])
+    if events.empty:
+        return {}
+
+    events['gap'] = events.groupby('symbol')['Date'].diff().dt.days
+    summary = events.groupby('symbol').agg(
+        annual_dividend=('Dividends', 'sum'),
+        last_dividend_date=('Date', 'last'),
+        last_dividend_amount=('Dividends', 'last'),
+        average_gap=('gap', 'mean'),
+        payments=('Dividends', 'size')
+    )
+
+    symbols = summary.index
+    price = np.array([prices.get(s) for s in symbols], dtype=float)
+    quantity = np.array([quantities.get(s, 0) for s in symbols], dtype=float)
+    annual = summary['annual_dividend'].to_numpy()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dividend_yield = np.where(price > 0, annual / price * 100, 0.0)
+    projected_income = annual * quantity
+
+    gap = summary['average_gap'].to_numpy()
+    frequency = np.select(
+        [summary['payments'].to_numpy() < 2] + [gap <= bound for bound, _ in FREQUENCY_BOUNDS],
+        ['Unknown'] + [name for _, name in FREQUENCY_BOUNDS],
+        default='Annual'
+    )
+
+    events['Date'] = events['Date'].dt.strftime('%Y-%m-%d')
+    history_records = {
+        symbol: group.iloc[::-1][['Date', 'Dividends']].to_dict('records')
+        for symbol, group in events.groupby('symbol', sort=False)
+    }
+
+    last_dates = summary['last_dividend_date'].dt.strftime('%Y-%m-%d').to_numpy()
+    last_amounts = summary['last_dividend_amount'].to_numpy()
+    return {
+        symbol: {
+            'annual_dividend': float(annual[i]),
+            'dividend_yield': float(dividend_yield[i]),
+            'projected_income': float(projected_income[i]),
+            'last_dividend_date': last_dates[i],
+            'last_dividend_amount': float(last_amounts[i]),
+            'dividend_frequency': str(frequency[i]),
+            'history': history_records[symbol]
+        }
+        for i, symbol in enumerate(symbols)
+    }
+
+# Process-wide dividend cache used by the Flask routes
+dividend_cache = DividendCache()
@@ -0,0 +1,195 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from utils.async_stock_data import get_mutual_funds_data_async
+from utils.stock_data import find_and_test_mutual_funds, get_mutual_funds_data, test_mutual_fund_availability
+
+# JSON file holding validated mutual fund symbols
+FUND_REGISTRY_PATH = os.environ.get(
+    'TRADEX_FUND_REGISTRY',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'fund_registry.json')
+)
+
+# Seconds between background rediscovery and revalidation runs
+FUND_REVALIDATE_SECONDS = 86400
+
+# Seconds fetched NAV data is served before it is fetched again
+FUND_NAV_TTL = 300
+
+class FundRegistry:
+    """
+    Persisted registry of validated mutual fund symbols
+
+    Discovery (search + availability tests) runs in a background thread on
+    first use and then every `revalidate_seconds`. The request path only
+    reads the registry and the NAV data, which is cached for `nav_ttl`.
+    """
+
+    def __init__(self, path=FUND_REGISTRY_PATH, revalidate_seconds=FUND_REVALIDATE_SECONDS, nav_ttl=FUND_NAV_TTL):
+        self.path = path
+        self.revalidate_seconds = revalidate_seconds
+        self.nav_ttl = nav_ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._last_revalidated = None
+        self._nav_cache = None
+        self._thread = None
+        self._loaded = False
+        self._revalidating = threading.Event()
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._entries = data.get('funds', {})
+                self._last_revalidated = data.get('last_revalidated')
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                print(f"Error loading fund registry: {e}")
+            self._loaded = True
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        # A unique temp file per write, so processes saving at once never share one
+        f = tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, suffix='.tmp', delete=False)
+        try:
+            with f:
+                json.dump({'last_revalidated': self._last_revalidated, 'funds': self._entries}, f, indent=2)
+            os.replace(f.name, self.path)
+        except Exception:
+            if os.path.exists(f.name):
+                os.unlink(f.name)
+            raise
+
+    def working_symbols(self):
+        """Get symbols that passed their last availability test"""
+        self._load()
+        with self._lock:
+            return [symbol for symbol, entry in self._entries.items() if entry.get('available')]
+
+    def status(self):
+        """Get registry bookkeeping for API responses"""
+        self._load()
+        with self._lock:
+            return {
+                'total_symbols': len(self._entries),
+                'last_revalidated': self._last_revalidated,
+                'revalidating': self._revalidating.is_set()
+            }
+
+    def is_stale(self):
+        self._load()
+        return self._last_revalidated is None or time.time() - self._last_revalidated > self.revalidate_seconds
+
+    def revalidate(self):
+        """
+        Rediscover fund symbols and retest every known one
+
+        A symbol whose test fails keeps its previous entry; the others are
+        still updated.
+        """
+        self._load()
+        self._revalidating.set()
+        try:
+            try:
+                discovery = find_and_test_mutual_funds()
+                results = dict(discovery.get('test_results', {}))
+            except Exception as e:
+                print(f"Error discovering mutual funds: {e}")
+                results = {}
+
+            with self._lock:
+                known = [symbol for symbol in self._entries if symbol not in results]
+            for symbol in known:
+                try:
+                    results.update(test_mutual_fund_availability([symbol]))
+                except Exception as e:
+                    print(f"Error testing mutual fund {symbol}: {e}")
+
+            now = time.time()
+            with self._lock:
+                for symbol, result in results.items():
+                    entry = self._entries.setdefault(symbol, {'discovered_at': now})
+                    entry['available'] = bool(result.get('chart_has_data') or result.get('quote_has_data'))
+                    entry['last_verified'] = now
+                self._last_revalidated = now
+                self._nav_cache = None
+                self._save()
+        finally:
+            self._revalidating.clear()
+
+    def get_funds_data(self):
+        """
+        Get NAV data for every working symbol, cached for nav_ttl seconds
+
+        Returns:
+        list: Mutual fund data dictionaries from get_mutual_funds_data
+        """
+        cached = self._cached_funds_data()
+        if cached is not None:
+            return cached
+
+        symbols = self.working_symbols()
+        if not symbols:
+            return []
+        funds_data = get_mutual_funds_data(symbols)
+        if funds_data:
+            self._nav_cache = (time.monotonic(), funds_data)
+        return funds_data
+
+    async def get_funds_data_async(self):
+        """get_funds_data() for async callers; every fund is fetched concurrently"""
+        cached = self._cached_funds_data()
+        if cached is not None:
+            return cached
+
+        symbols = self.working_symbols()
+        if not symbols:
+            return []
+        funds_data = await get_mutual_funds_data_async(symbols)
+        if funds_data:
+            self._nav_cache = (time.monotonic(), funds_data)
+        return funds_data
+
+    def nav_version(self):
+        """When the cached NAV data was fetched (monotonic seconds), or None"""
+        cached = self._nav_cache
+        return cached[0] if cached is not None else None
+
+    def _cached_funds_data(self):
+        cached = self._nav_cache
+        if cached is not None and time.monotonic() - cached[0] < self.nav_ttl:
+            return cached[1]
+        return None
+
+    def ensure_started(self):
+        """Start the background revalidation thread if it is not running"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='fund-registry', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            if self.is_stale():
+                try:
+                    self.revalidate()
+                except Exception as e:
+                    print(f"Error revalidating mutual fund registry: {e}")
+            time.sleep(min(self.revalidate_seconds, 3600))
+
+# Process-wide registry used by the Flask routes
+fund_registry = FundRegistry()
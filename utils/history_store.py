@@ -0,0 +1,257 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# SQLite file holding downloaded OHLCV bars
+HISTORY_DB_PATH = os.environ.get(
+    'TRADEX_HISTORY_DB',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'history.db')
+)
+
+BAR_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Bar intervals, finest first. Each one is rolled up from the one before it
+BAR_PYRAMID = ('1m', '5m', '15m', '1h', '1d')
+
+INTERVAL_SECONDS = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600, '1d': 86400}
+
+# NSE and BSE trade on IST (UTC+05:30) from 09:15; bars of every interval are aligned to the session open
+EXCHANGE_UTC_OFFSET = 19800
+SESSION_OPEN_SECONDS = 9 * 3600 + 15 * 60
+
+def bucket_start(timestamps, interval):
+    """
+    Get the start of the bar each timestamp falls in
+
+    Intraday bars start at the session open and every interval after it
+    (09:15, 10:15, ... for 1h). A daily bar is stamped with the session
+    open of its IST calendar day, as Yahoo Finance stamps NSE daily bars.
+
+    Parameters:
+    timestamps (int or numpy.ndarray): Epoch seconds
+    interval (str): One of BAR_PYRAMID
+
+    Returns:
+    int or numpy.ndarray: Bar start times, same shape as timestamps
+    """
+    seconds = INTERVAL_SECONDS[interval]
+    if seconds >= 86400:
+        local_day = (timestamps + EXCHANGE_UTC_OFFSET) // 86400
+        return local_day * 86400 - EXCHANGE_UTC_OFFSET + SESSION_OPEN_SECONDS
+    return timestamps - (timestamps - (SESSION_OPEN_SECONDS - EXCHANGE_UTC_OFFSET)) % seconds
+
+class HistoryStore:
+    """
+    Persistent OHLCV bar store keyed by symbol and interval
+
+    Bars live in a single SQLite table clustered on (symbol, interval, ts),
+    so a period query is one range scan. A second table records, per symbol
+    and interval, the earliest start time covered and when the series was
+    last synced, which lets callers fetch only the bars after the last
+    stored timestamp.
+
+    Coarser intervals are kept precomputed: rollup() rebuilds them from the
+    next finer interval of BAR_PYRAMID whenever that one changes, so every
+    resolution is a plain range scan at read time.
+    """
+
+    def __init__(self, path=HISTORY_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self._create_schema(conn)
+                    self._initialized = True
+        return conn
+
+    @staticmethod
+    def _create_schema(conn):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS bars (
+                symbol TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                volume INTEGER NOT NULL,
+                PRIMARY KEY (symbol, interval, ts)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS coverage (
+                symbol TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                start_ts INTEGER NOT NULL,
+                last_ts INTEGER,
+                synced_at REAL NOT NULL,
+                PRIMARY KEY (symbol, interval)
+            ) WITHOUT ROWID;
+        """)
+        conn.commit()
+
+    def get_coverage(self, symbol, interval):
+        """
+        Get what is stored for a series
+
+        Returns:
+        dict: start_ts, last_ts and synced_at, or None if nothing is stored
+        """
+        row = self._connect().execute(
+            'SELECT start_ts, last_ts, synced_at FROM coverage WHERE symbol = ? AND interval = ?',
+            (symbol, interval)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'start_ts': row[0], 'last_ts': row[1], 'synced_at': row[2]}
+
+    def append(self, symbol, interval, timestamps, opens, highs, lows, closes, volumes, start_ts=None):
+        """
+        Insert or replace bars and update the series coverage
+
+        Bars with any missing value are skipped.
+
+        Parameters:
+        symbol (str): Normalized stock symbol
+        interval (str): Bar interval, e.g. '1d'
+        timestamps, opens, highs, lows, closes, volumes (list): Parallel bar columns
+        start_ts (int): Earliest time the fetch covered. Widens the stored coverage
+        """
+        rows = [
+            (symbol, interval, int(ts), o, h, l, c, v)
+            for ts, o, h, l, c, v in zip(timestamps, opens, highs, lows, closes, volumes)
+            if None not in (ts, o, h, l, c, v)
+        ]
+        conn = self._connect()
+        with conn:
+            if rows:
+                conn.executemany('INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            last_ts = conn.execute(
+                'SELECT MAX(ts) FROM bars WHERE symbol = ? AND interval = ?', (symbol, interval)
+            ).fetchone()[0]
+            coverage = self.get_coverage(symbol, interval)
+            if coverage is not None and start_ts is not None:
+                start_ts = min(start_ts, coverage['start_ts'])
+            elif coverage is not None:
+                start_ts = coverage['start_ts']
+            elif start_ts is None:
+                start_ts = min((row[2] for row in rows), default=int(time.time()))
+            conn.execute(
+                'INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?)',
+                (symbol, interval, int(start_ts), last_ts, time.time())
+            )
+
+    def get_bars(self, symbol, interval, start_ts=None, end_ts=None):
+        """
+        Get stored bars for a time range
+
+        Returns:
+        pandas.DataFrame: Columns ts, Open, High, Low, Close, Volume sorted by ts
+        """
+        rows = self._select_bars(symbol, interval, start_ts, end_ts)
+        return pd.DataFrame(rows, columns=['ts'] + BAR_COLUMNS)
+
+    def get_bar_arrays(self, symbol, interval, start_ts=None, end_ts=None):
+        """
+        Get stored bars for a time range as numpy arrays, without building a DataFrame
+
+        Returns:
+        dict: 'ts' (int64) and 'open', 'high', 'low', 'close', 'volume' (float) arrays sorted by ts
+        """
+        rows = self._select_bars(symbol, interval, start_ts, end_ts)
+        values = np.array(rows, dtype=float).reshape(len(rows), 6)
+        arrays = {'ts': values[:, 0].astype(np.int64)}
+        arrays.update((name, values[:, i + 1]) for i, name in enumerate(('open', 'high', 'low', 'close', 'volume')))
+        return arrays
+
+    def _select_bars(self, symbol, interval, start_ts, end_ts):
+        query = 'SELECT ts, open, high, low, close, volume FROM bars WHERE symbol = ? AND interval = ?'
+        params = [symbol, interval]
+        if start_ts is not None:
+            query += ' AND ts >= ?'
+            params.append(int(start_ts))
+        if end_ts is not None:
+            query += ' AND ts <= ?'
+            params.append(int(end_ts))
+        query += ' ORDER BY ts'
+        return self._connect().execute(query, params).fetchall()
+
+    def rollup(self, symbol, child, parent, from_ts):
+        """
+        Rebuild parent-interval bars from the child-interval bars below them
+
+        Only parent bars whose whole span lies within the child coverage are
+        built, so a bar is never rolled up from part of its bucket. Nothing
+        is written when the stored parent series ends before the child
+        coverage starts, as that would leave a gap behind its last bar.
+
+        Parameters:
+        symbol (str): Normalized stock symbol
+        child (str): Interval holding the source bars, e.g. '1m'
+        parent (str): Next coarser interval of BAR_PYRAMID, e.g. '5m'
+        from_ts (int): Time of the earliest child bar that changed
+
+        Returns:
+        int: Start of the first parent bar rebuilt, or None if none was
+        """
+        coverage = self.get_coverage(symbol, child)
+        if coverage is None or coverage['last_ts'] is None:
+            return None
+        covered = bucket_start(coverage['start_ts'], parent)
+        if covered < coverage['start_ts']:
+            covered = bucket_start(covered + INTERVAL_SECONDS[parent], parent)
+        parent_coverage = self.get_coverage(symbol, parent)
+        if parent_coverage is not None and (parent_coverage['last_ts'] or 0) < covered:
+            return None
+
+        first = max(bucket_start(int(from_ts), parent), covered)
+        bars = self.get_bar_arrays(symbol, child, first)
+        if bars['ts'].size == 0:
+            return None
+
+        buckets = bucket_start(bars['ts'], parent)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], buckets.size] - 1
+        self.append(
+            symbol, parent, buckets[starts].tolist(),
+            bars['open'][starts].tolist(),
+            np.maximum.reduceat(bars['high'], starts).tolist(),
+            np.minimum.reduceat(bars['low'], starts).tolist(),
+            bars['close'][ends].tolist(),
+            np.add.reduceat(bars['volume'], starts).astype(np.int64).tolist(),
+            start_ts=first
+        )
+        return first
+
+    def invalidate(self, symbol=None, interval=None):
+        """Delete stored bars for one series, one symbol or everything"""
+        conn = self._connect()
+        clause, params = '', []
+        if symbol is not None:
+            clause, params = ' WHERE symbol = ?', [symbol]
+            if interval is not None:
+                clause += ' AND interval = ?'
+                params.append(interval)
+        with conn:
+            conn.execute('DELETE FROM bars' + clause, params)
+            conn.execute('DELETE FROM coverage' + clause, params)
+
+# Process-wide store used by utils.stock_data
+history_store = HistoryStore()
@@ -0,0 +1,81 @@
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+
+GZIP_LEVEL = 6
+
+# Brotli quality 5 compresses JSON better than gzip -6 at a similar CPU cost
+BROTLI_QUALITY = 5
+
+def make_etag(*parts):
+    """
+    Build a weak ETag from the values a response was derived from
+
+    Weak, because the same data is served identity-, gzip- or
+    brotli-encoded under one validator.
+
+    Parameters:
+    parts: Version numbers, timestamps or other hashable values identifying the data
+
+    Returns:
+    str: ETag header value, e.g. W/"3f2a..."
+    """
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header matches an ETag, using weak comparison"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick the response encoding from an Accept-Encoding header
+
+    Returns:
+    str: 'br', 'gzip' or None for identity
+    """
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+
+    def allowed(name):
+        return accepted.get(name, accepted.get('*', 0)) > 0
+
+    if brotli is not None and allowed('br'):
+        return 'br'
+    if allowed('gzip'):
+        return 'gzip'
+    return None
+
+def compress(body, encoding):
+    """Encode a response body with 'br' or 'gzip'"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
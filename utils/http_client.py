@@ -0,0 +1,294 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from utils.metrics import current_route, metrics
+from utils.rate_limit import async_upstream_flight, upstream_flight, upstream_limiter
+
+# Base URL for every Yahoo Finance call. Point it at a local stand-in server for tests.
+YAHOO_BASE_URL = os.environ.get('YAHOO_BASE_URL', 'https://query1.finance.yahoo.com')
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# (connect, read) timeout in seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Status codes that are retried with backoff
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+UPSTREAM_SECONDS = metrics.histogram(
+    'tradex_upstream_request_seconds', 'Latency of each Yahoo Finance request attempt', ['endpoint'])
+UPSTREAM_REQUESTS = metrics.counter(
+    'tradex_upstream_requests_total', 'Yahoo Finance request attempts by endpoint and status', ['endpoint', 'status'])
+UPSTREAM_RETRIES = metrics.counter(
+    'tradex_upstream_retries_total', 'Yahoo Finance request attempts that were retried', ['endpoint'])
+ROUTE_UPSTREAM_CALLS = metrics.counter(
+    'tradex_route_upstream_calls_total', 'Yahoo Finance request attempts triggered by each route', ['route'])
+metrics.counter(
+    'tradex_upstream_coalesced_total', 'Yahoo Finance requests served by joining an identical in-flight request',
+    callback=lambda: upstream_flight.coalesced + async_upstream_flight.coalesced)
+
+def endpoint_label(path):
+    """Low-cardinality endpoint name for a request path, e.g. 'v8/finance/chart'"""
+    return '/'.join(path.split('?', 1)[0].strip('/').split('/')[:3])
+
+class YahooTransport:
+    """
+    Shared HTTP transport for all Yahoo Finance fetchers
+
+    Wraps a single requests.Session with a pooled keep-alive adapter, so
+    repeated calls reuse TCP+TLS connections. Requests that fail with a
+    connection error, a timeout or a retryable status code are retried with
+    jittered exponential backoff.
+
+    Every attempt takes a token from the process-wide upstream limiter, and
+    concurrent identical GETs are coalesced into a single upstream call.
+    """
+
+    def __init__(self, base_url=YAHOO_BASE_URL, timeout=DEFAULT_TIMEOUT, max_retries=3,
+                 backoff_factor=0.5, max_backoff=8.0, pool_size=20):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._session = self._create_session()
+
+    def _create_session(self):
+        session = requests.Session()
+        session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def configure(self, base_url=None, timeout=None, max_retries=None, backoff_factor=None,
+                  max_backoff=None, pool_size=None):
+        """Change transport settings at runtime"""
+        with self._lock:
+            if base_url is not None:
+                self.base_url = base_url.rstrip('/')
+            if timeout is not None:
+                self.timeout = timeout
+            if max_retries is not None:
+                self.max_retries = max_retries
+            if backoff_factor is not None:
+                self.backoff_factor = backoff_factor
+            if max_backoff is not None:
+                self.max_backoff = max_backoff
+            if pool_size is not None and pool_size != self.pool_size:
+                self.pool_size = pool_size
+                old_session, self._session = self._session, self._create_session()
+                old_session.close()
+
+    def url(self, path):
+        """Build an absolute URL for a path relative to the base URL"""
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path, params=None, timeout=None):
+        """
+        Perform a GET request against the Yahoo Finance base URL
+
+        Parameters:
+        path (str): Path relative to the base URL, e.g. 'v8/finance/chart/INFY.NS'
+        params (dict): Query string parameters
+        timeout: Override the default (connect, read) timeout
+
+        Returns:
+        requests.Response: The final response, which may still carry an error status.
+        Coalesced callers share the same response object.
+
+        Raises:
+        requests.RequestException: If every attempt failed without a response
+        """
+        url = self.url(path)
+        key = (url, tuple(sorted((params or {}).items())))
+        return upstream_flight.do(key, lambda: self._get_with_retries(url, params, timeout, endpoint_label(path)))
+
+    def _get_with_retries(self, url, params, timeout, endpoint):
+        attempt = 0
+        while True:
+            upstream_limiter.acquire()
+            ROUTE_UPSTREAM_CALLS.inc(route=current_route.get())
+            started = time.perf_counter()
+            try:
+                response = self._session.get(url, params=params, timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+                UPSTREAM_REQUESTS.inc(endpoint=endpoint, status='error')
+                if attempt >= self.max_retries:
+                    raise
+                UPSTREAM_RETRIES.inc(endpoint=endpoint)
+            else:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+                UPSTREAM_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                retry_after = self._retry_after(response)
+                response.close()
+                UPSTREAM_RETRIES.inc(endpoint=endpoint)
+                if retry_after is not None:
+                    attempt += 1
+                    time.sleep(min(retry_after, self.max_backoff))
+                    continue
+
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _backoff(self, attempt):
+        # Full jitter: sleep a random amount up to the exponential cap
+        cap = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    @staticmethod
+    def _retry_after(response):
+        value = response.headers.get('Retry-After')
+        try:
+            return max(0.0, float(value)) if value is not None else None
+        except ValueError:
+            return None
+
+    def close(self):
+        self._session.close()
+
+# Process-wide transport used by utils.stock_data
+transport = YahooTransport()
+
+# aiohttp session of the innermost AsyncYahooTransport.scope() on this task
+_async_session = contextvars.ContextVar('tradex_async_session', default=None)
+
+class UpstreamResponse:
+    """Fully read response from AsyncYahooTransport, shaped like the parts of requests.Response the fetchers use"""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+class AsyncYahooTransport:
+    """
+    asyncio counterpart of YahooTransport
+
+    Shares the base URL, timeouts and retry settings of a YahooTransport,
+    the process-wide upstream limiter and the same metrics. Requests made
+    inside `async with async_transport.scope():` share one aiohttp session
+    (and its keep-alive connections); outside a scope each call opens a
+    short-lived session.
+
+    Without aiohttp installed every call falls back to the blocking
+    transport on a worker thread, so callers work either way.
+    """
+
+    def __init__(self, sync_transport, pool_size=None):
+        self.sync = sync_transport
+        self.pool_size = pool_size
+
+    @property
+    def available(self):
+        return aiohttp is not None
+
+    def _create_session(self):
+        connect_timeout, read_timeout = self.sync.timeout if isinstance(self.sync.timeout, tuple) else (self.sync.timeout,) * 2
+        return aiohttp.ClientSession(
+            headers=DEFAULT_HEADERS,
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+            connector=aiohttp.TCPConnector(limit=self.pool_size or self.sync.pool_size)
+        )
+
+    @contextlib.asynccontextmanager
+    async def scope(self):
+        """Share one aiohttp session across the calls made inside this block"""
+        if aiohttp is None or _async_session.get() is not None:
+            yield
+            return
+        session = self._create_session()
+        token = _async_session.set(session)
+        try:
+            yield
+        finally:
+            _async_session.reset(token)
+            await session.close()
+
+    async def get(self, path, params=None):
+        """
+        Perform a GET request against the Yahoo Finance base URL
+
+        Parameters:
+        path (str): Path relative to the base URL, e.g. 'v8/finance/chart/INFY.NS'
+        params (dict): Query string parameters
+
+        Returns:
+        UpstreamResponse: The final response, which may still carry an error status
+        (a requests.Response when aiohttp is not installed)
+
+        Raises:
+        aiohttp.ClientError or asyncio.TimeoutError: If every attempt failed without a response
+        """
+        if aiohttp is None:
+            return await asyncio.to_thread(self.sync.get, path, params)
+
+        url = self.sync.url(path)
+        key = (url, tuple(sorted((params or {}).items())))
+        return await async_upstream_flight.do(key, lambda: self._get_with_retries(url, params, endpoint_label(path)))
+
+    async def _get_with_retries(self, url, params, endpoint):
+        session = _async_session.get()
+        if session is None:
+            async with self.scope():
+                return await self._get_with_retries(url, params, endpoint)
+
+        attempt = 0
+        while True:
+            await upstream_limiter.acquire_async()
+            ROUTE_UPSTREAM_CALLS.inc(route=current_route.get())
+            started = time.perf_counter()
+            try:
+                async with session.get(url, params=params) as raw:
+                    response = UpstreamResponse(raw.status, raw.headers, await raw.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+                UPSTREAM_REQUESTS.inc(endpoint=endpoint, status='error')
+                if attempt >= self.sync.max_retries:
+                    raise
+                UPSTREAM_RETRIES.inc(endpoint=endpoint)
+            else:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+                UPSTREAM_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.sync.max_retries:
+                    return response
+                retry_after = self.sync._retry_after(response)
+                UPSTREAM_RETRIES.inc(endpoint=endpoint)
+                if retry_after is not None:
+                    attempt += 1
+                    await asyncio.sleep(min(retry_after, self.sync.max_backoff))
+                    continue
+
+            await asyncio.sleep(self.sync._backoff(attempt))
+            attempt += 1
+
+# Process-wide async transport used by utils.async_stock_data
+async_transport = AsyncYahooTransport(transport)
@@ -0,0 +1,419 @@
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.history_store import history_store
+from utils.metrics import metrics
+
+# Indicator parameters; one cache entry is kept per symbol, period and parameter set
+IndicatorParams = namedtuple('IndicatorParams', 'sma ema rsi macd bollinger atr')
+
+DEFAULT_PARAMS = IndicatorParams(
+    sma=(20, 50),
+    ema=(20,),
+    rsi=14,
+    macd=(12, 26, 9),
+    bollinger=(20, 2.0),
+    atr=14
+)
+
+# Longest window accepted for any indicator, in bars
+MAX_WINDOW = 500
+
+# Maximum number of (symbol, period, parameters) series kept before the least recently used is evicted
+INDICATOR_CACHE_ENTRIES = 2048
+
+# Values are rounded to this many decimals in API responses
+RESPONSE_DECIMALS = 4
+
+# Exponential smoothing is evaluated in blocks over which the decay factor
+# shrinks by at most e**-EMA_BLOCK_RANGE (1e-6), keeping the closed form exact to ~1e-10
+EMA_BLOCK_RANGE = np.log(1e6)
+
+def parse_indicator_params(args):
+    """
+    Build indicator parameters from request arguments
+
+    Parameters:
+    args (dict): Mapping with optional 'sma' and 'ema' (comma-separated
+    windows), 'rsi', 'atr' (window), 'macd' (fast,slow,signal) and 'bb'
+    (window,standard deviations)
+
+    Returns:
+    IndicatorParams: Parsed parameters, defaults for anything not given
+
+    Raises:
+    ValueError: If a value is malformed or a window is out of range
+    """
+    def windows(name, default, count=None):
+        value = args.get(name)
+        if not value:
+            return default
+        try:
+            parsed = tuple(int(part) for part in value.split(','))
+        except ValueError:
+            raise ValueError(f"'{name}' must be comma-separated whole numbers")
+        if count is not None and len(parsed) != count:
+            raise ValueError(f"'{name}' takes {count} values")
+        if not parsed or any(window < 1 or window > MAX_WINDOW for window in parsed):
+            raise ValueError(f"'{name}' windows must be between 1 and {MAX_WINDOW}")
+        return parsed
+
+    bollinger = DEFAULT_PARAMS.bollinger
+    if args.get('bb'):
+        parts = args['bb'].split(',')
+        try:
+            bollinger = (int(parts[0]), float(parts[1]) if len(parts) > 1 else DEFAULT_PARAMS.bollinger[1])
+        except ValueError:
+            raise ValueError("'bb' must be window[,standard deviations]")
+        if len(parts) > 2 or not 1 <= bollinger[0] <= MAX_WINDOW or not 0 < bollinger[1] <= 10:
+            raise ValueError(f"'bb' window must be between 1 and {MAX_WINDOW}, deviations between 0 and 10")
+
+    return IndicatorParams(
+        sma=tuple(sorted(set(windows('sma', DEFAULT_PARAMS.sma)))),
+        ema=tuple(sorted(set(windows('ema', DEFAULT_PARAMS.ema)))),
+        rsi=windows('rsi', (DEFAULT_PARAMS.rsi,), 1)[0],
+        macd=windows('macd', DEFAULT_PARAMS.macd, 3),
+        bollinger=bollinger,
+        atr=windows('atr', (DEFAULT_PARAMS.atr,), 1)[0]
+    )
+
+def smooth(values, alpha, initial=None):
+    """
+    Exponential smoothing y[i] = y[i-1] + alpha * (x[i] - y[i-1]) without a per-bar loop
+
+    Each block is evaluated in closed form as
+    y[i] = d**(i+1) * (y[-1] + alpha * cumsum(x / d**(k+1))[i]) with d = 1 - alpha.
+
+    Parameters:
+    values (numpy.ndarray): Input series
+    alpha (float): Smoothing factor in (0, 1]
+    initial (float): Smoothed value before the first input. None seeds the
+    series with its first value, as pandas ewm(adjust=False) does
+
+    Returns:
+    numpy.ndarray: Smoothed series, same length as values
+    """
+    values = np.asarray(values, dtype=float)
+    if values.size == 0 or alpha >= 1:
+        return values.copy()
+    decay = 1.0 - alpha
+    previous = values[0] if initial is None else initial
+    block = max(1, int(EMA_BLOCK_RANGE / -np.log(decay)))
+    result = np.empty_like(values)
+    for start in range(0, values.size, block):
+        chunk = values[start:start + block]
+        powers = decay ** np.arange(1, chunk.size + 1)
+        result[start:start + chunk.size] = powers * (previous + alpha * np.cumsum(chunk / powers))
+        previous = result[start + chunk.size - 1]
+    return result
+
+def rolling(values, window, reducer):
+    """Apply reducer(windows, axis=1) over a sliding window; NaN until the first full window"""
+    result = np.full(values.size, np.nan)
+    if values.size >= window:
+        result[window - 1:] = reducer(sliding_window_view(values, window), axis=1)
+    return result
+
+def initial_state():
+    """State of an indicator series before its first bar"""
+    return {'count': 0, 'closes': np.empty(0), 'prev_close': None, 'smoothed': {}, 'cum_pv': 0.0, 'cum_volume': 0.0}
+
+def compute_indicators(bars, state, params):
+    """
+    Compute every indicator for consecutive bars continuing a series
+
+    All indicators are array operations over the new bars. What they need
+    from earlier bars - the trailing closes for rolling windows, the last
+    smoothed values and the VWAP running sums - is carried in `state`, so
+    a series is extended by calling this again with only the bars after it.
+
+    EMA-based values (EMA, MACD) are seeded with the first bar and reported
+    from it; RSI and ATR use Wilder smoothing seeded with the first change
+    and are NaN until a full window of bars has been seen; rolling values
+    are NaN until their first full window. VWAP is anchored at the first bar.
+
+    Parameters:
+    bars (dict): numpy arrays 'open', 'high', 'low', 'close', 'volume'
+    state (dict): State returned by the previous call, or initial_state()
+    params (IndicatorParams): Indicator parameters
+
+    Returns:
+    tuple: (dict of column name to numpy array aligned with bars, new state)
+    """
+    high, low, close, volume = bars['high'], bars['low'], bars['close'], bars['volume']
+    index = state['count'] + np.arange(close.size)
+    previous = state['smoothed']
+    smoothed = {}
+    columns = {}
+
+    # Rolling windows see the carried closes followed by the new ones
+    carried = state['closes']
+    window_closes = np.concatenate([carried, close])
+    for window in params.sma:
+        columns[f'sma_{window}'] = rolling(window_closes, window, np.mean)[carried.size:]
+
+    bb_window, bb_deviations = params.bollinger
+    middle = rolling(window_closes, bb_window, np.mean)[carried.size:]
+    deviation = rolling(window_closes, bb_window, np.std)[carried.size:]
+    columns['bb_upper'] = middle + bb_deviations * deviation
+    columns['bb_middle'] = middle
+    columns['bb_lower'] = middle - bb_deviations * deviation
+
+    def ema(key, values, window):
+        result = smooth(values, 2.0 / (window + 1), previous.get(key))
+        if result.size:
+            smoothed[key] = result[-1]
+        return result
+
+    for window in params.ema:
+        columns[f'ema_{window}'] = ema(('ema', window), close, window)
+
+    fast, slow, signal = params.macd
+    macd = ema(('macd_fast', fast), close, fast) - ema(('macd_slow', slow), close, slow)
+    macd_signal = ema(('macd_signal', fast, slow, signal), macd, signal)
+    columns['macd'] = macd
+    columns['macd_signal'] = macd_signal
+    columns['macd_histogram'] = macd - macd_signal
+
+    # Close before each bar; NaN for the very first bar of the series
+    prior_close = np.concatenate([[np.nan if state['prev_close'] is None else state['prev_close']], close])[:close.size]
+
+    def wilder(key, values, window):
+        # Smoothing starts at the first value that is not NaN
+        result = np.full(values.size, np.nan)
+        valid = ~np.isnan(values)
+        if valid.any():
+            first = int(np.argmax(valid))
+            result[first:] = smooth(values[first:], 1.0 / window, previous.get(key))
+            smoothed[key] = result[-1]
+        return result
+
+    change = close - prior_close
+    average_gain = wilder(('rsi_gain', params.rsi), np.where(change > 0, change, np.where(np.isnan(change), np.nan, 0.0)),
+                          params.rsi)
+    average_loss = wilder(('rsi_loss', params.rsi), np.where(change < 0, -change, np.where(np.isnan(change), np.nan, 0.0)),
+                          params.rsi)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = average_gain + average_loss
+        rsi = np.where(total > 0, 100.0 * average_gain / total, 50.0)
+    columns[f'rsi_{params.rsi}'] = np.where(index >= params.rsi, rsi, np.nan)
+
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prior_close), np.abs(low - prior_close)))
+    atr = wilder(('atr', params.atr), true_range, params.atr)
+    columns[f'atr_{params.atr}'] = np.where(index >= params.atr - 1, atr, np.nan)
+
+    cum_pv = state['cum_pv'] + np.cumsum((high + low + close) / 3.0 * volume)
+    cum_volume = state['cum_volume'] + np.cumsum(volume)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        columns['vwap'] = np.where(cum_volume > 0, cum_pv / cum_volume, np.nan)
+
+    # Carry as many trailing closes as the longest rolling window needs
+    carry = max(params.sma + (bb_window,)) - 1
+    new_state = {
+        'count': state['count'] + close.size,
+        'closes': window_closes[window_closes.size - carry:] if carry else np.empty(0),
+        'prev_close': float(close[-1]) if close.size else state['prev_close'],
+        'smoothed': {**previous, **smoothed},
+        'cum_pv': float(cum_pv[-1]) if close.size else state['cum_pv'],
+        'cum_volume': float(cum_volume[-1]) if close.size else state['cum_volume']
+    }
+    return columns, new_state
+
+class IndicatorSeries:
+    """
+    Computed indicators for one symbol, period and parameter set
+
+    The state kept is the one *before* the last bar, because the history
+    sync refetches the last stored bar (it may have been incomplete) and
+    can replace it. Extending recomputes that bar and appends the rest.
+    """
+
+    __slots__ = ('ts', 'interval', 'close', 'columns', 'state', 'version')
+
+    def __init__(self, ts, interval, close, columns, state, version):
+        self.ts = ts
+        self.interval = interval
+        self.close = close
+        self.columns = columns
+        self.state = state
+        self.version = version
+
+    def window(self, start_ts, last=None):
+        """
+        Get the series as JSON-ready columns
+
+        Parameters:
+        start_ts (int): Only bars at or after this time are returned
+        last (int): Only return the last this many of those bars
+
+        Returns:
+        dict: 'date', 'close' and one list per indicator; missing values are None
+        """
+        first = int(np.searchsorted(self.ts, start_ts))
+        if last is not None:
+            first = max(first, self.ts.size - last)
+
+        def values(array):
+            array = np.round(array[first:], RESPONSE_DECIMALS)
+            return np.where(np.isnan(array), None, array).tolist()
+
+        data = {'date': bar_dates(self.ts[first:], self.interval), 'close': values(self.close)}
+        data.update((name, values(array)) for name, array in self.columns.items())
+        return data
+
+def bar_dates(timestamps, interval):
+    """Format bar times the way history_frame does"""
+    date_format = '%Y-%m-%d' if interval == '1d' else '%Y-%m-%d %H:%M'
+    return [datetime.fromtimestamp(int(ts)).strftime(date_format) for ts in timestamps]
+
+class IndicatorCache:
+    """
+    Indicator series per (symbol, interval, period, parameters), extended as bars arrive
+
+    A lookup compares the stored coverage of the series with the version
+    the cached indicators were computed at. Unchanged coverage is served
+    from memory; otherwise only the bars from the last computed one onwards
+    are read and run through compute_indicators. A full computation happens
+    on the first request, or when the stored bars were replaced underneath
+    (e.g. HistoryStore.invalidate).
+
+    Series are anchored at the window start of the first computation and
+    keep extending from there, so once the window has moved on its first
+    bars are computed with some warm-up history before them.
+    """
+
+    def __init__(self, store=history_store, max_entries=INDICATOR_CACHE_ENTRIES):
+        self.store = store
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.extensions = 0
+        self.builds = 0
+
+    def get(self, symbol, start_ts, period, params=DEFAULT_PARAMS, interval='1d'):
+        """
+        Get the indicators of a series, computing only what is new
+
+        Parameters:
+        symbol (str): Normalized stock symbol
+        start_ts (int): Start of the requested window (from history_window)
+        period (str): Period name, part of the cache key
+        params (IndicatorParams): Indicator parameters
+        interval (str): Bar interval
+
+        Returns:
+        IndicatorSeries: Series covering the stored bars, or None if nothing is stored
+        """
+        key = (symbol, interval, period, params)
+        coverage = self.store.get_coverage(symbol, interval)
+        if coverage is None:
+            self.invalidate(symbol)
+            return None
+        version = (coverage['last_ts'], coverage['synced_at'])
+
+        with self._lock:
+            series = self._entries.get(key)
+            if series is not None:
+                self._entries.move_to_end(key)
+                if series.version == version:
+                    self.hits += 1
+                    return series
+
+        if series is not None:
+            extended = self._extend(series, symbol, interval, params, version)
+            if extended is not None:
+                self.extensions += 1
+                return self._store(key, extended)
+
+        bars = self.store.get_bar_arrays(symbol, interval, start_ts)
+        self.builds += 1
+        if bars['ts'].size == 0:
+            return None
+        return self._store(key, self._compute(bars, initial_state(), params, interval, version))
+
+    def get_many(self, symbols, start_ts, period, params=DEFAULT_PARAMS, interval='1d'):
+        """
+        Get indicators for several symbols
+
+        Returns:
+        dict: Mapping of symbol to IndicatorSeries; symbols without stored bars are absent
+        """
+        results = {}
+        for symbol in symbols:
+            try:
+                series = self.get(symbol, start_ts, period, params, interval)
+            except Exception as e:
+                print(f"Error computing indicators for {symbol}: {e}")
+                continue
+            if series is not None:
+                results[symbol] = series
+        return results
+
+    def _extend(self, series, symbol, interval, params, version):
+        # Re-read from the last computed bar, which the sync may have replaced
+        bars = self.store.get_bar_arrays(symbol, interval, int(series.ts[-1]))
+        if bars['ts'].size == 0 or bars['ts'][0] != series.ts[-1]:
+            # The last computed bar is gone; the stored series was rebuilt
+            return None
+        extension = self._compute(bars, series.state, params, interval, version)
+        keep = series.ts.size - 1
+        return IndicatorSeries(
+            np.concatenate([series.ts[:keep], extension.ts]),
+            series.interval,
+            np.concatenate([series.close[:keep], extension.close]),
+            {name: np.concatenate([array[:keep], extension.columns[name]]) for name, array in series.columns.items()},
+            extension.state,
+            version
+        )
+
+    @staticmethod
+    def _compute(bars, state, params, interval, version):
+        # Keep the state from before the last bar so it can be recomputed later
+        checkpoint = state
+        head_columns = {}
+        if bars['ts'].size > 1:
+            head_columns, checkpoint = compute_indicators({name: values[:-1] for name, values in bars.items()},
+                                                          state, params)
+        tail_columns, _ = compute_indicators({name: values[-1:] for name, values in bars.items()}, checkpoint, params)
+        return IndicatorSeries(
+            bars['ts'],
+            interval,
+            bars['close'],
+            {name: np.concatenate([head_columns.get(name, np.empty(0)), tail_columns[name]]) for name in tail_columns},
+            checkpoint,
+            version
+        )
+
+    def _store(self, key, series):
+        with self._lock:
+            self._entries[key] = series
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return series
+
+    def invalidate(self, symbol=None):
+        """Drop the series of one symbol, or every series when symbol is None"""
+        with self._lock:
+            for key in [key for key in self._entries if symbol is None or key[0] == symbol]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+        return {'entries': entries, 'hits': self.hits, 'extensions': self.extensions, 'builds': self.builds}
+
+# Process-wide indicator cache used by the /api/indicators routes
+indicator_cache = IndicatorCache()
+
+metrics.counter('tradex_indicator_cache_hits_total', 'Indicator lookups served without reading bars',
+                callback=lambda: indicator_cache.hits)
+metrics.counter('tradex_indicator_extensions_total', 'Indicator series extended with newly stored bars',
+                callback=lambda: indicator_cache.extensions)
+metrics.counter('tradex_indicator_builds_total', 'Indicator series computed from scratch',
+                callback=lambda: indicator_cache.builds)
@@ -0,0 +1,503 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.tax_lots import financial_year, lot_order, open_lots
+
+# SQLite file holding every user's watchlist, portfolio, sales, dividends and alerts
+LEDGER_DB_PATH = os.environ.get(
+    'TRADEX_LEDGER_DB',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'ledger.db')
+)
+
+class LedgerStore:
+    """
+    Server-side store for per-user portfolio and ledger state
+
+    Replaces the signed cookie session: the cookie only carries a user id
+    and everything else lives here. Records are stored as JSON documents in
+    tables keyed and indexed by user and symbol, so routes read and write
+    only the rows they touch.
+    """
+
+    def __init__(self, path=LEDGER_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._known_users = set()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self._create_schema(conn)
+                    self._initialized = True
+        return conn
+
+    @staticmethod
+    def _create_schema(conn):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS watchlist (
+                user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+                symbol TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                PRIMARY KEY (user_id, symbol)
+            );
+
+            CREATE TABLE IF NOT EXISTS positions (
+                user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+                symbol TEXT NOT NULL,
+                created_seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (user_id, symbol)
+            );
+            CREATE INDEX IF NOT EXISTS idx_positions_symbol ON positions(symbol);
+
+            CREATE TABLE IF NOT EXISTS sold_stocks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+                symbol TEXT NOT NULL,
+                sell_date TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sold_stocks_user_symbol ON sold_stocks(user_id, symbol);
+
+            CREATE TABLE IF NOT EXISTS tax_totals (
+                user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+                financial_year TEXT NOT NULL,
+                short_term_gain REAL NOT NULL DEFAULT 0,
+                long_term_gain REAL NOT NULL DEFAULT 0,
+                sales INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, financial_year)
+            );
+
+            CREATE TABLE IF NOT EXISTS dividends (
+                user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+                symbol TEXT NOT NULL,
+                created_seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (user_id, symbol)
+            );
+            CREATE INDEX IF NOT EXISTS idx_dividends_symbol ON dividends(symbol);
+
+            CREATE TABLE IF NOT EXISTS alerts (
+                user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+                alert_id TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                created_seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (user_id, alert_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_alerts_symbol ON alerts(symbol);
+        """)
+
+        # Sales recorded before per-year tax totals existed
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(sold_stocks)')]
+        if 'financial_year' not in columns:
+            conn.execute('ALTER TABLE sold_stocks ADD COLUMN financial_year TEXT')
+            rows = conn.execute('SELECT id, user_id, data FROM sold_stocks').fetchall()
+            for row_id, user_id, data in rows:
+                record = json.loads(data)
+                try:
+                    record['financial_year'] = financial_year(record.get('sell_date'))
+                except (TypeError, ValueError):
+                    record['financial_year'] = None
+                conn.execute(
+                    'UPDATE sold_stocks SET financial_year = ?, data = ? WHERE id = ?',
+                    (record['financial_year'], json.dumps(record), row_id)
+                )
+                if record['financial_year']:
+                    LedgerStore._add_tax_totals(conn, user_id, [record])
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_sold_stocks_user_year ON sold_stocks(user_id, financial_year)'
+        )
+        conn.commit()
+
+    def _iter_documents(self, sql, params):
+        """Yield the JSON documents selected by a query one row at a time"""
+        for row in self._connect().execute(sql, params):
+            yield json.loads(row[0])
+
+    @staticmethod
+    def _next_seq(conn, table, user_id):
+        row = conn.execute(f'SELECT COALESCE(MAX(created_seq), 0) + 1 FROM {table} WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0]
+
+    # Users
+
+    def ensure_user(self, user_id, default_watchlist=()):
+        """Create a user with a default watchlist if it does not exist yet"""
+        if user_id in self._known_users:
+            return
+        conn = self._connect()
+        with conn:
+            created = conn.execute(
+                'INSERT OR IGNORE INTO users (user_id, created_at) VALUES (?, ?)', (user_id, time.time())
+            ).rowcount
+            if created:
+                conn.executemany(
+                    'INSERT INTO watchlist (user_id, symbol, position) VALUES (?, ?, ?)',
+                    [(user_id, symbol, i) for i, symbol in enumerate(default_watchlist)]
+                )
+        self._known_users.add(user_id)
+
+    def import_session(self, user_id, legacy):
+        """
+        Import the state an old cookie session carried, in one transaction
+
+        Parameters:
+        user_id (str): User the session now belongs to
+        legacy (dict): Any of 'stocks' (watchlist), 'portfolio', 'sold_stocks',
+                       'dividends' and 'alerts' as the cookie stored them
+
+        Returns:
+        list: The imported alerts
+        """
+        positions = {}
+        for position in legacy.get('portfolio') or []:
+            merged = positions.get(position['symbol'])
+            if merged is None:
+                positions[position['symbol']] = dict(position)
+                continue
+            # Old sessions could hold the same symbol twice; fold the duplicates together
+            quantity = merged['quantity'] + position['quantity']
+            if quantity:
+                merged['buy_price'] = (
+                    merged['quantity'] * merged['buy_price'] + position['quantity'] * position['buy_price']
+                ) / quantity
+            merged['lots'] = sorted(open_lots(merged) + open_lots(position), key=lot_order)
+            merged['quantity'] = quantity
+            merged['transaction_history'] = merged.get('transaction_history', []) + position.get('transaction_history', [])
+
+        sales = []
+        for record in legacy.get('sold_stocks') or []:
+            try:
+                record.setdefault('financial_year', financial_year(record['sell_date']))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 'profit_loss' in record:
+                sales.append(record)
+
+        alerts = [a for a in legacy.get('alerts') or [] if 'id' in a and 'symbol' in a]
+        conn = self._connect()
+        with conn:
+            if legacy.get('stocks') is not None:
+                conn.execute('DELETE FROM watchlist WHERE user_id = ?', (user_id,))
+                conn.executemany(
+                    'INSERT OR IGNORE INTO watchlist (user_id, symbol, position) VALUES (?, ?, ?)',
+                    [(user_id, symbol, i) for i, symbol in enumerate(legacy['stocks'])]
+                )
+            for position in positions.values():
+                conn.execute(
+                    'INSERT OR REPLACE INTO positions (user_id, symbol, created_seq, data) VALUES (?, ?, ?, ?)',
+                    (user_id, position['symbol'], self._next_seq(conn, 'positions', user_id), json.dumps(position))
+                )
+            self._insert_sales(conn, user_id, sales)
+            for entry in legacy.get('dividends') or []:
+                conn.execute(
+                    'INSERT OR REPLACE INTO dividends (user_id, symbol, created_seq, data) VALUES (?, ?, ?, ?)',
+                    (user_id, entry['symbol'], self._next_seq(conn, 'dividends', user_id), json.dumps(entry, default=str))
+                )
+            for alert in alerts:
+                conn.execute(
+                    'INSERT OR REPLACE INTO alerts (user_id, alert_id, symbol, created_seq, data) VALUES (?, ?, ?, ?, ?)',
+                    (user_id, alert['id'], alert['symbol'], self._next_seq(conn, 'alerts', user_id), json.dumps(alert))
+                )
+        return alerts
+
+    # Watchlist
+
+    def get_watchlist(self, user_id):
+        rows = self._connect().execute(
+            'SELECT symbol FROM watchlist WHERE user_id = ? ORDER BY position', (user_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def set_watchlist(self, user_id, symbols):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM watchlist WHERE user_id = ?', (user_id,))
+            conn.executemany(
+                'INSERT OR IGNORE INTO watchlist (user_id, symbol, position) VALUES (?, ?, ?)',
+                [(user_id, symbol, i) for i, symbol in enumerate(symbols)]
+            )
+
+    def add_to_watchlist(self, user_id, symbol):
+        conn = self._connect()
+        with conn:
+            position = conn.execute(
+                'SELECT COALESCE(MAX(position), -1) + 1 FROM watchlist WHERE user_id = ?', (user_id,)
+            ).fetchone()[0]
+            return conn.execute(
+                'INSERT OR IGNORE INTO watchlist (user_id, symbol, position) VALUES (?, ?, ?)',
+                (user_id, symbol, position)
+            ).rowcount > 0
+
+    def remove_from_watchlist(self, user_id, symbol):
+        conn = self._connect()
+        with conn:
+            return conn.execute(
+                'DELETE FROM watchlist WHERE user_id = ? AND symbol = ?', (user_id, symbol)
+            ).rowcount > 0
+
+    # Portfolio positions
+
+    def get_portfolio(self, user_id):
+        return list(self.iter_portfolio(user_id))
+
+    def iter_portfolio(self, user_id):
+        return self._iter_documents('SELECT data FROM positions WHERE user_id = ? ORDER BY created_seq', (user_id,))
+
+    def get_position_symbols(self, user_id):
+        rows = self._connect().execute(
+            'SELECT symbol FROM positions WHERE user_id = ? ORDER BY created_seq', (user_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_position(self, user_id, symbol):
+        row = self._connect().execute(
+            'SELECT data FROM positions WHERE user_id = ? AND symbol = ?', (user_id, symbol)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_position(self, user_id, symbol, update):
+        """
+        Read, check and write a position in one write transaction
+
+        BEGIN IMMEDIATE takes SQLite's write lock before the position is
+        read, so concurrent buys and sells of the same holding run one after
+        the other instead of overwriting each other's result.
+
+        Parameters:
+        user_id (str): User id
+        symbol (str): Position symbol
+        update (callable): Called with the stored position (None if there is
+                           none); returns (position, sales, result). The
+                           position is inserted or updated, or deleted when
+                           its quantity is 0; None leaves it untouched. Sales
+                           are sold stock records to store with it
+
+        Returns:
+        The result returned by update
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT data FROM positions WHERE user_id = ? AND symbol = ?', (user_id, symbol)
+            ).fetchone()
+            position, sales, result = update(json.loads(row[0]) if row else None)
+            if sales:
+                self._insert_sales(conn, user_id, sales)
+            if position is None:
+                return result
+            if position['quantity'] <= 0:
+                conn.execute('DELETE FROM positions WHERE user_id = ? AND symbol = ?', (user_id, symbol))
+            elif row:
+                conn.execute(
+                    'UPDATE positions SET data = ? WHERE user_id = ? AND symbol = ?',
+                    (json.dumps(position), user_id, symbol)
+                )
+            else:
+                conn.execute(
+                    'INSERT INTO positions (user_id, symbol, created_seq, data) VALUES (?, ?, ?, ?)',
+                    (user_id, symbol, self._next_seq(conn, 'positions', user_id), json.dumps(position))
+                )
+        return result
+
+    # Sold stocks
+
+    def get_sold_stocks(self, user_id, financial_year=None):
+        """Get sold stock records, optionally only those of one financial year"""
+        return list(self.iter_sold_stocks(user_id, financial_year))
+
+    def iter_sold_stocks(self, user_id, financial_year=None):
+        if financial_year is None:
+            return self._iter_documents('SELECT data FROM sold_stocks WHERE user_id = ? ORDER BY id', (user_id,))
+        return self._iter_documents(
+            'SELECT data FROM sold_stocks WHERE user_id = ? AND financial_year = ? ORDER BY id',
+            (user_id, financial_year)
+        )
+
+    @classmethod
+    def _insert_sales(cls, conn, user_id, records):
+        for record in records:
+            record.setdefault('financial_year', financial_year(record['sell_date']))
+        conn.executemany(
+            'INSERT INTO sold_stocks (user_id, symbol, sell_date, financial_year, data) VALUES (?, ?, ?, ?, ?)',
+            [(user_id, r['symbol'], r.get('sell_date'), r['financial_year'], json.dumps(r)) for r in records]
+        )
+        cls._add_tax_totals(conn, user_id, records)
+
+    @staticmethod
+    def _add_tax_totals(conn, user_id, records):
+        conn.executemany(
+            """
+            INSERT INTO tax_totals (user_id, financial_year, short_term_gain, long_term_gain, sales)
+            VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT (user_id, financial_year) DO UPDATE SET
+                short_term_gain = short_term_gain + excluded.short_term_gain,
+                long_term_gain = long_term_gain + excluded.long_term_gain,
+                sales = sales + 1
+            """,
+            [
+                (
+                    user_id, r['financial_year'],
+                    r['profit_loss'] if r.get('tax_category') != 'long_term' else 0,
+                    r['profit_loss'] if r.get('tax_category') == 'long_term' else 0
+                )
+                for r in records
+            ]
+        )
+
+    def get_tax_totals(self, user_id, financial_year):
+        """
+        Get running realized gains for one financial year
+
+        Returns:
+        dict: 'short_term_gain', 'long_term_gain' and 'sales' (number of realized lots)
+        """
+        row = self._connect().execute(
+            'SELECT short_term_gain, long_term_gain, sales FROM tax_totals WHERE user_id = ? AND financial_year = ?',
+            (user_id, financial_year)
+        ).fetchone()
+        short_term, long_term, sales = row or (0, 0, 0)
+        return {'short_term_gain': short_term, 'long_term_gain': long_term, 'sales': sales}
+
+    # Dividends
+
+    def get_dividends(self, user_id):
+        return list(self.iter_dividends(user_id))
+
+    def iter_dividends(self, user_id):
+        return self._iter_documents('SELECT data FROM dividends WHERE user_id = ? ORDER BY created_seq', (user_id,))
+
+    def save_dividend(self, user_id, entry):
+        """Insert or update the dividend entry for a symbol"""
+        conn = self._connect()
+        with conn:
+            updated = conn.execute(
+                'UPDATE dividends SET data = ? WHERE user_id = ? AND symbol = ?',
+                (json.dumps(entry, default=str), user_id, entry['symbol'])
+            ).rowcount
+            if not updated:
+                conn.execute(
+                    'INSERT INTO dividends (user_id, symbol, created_seq, data) VALUES (?, ?, ?, ?)',
+                    (user_id, entry['symbol'], self._next_seq(conn, 'dividends', user_id), json.dumps(entry, default=str))
+                )
+
+    # Alerts
+
+    def get_alerts(self, user_id):
+        rows = self._connect().execute(
+            'SELECT data FROM alerts WHERE user_id = ? ORDER BY created_seq', (user_id,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def save_alert(self, user_id, alert):
+        """Insert or update an alert by its id"""
+        conn = self._connect()
+        with conn:
+            updated = conn.execute(
+                'UPDATE alerts SET data = ? WHERE user_id = ? AND alert_id = ?',
+                (json.dumps(alert), user_id, alert['id'])
+            ).rowcount
+            if not updated:
+                conn.execute(
+                    'INSERT INTO alerts (user_id, alert_id, symbol, created_seq, data) VALUES (?, ?, ?, ?, ?)',
+                    (user_id, alert['id'], alert['symbol'], self._next_seq(conn, 'alerts', user_id), json.dumps(alert))
+                )
+
+    def mark_alerts_triggered(self, triggered):
+        """
+        Store alerts that fired, unless they are already marked triggered
+
+        Every worker process indexes the same alerts, so one price move can
+        trigger an alert in several of them; only the first write wins.
+
+        Parameters:
+        triggered (list): (user_id, alert) pairs
+
+        Returns:
+        list: The pairs marked triggered by this call
+        """
+        conn = self._connect()
+        marked = []
+        with conn:
+            for user_id, alert in triggered:
+                updated = conn.execute(
+                    """
+                    UPDATE alerts SET data = ?
+                    WHERE user_id = ? AND alert_id = ? AND NOT COALESCE(json_extract(data, '$.triggered'), 0)
+                    """,
+                    (json.dumps(alert), user_id, alert['id'])
+                ).rowcount
+                if updated:
+                    marked.append((user_id, alert))
+        return marked
+
+    def take_triggered_alerts(self, user_id):
+        """
+        Get a user's triggered alerts that were not delivered yet and mark them delivered
+
+        Each alert is claimed with a conditional update, so it is delivered
+        once even when several worker processes check the same user's alerts.
+        """
+        conn = self._connect()
+        delivered = []
+        with conn:
+            rows = conn.execute(
+                """
+                SELECT data FROM alerts
+                WHERE user_id = ? AND COALESCE(json_extract(data, '$.triggered'), 0)
+                AND NOT COALESCE(json_extract(data, '$.delivered'), 0)
+                ORDER BY created_seq
+                """,
+                (user_id,)
+            ).fetchall()
+            for (data,) in rows:
+                alert = json.loads(data)
+                alert['delivered'] = True
+                updated = conn.execute(
+                    """
+                    UPDATE alerts SET data = ?
+                    WHERE user_id = ? AND alert_id = ? AND NOT COALESCE(json_extract(data, '$.delivered'), 0)
+                    """,
+                    (json.dumps(alert), user_id, alert['id'])
+                ).rowcount
+                if updated:
+                    delivered.append(alert)
+        return delivered
+
+    def iter_all_alerts(self):
+        """Yield (user_id, alert) for every stored alert across all users"""
+        rows = self._connect().execute('SELECT user_id, data FROM alerts ORDER BY symbol').fetchall()
+        for user_id, data in rows:
+            yield user_id, json.loads(data)
+
+    def delete_alert(self, user_id, alert_id):
+        conn = self._connect()
+        with conn:
+            return conn.execute(
+                'DELETE FROM alerts WHERE user_id = ? AND alert_id = ?', (user_id, alert_id)
+            ).rowcount > 0
+
+# Process-wide store used by the Flask routes
+ledger = LedgerStore()
@@ -0,0 +1,288 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from utils.metrics import metrics
+from utils.stock_data import get_stocks_data, normalize_symbol, sort_by_market_cap
+
+# Seconds between background refreshes
+POLL_INTERVAL = 30
+
+# Symbols nobody has asked for within this many seconds stop being refreshed
+SYMBOL_IDLE_EXPIRY = 3600
+
+# Number of past snapshot versions whose changes are kept for stream resumption
+CHANGE_LOG_SIZE = 256
+
+# Quote fields compared to decide whether a quote changed between snapshots
+CHANGE_FIELDS = ('price', 'change', 'change_percent', 'volume', 'day_high', 'day_low')
+
+class MarketSnapshot:
+    """Immutable view of the latest quotes. Replaced as a whole, never mutated."""
+
+    __slots__ = ('version', 'timestamp', 'quotes', 'versions')
+
+    def __init__(self, version, timestamp, quotes, versions=None):
+        self.version = version
+        self.timestamp = timestamp
+        self.quotes = quotes
+        # Snapshot version in which each symbol's quote last changed
+        self.versions = versions or {}
+
+    def get_quotes(self, symbols):
+        """Get quotes for the given symbols sorted by market cap, skipping those not in the snapshot"""
+        symbols = dict.fromkeys(normalize_symbol(s) for s in symbols)
+        return sort_by_market_cap([self.quotes[s] for s in symbols if s in self.quotes])
+
+    def changed_version(self, symbols):
+        """Latest snapshot version in which any of the given symbols changed; 0 if none is present"""
+        return max((self.versions.get(normalize_symbol(s), 0) for s in symbols), default=0)
+
+    def formatted_timestamp(self):
+        if not self.timestamp:
+            return None
+        return datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+class MarketDataPoller:
+    """
+    Background refresher for every symbol the app has been asked about
+
+    Routes register the symbols they see (watchlists, portfolios, alerts)
+    with track(). A daemon thread refreshes the union of tracked symbols
+    every `interval` seconds and publishes the result as a new
+    MarketSnapshot by swapping a single reference, so readers never see a
+    half-written snapshot and never wait on upstream.
+    """
+
+    def __init__(self, interval=POLL_INTERVAL, idle_expiry=SYMBOL_IDLE_EXPIRY, fetch=get_stocks_data):
+        self.interval = interval
+        self.idle_expiry = idle_expiry
+        self._fetch = fetch
+        self._tracked = {}
+        self._tracked_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._snapshot = MarketSnapshot(0, None, {})
+        self._quote_times = {}
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)
+        self._published = threading.Condition()
+        self._listeners = []
+        self._symbol_sources = []
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def track(self, symbols):
+        """Register symbols to be kept fresh"""
+        now = time.monotonic()
+        with self._tracked_lock:
+            for symbol in symbols:
+                self._tracked[normalize_symbol(symbol)] = now
+
+    def tracked_symbols(self):
+        """Get the tracked symbols, dropping those idle past the expiry"""
+        cutoff = time.monotonic() - self.idle_expiry
+        with self._tracked_lock:
+            for symbol in [s for s, seen in self._tracked.items() if seen < cutoff]:
+                del self._tracked[symbol]
+            symbols = dict.fromkeys(self._tracked)
+
+        for source in list(self._symbol_sources):
+            try:
+                symbols.update(dict.fromkeys(source()))
+            except Exception as e:
+                print(f"Error reading poller symbol source: {e}")
+        return list(symbols)
+
+    def add_symbol_source(self, source):
+        """Always refresh the symbols returned by source(), regardless of idle expiry"""
+        if source not in self._symbol_sources:
+            self._symbol_sources.append(source)
+
+    def get_snapshot(self, symbols):
+        """
+        Get a snapshot covering the given symbols
+
+        Symbols that have never been fetched are fetched once synchronously so
+        a first request is not empty; after that, reads are served from memory
+        only. Only symbols with a valid quote are tracked for future refreshes,
+        so unknown symbols do not stay in the poll set.
+
+        Parameters:
+        symbols (list): Stock symbols
+
+        Returns:
+        MarketSnapshot: Snapshot that contains every symbol that could be fetched
+        """
+        symbols = [normalize_symbol(s) for s in symbols]
+        self.ensure_started()
+
+        snapshot = self._snapshot
+        missing = [s for s in symbols if s not in snapshot.quotes]
+        if missing:
+            self._publish(missing)
+            snapshot = self._snapshot
+        self.track([s for s in symbols if s in snapshot.quotes])
+        return snapshot
+
+    def refresh(self):
+        """Refresh every tracked symbol now"""
+        symbols = self.tracked_symbols()
+        self._evict(symbols)
+        if symbols:
+            self._publish(symbols, use_cache=False)
+
+    def _evict(self, tracked):
+        """Drop quotes for symbols that no session tracks any more"""
+        tracked = set(tracked)
+        with self._write_lock:
+            current = self._snapshot
+            idle = [symbol for symbol in current.quotes if symbol not in tracked]
+            if not idle:
+                return
+            for symbol in idle:
+                self._quote_times.pop(symbol, None)
+            # Nobody reads these symbols, so the version stays and no change is announced
+            self._snapshot = MarketSnapshot(
+                current.version, current.timestamp,
+                {s: q for s, q in current.quotes.items() if s in tracked},
+                {s: v for s, v in current.versions.items() if s in tracked}
+            )
+
+    def _publish(self, symbols, use_cache=True):
+        quotes = self._fetch(symbols, use_cache=use_cache)
+        with self._write_lock:
+            current = self._snapshot
+            merged = dict(current.quotes)
+            versions = dict(current.versions)
+            changed = {}
+            now = time.time()
+            for quote in quotes:
+                symbol = quote.symbol
+                # A failed fetch keeps the last good quote; a symbol that never
+                # had one stays out of the snapshot
+                if quote.error:
+                    continue
+                self._quote_times[symbol] = now
+                previous = merged.get(symbol)
+                # An unchanged quote keeps its existing record, so readers can
+                # tell from versions whether anything they showed is outdated
+                if previous is None or any(getattr(previous, f) != getattr(quote, f) for f in CHANGE_FIELDS):
+                    changed[symbol] = quote
+                    merged[symbol] = quote
+                    versions[symbol] = current.version + 1
+            # Nothing new: keep the current version so clients' ETags and
+            # stream positions stay valid
+            if not changed:
+                return
+            snapshot = MarketSnapshot(current.version + 1, now, merged, versions)
+            self._snapshot = snapshot
+            self._changes.append((snapshot.version, snapshot.timestamp, changed))
+
+        with self._published:
+            self._published.notify_all()
+
+        for listener in list(self._listeners):
+            try:
+                listener(list(changed.values()))
+            except Exception as e:
+                print(f"Error in market data listener: {e}")
+
+    def quote_ages(self):
+        """Get seconds since each symbol in the snapshot was last successfully fetched"""
+        now = time.time()
+        return {symbol: now - fetched for symbol, fetched in list(self._quote_times.items())}
+
+    def add_listener(self, listener):
+        """Call listener(quotes) with the changed quotes whenever a snapshot is published"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def changes_since(self, version, symbols=None):
+        """
+        Get the quotes that changed after a snapshot version
+
+        Parameters:
+        version (int): Last snapshot version the caller has seen
+        symbols (set): Only report these symbols. None reports all
+
+        Returns:
+        tuple: (latest version, list of changed quotes), or None if the version
+        is too old to be answered from the change log or was never published
+        by this process (after a restart, or from another worker)
+        """
+        changes = list(self._changes)
+        latest = changes[-1][0] if changes else self._snapshot.version
+        if version > latest:
+            return None
+        if version == latest:
+            return latest, []
+        if not changes or changes[0][0] > version + 1:
+            return None
+
+        changed = {}
+        for change_version, _, quotes in changes:
+            if version < change_version <= latest:
+                changed.update(quotes)
+        if symbols is not None:
+            changed = {s: q for s, q in changed.items() if s in symbols}
+        return latest, sort_by_market_cap(list(changed.values()))
+
+    def wait_for_update(self, version, timeout):
+        """Block until a snapshot newer than version is published or the timeout passes"""
+        with self._published:
+            return self._published.wait_for(lambda: self._snapshot.version > version, timeout)
+
+    def ensure_started(self):
+        """Start the background thread if it is not running"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._write_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='market-data-poller', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        """Trigger a refresh without waiting for the next interval"""
+        self._wake.set()
+
+    def _run(self):
+        # The first request fills the snapshot on demand, so wait one interval first
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing market data: {e}")
+
+# Process-wide poller used by the Flask routes
+market_poller = MarketDataPoller()
+
+metrics.gauge('tradex_snapshot_version', 'Version of the published market snapshot',
+              callback=lambda: market_poller.snapshot.version)
+metrics.gauge('tradex_snapshot_age_seconds', 'Seconds since the market snapshot was last published',
+              callback=lambda: time.time() - market_poller.snapshot.timestamp if market_poller.snapshot.timestamp else 0)
+metrics.gauge('tradex_tracked_symbols', 'Symbols refreshed by the background poller',
+              callback=lambda: len(market_poller.tracked_symbols()))
+metrics.gauge('tradex_quote_age_max_seconds', 'Age of the stalest quote in the market snapshot',
+              callback=lambda: max(market_poller.quote_ages().values(), default=0))
+
+def _mean_quote_age():
+    ages = list(market_poller.quote_ages().values())
+    return sum(ages) / len(ages) if ages else 0
+
+metrics.gauge('tradex_quote_age_mean_seconds', 'Mean age of the quotes in the market snapshot',
+              callback=_mean_quote_age)
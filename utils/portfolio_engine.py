@@ -0,0 +1,128 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.metrics import in_current_context
+from utils.stock_data import MAX_FETCH_WORKERS, get_stock_history, normalize_symbol
+
+def get_histories(symbols, period='1y', max_workers=None):
+    """
+    Fetch price histories for several symbols concurrently
+
+    Parameters:
+    symbols (list): Stock symbols
+    period (str): History period passed to get_stock_history
+    max_workers (int): Maximum concurrent fetches. Defaults to MAX_FETCH_WORKERS
+
+    Returns:
+    dict: Mapping of symbol to history DataFrame. Failed symbols are omitted
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+
+    def fetch(symbol):
+        try:
+            return get_stock_history(symbol, period)
+        except Exception as e:
+            print(f"Error getting history for {symbol}: {e}")
+            return None
+
+    workers = max(1, min(max_workers or MAX_FETCH_WORKERS, len(symbols)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(in_current_context(fetch), symbols)
+
+    return {symbol: history for symbol, history in zip(symbols, results)
+            if history is not None and not history.empty}
+
+def build_price_matrix(histories):
+    """
+    Align close prices into a date x symbol matrix
+
+    Dates missing for one symbol (holidays, suspensions, late listings) are
+    forward-filled from its previous close. Dates before a symbol's first
+    bar stay NaN.
+
+    Parameters:
+    histories (dict): Mapping of symbol to history DataFrame with Date and Close
+
+    Returns:
+    pandas.DataFrame: Close prices indexed by date string, one column per symbol
+    """
+    if not histories:
+        return pd.DataFrame()
+
+    closes = []
+    for symbol, history in histories.items():
+        series = pd.Series(history['Close'].to_numpy(dtype=float), index=history['Date'].to_numpy(), name=symbol)
+        closes.append(series[~series.index.duplicated(keep='last')])
+
+    matrix = pd.concat(closes, axis=1).sort_index()
+    return matrix.ffill()
+
+def compute_portfolio_history(positions, period='1y', histories=None):
+    """
+    Compute the portfolio value time series and performance metrics
+
+    Parameters:
+    positions (list): Portfolio entries with 'symbol' and 'quantity'
+    period (str): History period
+    histories (dict): Pre-fetched histories by symbol. Fetched when None
+
+    Returns:
+    dict: 'history' (list of date/value/daily_return/drawdown points) and 'metrics'
+    """
+    quantities = {}
+    for position in positions:
+        symbol = normalize_symbol(position['symbol'])
+        quantities[symbol] = quantities.get(symbol, 0) + position['quantity']
+
+    if histories is None:
+        histories = get_histories(list(quantities), period)
+    matrix = build_price_matrix(histories)
+
+    if matrix.empty:
+        return {
+            'history': [],
+            'metrics': {
+                'current_value': 0,
+                'initial_value': 0,
+                'value_change': 0,
+                'percent_change': 0,
+                'max_drawdown': 0
+            }
+        }
+
+    weights = np.array([quantities[symbol] for symbol in matrix.columns], dtype=float)
+    prices = matrix.to_numpy(dtype=float)
+    # Symbols without a bar yet on a date contribute nothing on that date
+    values = np.nan_to_num(prices, nan=0.0) @ weights
+
+    previous = np.concatenate(([values[0]], values[:-1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily_returns = np.where(previous > 0, values / previous - 1, 0.0)
+        running_max = np.maximum.accumulate(values)
+        drawdowns = np.where(running_max > 0, (running_max - values) / running_max, 0.0)
+
+    initial_value = float(values[0])
+    current_value = float(values[-1])
+    value_change = current_value - initial_value
+
+    history = [
+        {'date': date, 'value': value, 'daily_return': daily_return * 100, 'drawdown': drawdown * 100}
+        for date, value, daily_return, drawdown in zip(
+            matrix.index.tolist(), values.tolist(), daily_returns.tolist(), drawdowns.tolist()
+        )
+    ]
+
+    return {
+        'history': history,
+        'metrics': {
+            'current_value': current_value,
+            'initial_value': initial_value,
+            'value_change': value_change,
+            'percent_change': (value_change / initial_value * 100) if initial_value > 0 else 0,
+            'max_drawdown': float(drawdowns.max()) * 100
+        }
+    }
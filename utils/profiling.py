@@ -0,0 +1,233 @@
+import cProfile
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+
+# Directory where CPU profiles (.prof, pstats format) and memory snapshots are written
+PROFILE_DIR = os.environ.get(
+    'TRADEX_PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'profiles')
+)
+
+# Profiling hooks are off unless TRADEX_PROFILING=1
+PROFILING_ENABLED = os.environ.get('TRADEX_PROFILING') == '1'
+
+# Fraction of requests profiled without being asked, between 0 and 1
+PROFILE_SAMPLE_RATE = float(os.environ.get('TRADEX_PROFILE_SAMPLE_RATE', '0'))
+
+# When set, the X-Profile header must carry this value to trigger a profile
+PROFILE_TOKEN = os.environ.get('TRADEX_PROFILE_TOKEN')
+
+# Functions listed in the X-Profile-Top response header
+PROFILE_TOP_FUNCTIONS = 5
+
+# Frames kept per allocation when tracemalloc is started by the memory endpoints
+TRACEMALLOC_FRAMES = 10
+
+class RequestProfiler:
+    """
+    Opt-in cProfile capture for single requests
+
+    A request is profiled when it sends the X-Profile header (matching the
+    token, if one is configured) or when it falls in the sampled fraction
+    of traffic. Each profile is dumped in pstats format, readable by
+    `python -m pstats` or snakeviz, and summarized in response headers.
+
+    Only one request is profiled at a time. cProfile sees one thread per
+    profiler: async views run on an event loop thread, which is profiled
+    separately with attach() and merged into the request's profile. Fetch
+    thread pools the request fans out to are not profiled.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, enabled=PROFILING_ENABLED, sample_rate=PROFILE_SAMPLE_RATE,
+                 token=PROFILE_TOKEN, top=PROFILE_TOP_FUNCTIONS):
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.token = token
+        self.top = top
+        self._busy = threading.Lock()
+
+    def configure(self, directory=None, enabled=None, sample_rate=None, token=None):
+        if directory is not None:
+            self.directory = directory
+        if enabled is not None:
+            self.enabled = enabled
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if token is not None:
+            self.token = token
+
+    def wants(self, header_value):
+        """Whether a request with this X-Profile header value should be profiled"""
+        if not self.enabled:
+            return False
+        if header_value:
+            return self.token is None or header_value == self.token
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        """
+        Start profiling the current thread
+
+        Returns:
+        cProfile.Profile: The running profiler, or None if another request is being profiled
+        """
+        if not self._busy.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            self._busy.release()
+            return None
+        return profiler
+
+    def attach(self):
+        """
+        Profile the current thread as part of a request already being profiled
+
+        The caller disables the returned profiler on this same thread and
+        passes it to finish() along with the request's profiler.
+
+        Returns:
+        cProfile.Profile: The running profiler, or None if profiling could not start
+        """
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return None
+        return profiler
+
+    def finish(self, profiler, label, thread_profilers=()):
+        """
+        Stop a profile, write it to the profile directory and summarize it
+
+        Parameters:
+        profiler (cProfile.Profile): Profiler returned by start()
+        label (str): Route or description used in the file name
+        thread_profilers (list): Stopped profilers from attach(), merged into the profile
+
+        Returns:
+        dict: 'file' (path of the .prof file), 'total' (seconds) and 'top'
+        (list of (function, cumulative seconds) pairs)
+        """
+        try:
+            profiler.disable()
+        finally:
+            self._busy.release()
+
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_') or 'request'
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{uuid.uuid4().hex[:8]}.prof")
+        stats = pstats.Stats(profiler)
+        for thread_profiler in thread_profilers:
+            stats.add(thread_profiler)
+        stats.dump_stats(path)
+
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        top = []
+        for (filename, line, name), (_, _, _, cumulative, _) in rows:
+            if filename == '~' or name.startswith('<'):
+                continue
+            top.append((f"{name} ({os.path.basename(filename)}:{line})", cumulative))
+            if len(top) >= self.top:
+                break
+        return {'file': path, 'total': stats.total_tt, 'top': top}
+
+    @staticmethod
+    def header_summary(top):
+        """Format the top functions for a single ASCII response header"""
+        return '; '.join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in top).encode('ascii', 'replace').decode()
+
+class MemoryTracker:
+    """
+    tracemalloc snapshots with a diff against a stored baseline
+
+    Tracing starts on the first snapshot, so there is no overhead until
+    someone asks for it.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, frames=TRACEMALLOC_FRAMES):
+        self.directory = directory
+        self.frames = frames
+        self._lock = threading.Lock()
+        self._baseline = None
+
+    def snapshot(self, limit=20):
+        """
+        Take a snapshot, store it as the new baseline and write it to disk
+
+        Returns:
+        dict: 'file', 'traced_bytes', 'peak_bytes' and the top allocation sites
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            snapshot = self._take()
+            self._baseline = snapshot
+
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.tracemalloc")
+            snapshot.dump(path)
+
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'file': path,
+            'traced_bytes': current,
+            'peak_bytes': peak,
+            'top': [
+                {'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:limit]
+            ]
+        }
+
+    def diff(self, limit=20):
+        """
+        Compare the current allocations with the baseline snapshot
+
+        Returns:
+        dict: Growth per allocation site, largest first, or None without a baseline
+        """
+        with self._lock:
+            if self._baseline is None or not tracemalloc.is_tracing():
+                return None
+            current = self._take()
+            differences = current.compare_to(self._baseline, 'lineno')
+
+        return {
+            'traced_bytes': tracemalloc.get_traced_memory()[0],
+            'top': [
+                {
+                    'location': str(stat.traceback),
+                    'size_diff_bytes': stat.size_diff,
+                    'size_bytes': stat.size,
+                    'count_diff': stat.count_diff
+                }
+                for stat in differences[:limit]
+            ]
+        }
+
+    def stop(self):
+        with self._lock:
+            self._baseline = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    @staticmethod
+    def _take():
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>')
+        ])
+
+# Process-wide profiling hooks used by the Flask routes
+request_profiler = RequestProfiler()
+memory_tracker = MemoryTracker()
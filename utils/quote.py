@@ -0,0 +1,101 @@
+import numpy as np
+
+class Quote:
+    """
+    Compact, immutable quote record
+
+    Numeric fields are floats (volume an int) or None when missing, so
+    aggregation code can test `is None` or work on columns() arrays
+    instead of checking for string sentinels. Change, trend and the
+    display strings are derived on access; nothing is pre-rendered.
+
+    Records are shared between caches, snapshots and requests and must not
+    be modified after construction.
+    """
+
+    __slots__ = ('symbol', 'name', 'price', 'previous_close', 'volume', 'day_high', 'day_low', 'market_cap',
+                 'sector', 'error')
+
+    def __init__(self, symbol, name, price=None, previous_close=None, volume=None, day_high=None, day_low=None,
+                 market_cap=None, sector='Unknown', error=False):
+        self.symbol = symbol
+        self.name = name
+        self.price = price
+        self.previous_close = previous_close
+        self.volume = volume
+        self.day_high = day_high
+        self.day_low = day_low
+        self.market_cap = market_cap
+        self.sector = sector
+        self.error = error
+
+    @property
+    def change(self):
+        if self.price is None or self.previous_close is None:
+            return None
+        return self.price - self.previous_close
+
+    @property
+    def change_percent(self):
+        change = self.change
+        if change is None or not self.previous_close:
+            return None
+        return change / self.previous_close * 100
+
+    @property
+    def trend(self):
+        change = self.change
+        if change is None or change == 0:
+            return 'neutral'
+        return 'up' if change > 0 else 'down'
+
+    @property
+    def formatted(self):
+        """Display strings for the price fields, rendered on demand"""
+        change = self.change
+        change_percent = self.change_percent
+        return {
+            'price': f"₹{self.price:.2f}" if self.price is not None else ('Error' if self.error else 'N/A'),
+            'change': f"{change:+.2f}" if change is not None else 'N/A',
+            'change_percent': f"{change_percent:+.2f}%" if change_percent is not None else 'N/A',
+            'market_cap': f"₹{self.market_cap/10000000:.2f}Cr" if self.market_cap is not None else 'N/A',
+            'volume': f"{self.volume:,}" if self.volume is not None else 'N/A'
+        }
+
+    def to_dict(self):
+        """Get the JSON representation sent to the browser"""
+        return {
+            'symbol': self.symbol,
+            'name': self.name,
+            'price': self.price,
+            'previous_close': self.previous_close,
+            'change': self.change,
+            'change_percent': self.change_percent,
+            'volume': self.volume,
+            'market_cap': self.market_cap,
+            'sector': self.sector,
+            'day_high': self.day_high,
+            'day_low': self.day_low,
+            'trend': self.trend,
+            'error': self.error,
+            'formatted': self.formatted
+        }
+
+    def __repr__(self):
+        return f"Quote({self.symbol!r}, price={self.price!r})"
+
+def quote_columns(quotes, *fields):
+    """
+    Get numeric quote fields as float arrays, NaN where missing
+
+    Parameters:
+    quotes (list): Quote records
+    fields (str): Field or property names, e.g. 'price', 'market_cap', 'change'
+
+    Returns:
+    tuple: One numpy array per field, aligned with quotes
+    """
+    return tuple(
+        np.array([getattr(quote, field) for quote in quotes], dtype=float)
+        for field in fields
+    )
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+
+from utils.metrics import metrics
+
+# Seconds a cached quote is considered fresh
+DEFAULT_TTL = 15
+
+# Maximum number of symbols kept in the cache before the least recently used is evicted
+DEFAULT_MAX_ENTRIES = 1000
+
+class QuoteCache:
+    """
+    Thread-safe in-process quote cache with a TTL and an LRU size bound
+
+    A single instance is shared by every request and session in the process,
+    so the same symbol requested by several routes within the TTL only costs
+    one upstream call. Quote records are immutable, so they are stored and
+    returned without copying.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, ttl=None, max_entries=None):
+        """Change the TTL and/or size bound at runtime"""
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if max_entries is not None:
+                self.max_entries = max_entries
+                self._evict()
+
+    def get(self, symbol):
+        """
+        Get a fresh cached quote
+
+        Parameters:
+        symbol (str): Normalized stock symbol
+
+        Returns:
+        Quote: The cached quote record (shared, not copied), or None if missing or expired
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is None or now - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[symbol]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(symbol)
+            self.hits += 1
+            return entry[1]
+
+    def get_many(self, symbols):
+        """
+        Get fresh cached quotes for several symbols
+
+        Returns:
+        tuple: (dict of symbol to quote for hits, list of missing symbols)
+        """
+        found = {}
+        missing = []
+        for symbol in symbols:
+            quote = self.get(symbol)
+            if quote is None:
+                missing.append(symbol)
+            else:
+                found[symbol] = quote
+        return found, missing
+
+    def set(self, symbol, quote):
+        """Store a quote for a symbol"""
+        with self._lock:
+            self._entries[symbol] = (time.monotonic(), quote)
+            self._entries.move_to_end(symbol)
+            self._evict()
+
+    def invalidate(self, symbol=None):
+        """Drop one symbol, or every entry when symbol is None"""
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(symbol, None)
+
+    def stats(self):
+        """Get cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0,
+                'oldest_age': time.monotonic() - min((e[0] for e in self._entries.values()), default=time.monotonic()),
+                'ttl': self.ttl,
+                'max_entries': self.max_entries
+            }
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+# Process-wide cache used by utils.stock_data
+quote_cache = QuoteCache()
+
+metrics.counter('tradex_quote_cache_hits_total', 'Quote cache lookups served from the cache',
+                callback=lambda: quote_cache.stats()['hits'])
+metrics.counter('tradex_quote_cache_misses_total', 'Quote cache lookups that missed or found an expired quote',
+                callback=lambda: quote_cache.stats()['misses'])
+metrics.counter('tradex_quote_cache_evictions_total', 'Quotes evicted by the cache size bound',
+                callback=lambda: quote_cache.stats()['evictions'])
+metrics.gauge('tradex_quote_cache_hit_ratio', 'Share of quote cache lookups that were hits',
+              callback=lambda: quote_cache.stats()['hit_ratio'])
+metrics.gauge('tradex_quote_cache_entries', 'Quotes currently cached',
+              callback=lambda: quote_cache.stats()['entries'])
+metrics.gauge('tradex_quote_cache_oldest_age_seconds', 'Age of the oldest cached quote',
+              callback=lambda: quote_cache.stats()['oldest_age'])
@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+# Sustained upstream requests per second allowed across the whole process
+UPSTREAM_RATE = 5.0
+
+# Requests that may be sent back to back before the rate applies
+UPSTREAM_BURST = 10
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Tokens refill continuously at `rate` per second up to `capacity`. Each
+    upstream call takes one token, waiting only as long as needed for the
+    next token instead of a fixed sleep.
+    """
+
+    def __init__(self, rate=UPSTREAM_RATE, capacity=UPSTREAM_BURST):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, rate=None, capacity=None):
+        with self._lock:
+            self._refill()
+            if rate is not None:
+                self.rate = float(rate)
+            if capacity is not None:
+                self.capacity = float(capacity)
+                self._tokens = min(self._tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """
+        Take one token, waiting for it if necessary
+
+        Parameters:
+        timeout (float): Maximum seconds to wait. None waits indefinitely
+
+        Returns:
+        bool: True if a token was taken, False on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_take(deadline)
+            if wait is None:
+                return True
+            if wait <= 0:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout=None):
+        """Like acquire(), but waits with asyncio.sleep so the event loop keeps running"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_take(deadline)
+            if wait is None:
+                return True
+            if wait <= 0:
+                return False
+            await asyncio.sleep(wait)
+
+    def _try_take(self, deadline):
+        # None when a token was taken, otherwise seconds to wait (<= 0 once the deadline has passed)
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            wait = (1 - self._tokens) / self.rate if self.rate > 0 else 1.0
+
+        if deadline is not None:
+            return min(wait, deadline - time.monotonic())
+        return wait
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait and receive the same result (or exception) instead of
+    repeating the call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines
+
+    In-flight calls are tracked as concurrent.futures.Future objects, so a
+    caller on one event loop can join a call led from another (each async
+    request may run on its own loop).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return await asyncio.wrap_future(call)
+
+        try:
+            result = await fn()
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+# Process-wide limiter and coalescers used by utils.http_client
+upstream_limiter = TokenBucket()
+upstream_flight = SingleFlight()
+async_upstream_flight = AsyncSingleFlight()
@@ -0,0 +1,133 @@
+import csv
+import io
+from itertools import islice
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet and Arrow IPC exports are only offered when pyarrow is installed
+    pa = None
+
+# Rows written to the CSV buffer before a chunk is sent to the client
+CSV_FLUSH_ROWS = 500
+
+# Rows per Arrow record batch / Parquet row group
+COLUMNAR_BATCH_ROWS = 65536
+
+# Export format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows')
+}
+
+def columnar_available():
+    """Whether Parquet and Arrow IPC exports can be produced"""
+    return pa is not None
+
+def stream_export(fmt, columns, rows):
+    """
+    Stream a report in the requested format
+
+    Rows are consumed lazily and written out in chunks, so memory use does
+    not grow with the size of the report.
+
+    Parameters:
+    fmt (str): 'csv', 'parquet' or 'arrow'
+    columns (list): (name, type) pairs, where type is 'string', 'int64' or 'float64'
+    rows (iterable): Row tuples in column order
+
+    Returns:
+    tuple: (generator of bytes chunks, mimetype, file extension)
+
+    Raises:
+    ValueError: If the format is unknown or needs pyarrow, which is not installed
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Use one of: {', '.join(EXPORT_FORMATS)}")
+    if fmt != 'csv' and not columnar_available():
+        raise ValueError(f"The {fmt} export format requires pyarrow, which is not installed")
+
+    writer = {'csv': stream_csv, 'parquet': stream_parquet, 'arrow': stream_arrow}[fmt]
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    return writer(columns, rows), mimetype, extension
+
+def stream_csv(columns, rows):
+    """Yield a CSV report as UTF-8 chunks of CSV_FLUSH_ROWS rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow([name for name, _ in columns])
+    for batch in _batches(rows, CSV_FLUSH_ROWS):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def stream_arrow(columns, rows):
+    """Yield a report as an Arrow IPC stream, one record batch at a time"""
+    schema = _schema(columns)
+    sink = _ChunkSink()
+    with pa_ipc.new_stream(pa.PythonFile(sink, mode='w'), schema) as writer:
+        for batch in _batches(rows, COLUMNAR_BATCH_ROWS):
+            writer.write_batch(_record_batch(schema, batch))
+            yield from sink.drain()
+    yield from sink.drain()
+
+def stream_parquet(columns, rows):
+    """Yield a report as a Parquet file, one row group at a time"""
+    schema = _schema(columns)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema) as writer:
+        for batch in _batches(rows, COLUMNAR_BATCH_ROWS):
+            writer.write_batch(_record_batch(schema, batch))
+            yield from sink.drain()
+    yield from sink.drain()
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def _schema(columns):
+    return pa.schema([(name, pa.type_for_alias(kind)) for name, kind in columns])
+
+def _record_batch(schema, rows):
+    values = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(values, schema)],
+        schema=schema
+    )
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to the generator"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        """Get the bytes written since the last drain, as a list of at most one chunk"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return [data] if data else []
@@ -0,0 +1,350 @@
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from utils.metrics import metrics
+
+# Memory-mapped quote table shared by every worker process on the host
+QUOTE_TABLE_PATH = os.environ.get(
+    'TRADEX_QUOTE_TABLE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'quote_table.bin')
+)
+
+# The shared table is only used when TRADEX_SHARED_QUOTES=1 (multi-process deployments)
+SHARED_QUOTES_ENABLED = os.environ.get('TRADEX_SHARED_QUOTES') == '1'
+
+# Number of symbol slots; a symbol keeps its slot for the life of the file
+QUOTE_TABLE_SLOTS = 4096
+
+# Quotes older than this many seconds are treated as missing by readers
+QUOTE_TABLE_MAX_AGE = 90
+
+# Slots probed after the hashed one before a symbol is considered absent
+MAX_PROBES = 32
+
+# Re-reads of a slot caught mid-write before the read gives up
+READ_RETRIES = 16
+
+# Seconds between a reader's attempts to open a missing table or take over from a dead writer
+ATTACH_RETRY_SECONDS = 5
+
+# Wanted symbols the writer has not seen requested for this long stop being refreshed
+WANTED_IDLE_EXPIRY = 3600
+
+# The writer empties the wanted-symbol log once it has consumed this many bytes of it
+WANTED_LOG_MAX_BYTES = 1 << 20
+
+MAGIC = b'TRDXQT01'
+
+# magic, slot count, slot size, writer heartbeat (epoch seconds)
+HEADER = struct.Struct('<8sIId')
+HEADER_SIZE = 64
+
+# Per slot: sequence counter, then symbol, price, previous close, volume,
+# day high, day low, market cap and update time. Missing values are NaN.
+SEQUENCE = struct.Struct('<Q')
+SLOT_BODY = struct.Struct('<24s7d')
+SLOT_SIZE = 96
+
+class SharedQuoteTable:
+    """
+    Fixed-layout quote table in a memory-mapped file
+
+    One process, the holder of an exclusive flock on `<path>.lock`, writes
+    quotes as it fetches them; every other worker process reads the same
+    pages without copying the table and without taking a lock.
+
+    Each slot is a seqlock: the writer makes the sequence odd, writes the
+    fields and makes it even again. A reader that sees an odd or changed
+    sequence simply re-reads the slot.
+
+    Readers cannot write the table, so symbols they miss are appended to
+    `<path>.wanted`; the writer's poller picks them up as a symbol source.
+    If the writer dies, its lock is released and the next reader to notice
+    the stale heartbeat takes over.
+    """
+
+    def __init__(self, path=QUOTE_TABLE_PATH, enabled=SHARED_QUOTES_ENABLED, slots=QUOTE_TABLE_SLOTS,
+                 max_age=QUOTE_TABLE_MAX_AGE):
+        self.path = path
+        self.enabled = enabled and fcntl is not None
+        self.slots = slots
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._map = None
+        self._lock_file = None
+        self._is_writer = False
+        self._offsets = {}
+        self._last_attach = None
+        self._requested = {}
+        self._wanted = {}
+        self._wanted_offset = 0
+        self._full = False
+        self.reads = 0
+        self.hits = 0
+
+    @property
+    def is_writer(self):
+        return self._is_writer
+
+    def _attach(self):
+        """Open the table, becoming the writer if no other process is; throttled to ATTACH_RETRY_SECONDS"""
+        if not self.enabled:
+            return False
+        if self._is_writer:
+            return True
+        now = time.monotonic()
+        if self._last_attach is not None and now - self._last_attach < ATTACH_RETRY_SECONDS:
+            return self._map is not None
+        with self._lock:
+            if self._last_attach is not None and now - self._last_attach < ATTACH_RETRY_SECONDS:
+                return self._map is not None
+            self._last_attach = now
+            try:
+                if self._map is None or self._heartbeat_age() > self.max_age:
+                    self._try_become_writer()
+                    if not self._is_writer:
+                        # The writer may have replaced the file; map the current one
+                        self._open_existing()
+            except OSError as e:
+                print(f"Error attaching shared quote table: {e}")
+        return self._map is not None
+
+    def _try_become_writer(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        lock_file = open(f"{self.path}.lock", 'a+b')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return
+
+        size = HEADER_SIZE + self.slots * SLOT_SIZE
+        try:
+            with open(self.path, 'rb') as f:
+                valid = os.fstat(f.fileno()).st_size == size and f.read(8) == MAGIC
+        except FileNotFoundError:
+            valid = False
+        if not valid:
+            # New file or a different layout: build an empty table beside it and swap
+            # it in, so readers still mapping the old file never see it shrink
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, self.slots, SLOT_SIZE, 0.0).ljust(HEADER_SIZE, b'\0'))
+                f.truncate(size)
+            os.replace(tmp_path, self.path)
+
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            table = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        if self._map is not None:
+            self._map.close()
+        self._map = table
+        self._offsets = {}
+        self._lock_file = lock_file
+        self._is_writer = True
+        self._wanted_offset = self._wanted_size()
+
+    def _open_existing(self):
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            size = os.fstat(fd).st_size
+            if size < HEADER_SIZE:
+                return
+            table = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, slots, slot_size, _ = HEADER.unpack_from(table, 0)
+        if magic != MAGIC or slot_size != SLOT_SIZE or size != HEADER_SIZE + slots * SLOT_SIZE:
+            table.close()
+            return
+        if self._map is not None:
+            self._map.close()
+        self.slots = slots
+        self._map = table
+        self._offsets = {}
+
+    def _heartbeat_age(self):
+        if self._map is None:
+            return float('inf')
+        return time.time() - HEADER.unpack_from(self._map, 0)[3]
+
+    def _find(self, symbol, claim=False):
+        """Get the byte offset of a symbol's slot, claiming an empty one for the writer"""
+        offset = self._offsets.get(symbol)
+        if offset is not None:
+            return offset
+
+        key = symbol.encode('utf-8')[:24].ljust(24, b'\0')
+        start = zlib.crc32(key) % self.slots
+        for probe in range(min(MAX_PROBES, self.slots)):
+            offset = HEADER_SIZE + ((start + probe) % self.slots) * SLOT_SIZE
+            stored = self._map[offset + SEQUENCE.size:offset + SEQUENCE.size + 24]
+            if stored == key:
+                self._offsets[symbol] = offset
+                return offset
+            if stored == b'\0' * 24:
+                if not claim:
+                    return None
+                self._write_slot(offset, key, (math.nan,) * 7)
+                self._offsets[symbol] = offset
+                return offset
+        if claim and not self._full:
+            self._full = True
+            print(f"Shared quote table is full; {symbol} is not shared between workers")
+        return None
+
+    def _write_slot(self, offset, key, values):
+        sequence = SEQUENCE.unpack_from(self._map, offset)[0]
+        SEQUENCE.pack_into(self._map, offset, sequence + 1)
+        SLOT_BODY.pack_into(self._map, offset + SEQUENCE.size, key, *values)
+        SEQUENCE.pack_into(self._map, offset, sequence + 2)
+
+    def _read_slot(self, offset):
+        for _ in range(READ_RETRIES):
+            before = SEQUENCE.unpack_from(self._map, offset)[0]
+            if before & 1:
+                continue
+            values = SLOT_BODY.unpack_from(self._map, offset + SEQUENCE.size)
+            if SEQUENCE.unpack_from(self._map, offset)[0] == before:
+                return values
+        return None
+
+    def publish(self, quotes):
+        """
+        Write fetched quotes to the table. A no-op outside the writer process
+
+        Parameters:
+        quotes (list): Quote records as built by build_stock_quote
+        """
+        if not self._attach() or not self._is_writer:
+            return
+        now = time.time()
+        with self._lock:
+            for quote in quotes:
+                if quote.price is None:
+                    continue
+                offset = self._find(quote.symbol, claim=True)
+                if offset is None:
+                    continue
+                values = tuple(
+                    math.nan if getattr(quote, field) is None else float(getattr(quote, field))
+                    for field in ('price', 'previous_close', 'volume', 'day_high', 'day_low', 'market_cap')
+                )
+                self._write_slot(offset, self._map[offset + SEQUENCE.size:offset + SEQUENCE.size + 24], values + (now,))
+            HEADER.pack_into(self._map, 0, MAGIC, self.slots, SLOT_SIZE, now)
+
+    def get_many(self, symbols, build):
+        """
+        Read fresh quotes for several symbols
+
+        Parameters:
+        symbols (list): Normalized stock symbols
+        build (callable): build(symbol, price, previous_close, volume, day_high, day_low, market_cap)
+        turning raw values (None when missing) into a quote record
+
+        Returns:
+        tuple: (dict of symbol to quote for fresh hits, list of missing symbols)
+        """
+        if not self._attach():
+            return {}, list(symbols)
+
+        found = {}
+        missing = []
+        cutoff = time.time() - self.max_age
+        for symbol in symbols:
+            offset = self._find(symbol)
+            values = self._read_slot(offset) if offset is not None else None
+            if values is None or math.isnan(values[7]) or values[7] < cutoff or math.isnan(values[1]):
+                missing.append(symbol)
+                continue
+            found[symbol] = build(symbol, *(None if math.isnan(v) else v for v in values[1:7]))
+
+        self.reads += len(symbols)
+        self.hits += len(found)
+        if missing and not self._is_writer:
+            self._request(missing)
+        return found, missing
+
+    def _request(self, symbols):
+        # Ask the writer to start refreshing these symbols, at most once per max_age each
+        now = time.monotonic()
+        fresh = [s for s in symbols if now - self._requested.get(s, -self.max_age) >= self.max_age]
+        if not fresh:
+            return
+        for symbol in fresh:
+            self._requested[symbol] = now
+        try:
+            fd = os.open(f"{self.path}.wanted", os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, ''.join(f"{s}\n" for s in fresh).encode('utf-8'))
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"Error requesting shared quotes: {e}")
+
+    def _wanted_size(self):
+        try:
+            return os.path.getsize(f"{self.path}.wanted")
+        except OSError:
+            return 0
+
+    def wanted_symbols(self):
+        """Symbols other workers asked for recently; only the writer reports any"""
+        if not self._is_writer:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            try:
+                with open(f"{self.path}.wanted", 'rb') as f:
+                    f.seek(self._wanted_offset)
+                    data = f.read()
+            except FileNotFoundError:
+                data = b''
+            # Only consume whole lines; a reader may be mid-append
+            consumed = data.rfind(b'\n') + 1
+            self._wanted_offset += consumed
+            if self._wanted_offset > WANTED_LOG_MAX_BYTES:
+                # A request appended meanwhile is lost; readers repeat theirs every max_age
+                os.truncate(f"{self.path}.wanted", 0)
+                self._wanted_offset = 0
+            for line in data[:consumed].decode('utf-8', errors='replace').splitlines():
+                if line:
+                    self._wanted[line] = now
+            for symbol in [s for s, seen in self._wanted.items() if now - seen > WANTED_IDLE_EXPIRY]:
+                del self._wanted[symbol]
+            return list(self._wanted)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'writer': self._is_writer,
+            'reads': self.reads,
+            'hits': self.hits,
+            'heartbeat_age': self._heartbeat_age() if self._map is not None else None
+        }
+
+# Process-wide shared quote table used by utils.stock_data
+quote_table = SharedQuoteTable()
+
+metrics.gauge('tradex_shared_quotes_writer', 'Whether this process writes the shared quote table',
+              callback=lambda: int(quote_table.is_writer))
+metrics.counter('tradex_shared_quote_reads_total', 'Symbols looked up in the shared quote table',
+                callback=lambda: quote_table.reads)
+metrics.counter('tradex_shared_quote_hits_total', 'Symbols served from the shared quote table',
+                callback=lambda: quote_table.hits)
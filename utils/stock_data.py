@@ -4,6 +4,52 @@ from datetime import datetime, timedelta
 import random
 import time
 import json
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from utils.history_store import BAR_PYRAMID, EXCHANGE_UTC_OFFSET, bucket_start, history_store
+from utils.http_client import transport
+from utils.metrics import in_current_context, metrics
+from utils.quote import Quote
+from utils.quote_cache import quote_cache
+from utils.shared_quotes import quote_table
+
+# Maximum number of symbols fetched in parallel by get_stocks_data
+MAX_FETCH_WORKERS = 8
+
+QUOTES_SERVED = metrics.counter(
+    'tradex_quotes_served_total', 'Quotes returned by get_stock_data and get_stocks_data by where they came from', ['source'])
+
+# Number of symbols requested per v7/finance/quote batch call
+BATCH_QUOTE_CHUNK_SIZE = 50
+
+# Stored history younger than this many seconds is served without contacting upstream
+HISTORY_SYNC_SECONDS = 300
+
+# Same, for intraday bars
+INTRADAY_SYNC_SECONDS = 60
+
+# How far back Yahoo Finance serves each intraday interval, in seconds
+INTRADAY_RETENTION = {
+    '1m': 7 * 86400,
+    '5m': 60 * 86400,
+    '15m': 60 * 86400,
+    '1h': 730 * 86400
+}
+
+# Bar interval served for a chart period when the caller does not ask for one
+PERIOD_INTERVALS = {'1d': '5m', '5d': '15m', '1mo': '1h'}
+
+SECTORS = ['Information Technology', 'Financial Services', 'Energy', 'Healthcare',
+           'Consumer Goods', 'Industrial', 'Telecom', 'Utilities']
+
+def stock_sector(symbol):
+    """
+    Placeholder sector for a symbol; the quote endpoints carry none
+
+    Derived from the symbol, so every refresh and every worker process
+    (including readers of the shared quote table) reports the same sector.
+    """
+    return SECTORS[zlib.crc32(symbol.encode()) % len(SECTORS)]
 
 def get_mutual_funds_data(fund_list=None, debug=False):
     """
@@ -16,10 +62,6 @@ def get_mutual_funds_data(fund_list=None, debug=False):
     Returns:
     list: List of dictionaries containing mutual fund data
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
     # Default mutual funds tickers if none provided
     if fund_list is None:
         fund_list = [
@@ -39,11 +81,11 @@ def get_mutual_funds_data(fund_list=None, debug=False):
                 print(f"Processing fund: {fund}")
             
             # Get NAV and historical data
-            chart_url = f"https://query1.finance.yahoo.com/v8/finance/chart/{fund}?interval=1d"
+            chart_url = f"v8/finance/chart/{fund}?interval=1d"
             if debug:
-                print(f"Fetching from URL: {chart_url}")
+                print(f"Fetching from URL: {transport.url(chart_url)}")
                 
-            chart_response = requests.get(chart_url, headers=headers)
+            chart_response = transport.get(chart_url)
             
             if chart_response.status_code != 200:
                 if debug:
@@ -52,133 +94,22 @@ def get_mutual_funds_data(fund_list=None, debug=False):
                 continue
             
             chart_data = chart_response.json()
-            
-            # Check if we have actual results
             if not chart_data.get('chart', {}).get('result'):
                 if debug:
                     print(f"No chart results for {fund}")
-                    print(f"Response data: {json.dumps(chart_data)[:500]}...")
-                continue
-                
-            meta = chart_data.get('chart', {}).get('result', [{}])[0].get('meta', {})
-            
-            if not meta:
-                if debug:
-                    print(f"No meta data for {fund}")
                 continue
             
             # Get quote data
-            quote_url = f"https://query1.finance.yahoo.com/v7/finance/quote?symbols={fund}"
-            quote_response = requests.get(quote_url, headers=headers)
+            quote_url = f"v7/finance/quote?symbols={fund}"
+            quote_response = transport.get(quote_url)
+            quote_data = quote_response.json() if quote_response.status_code == 200 else None
             
-            quote = {}
-            if quote_response.status_code == 200:
-                quote_data = quote_response.json()
-                quotes = quote_data.get('quoteResponse', {}).get('result', [])
-                if quotes:
-                    quote = quotes[0]
-            
-            # Extract NAV and changes
-            nav = meta.get('regularMarketPrice')
-            previous_nav = meta.get('previousClose')
-            
-            if nav is None:
-                if debug:
-                    print(f"No NAV data for {fund}")
+            fund_data = parse_mutual_fund(fund, chart_data, quote_data, debug)
+            if fund_data is None:
                 continue
-                
-            # Calculate changes
-            if nav is not None and previous_nav is not None:
-                change = nav - previous_nav
-                change_percent = (change / previous_nav) * 100
-            else:
-                change = None
-                change_percent = None
-            
-            # Get fund name
-            fund_name = quote.get('longName') or quote.get('shortName') or meta.get('symbol', fund).replace('-', ' ').replace('.MF', '')
-            
-            # Try to determine category from name
-            name_lower = fund_name.lower()
-            if 'large cap' in name_lower:
-                category = 'Large Cap'
-            elif 'mid cap' in name_lower:
-                category = 'Mid Cap'
-            elif 'small cap' in name_lower:
-                category = 'Small Cap'
-            elif 'debt' in name_lower or 'bond' in name_lower:
-                category = 'Debt'
-            elif 'hybrid' in name_lower or 'balanced' in name_lower:
-                category = 'Hybrid'
-            elif 'index' in name_lower:
-                category = 'Index'
-            else:
-                category = 'Equity'  # Default
-            
-            # Get historical data for calculating returns
-            timestamps = chart_data.get('chart', {}).get('result', [{}])[0].get('timestamp', [])
-            indicators = chart_data.get('chart', {}).get('result', [{}])[0].get('indicators', {})
-            
-            # Check if we have quote data with close prices
-            if not indicators or 'quote' not in indicators or not indicators['quote'] or not indicators['quote'][0].get('close'):
-                if debug:
-                    print(f"No price history for {fund}")
-                close_prices = []
-            else:
-                close_prices = indicators['quote'][0]['close']
-            
-            # Calculate returns if enough data points
-            returns = {}
-            if len(close_prices) > 250 and len(close_prices) == len(timestamps):  # Ensure data alignment
-                valid_prices = [(ts, price) for ts, price in zip(timestamps, close_prices) if price is not None]
-                
-                if valid_prices:
-                    latest_price = valid_prices[-1][1]
-                    
-                    # 1-year return
-                    one_year_ago = int(time.time()) - 31536000
-                    for ts, price in valid_prices:
-                        if ts < one_year_ago:
-                            returns['1y'] = ((latest_price / price) - 1) * 100
-                            break
-            
-            # Get AUM and expense ratio
-            aum = quote.get('totalAssets')
-            expense_ratio = quote.get('yield')
-            
-            # Determine risk level based on category
-            risk_level = 'Moderate'
-            if category in ['Large Cap', 'Index', 'Debt']:
-                risk_level = 'Low'
-            elif category in ['Small Cap']:
-                risk_level = 'High'
-            
-            fund_data = {
-                'symbol': fund,
-                'name': fund_name,
-                'nav': nav,
-                'change': change,
-                'change_percent': change_percent,
-                'category': category,
-                'risk_level': risk_level,
-                'expense_ratio': expense_ratio,
-                'aum': aum,
-                'return_1y': returns.get('1y'),
-                'trend': 'up' if (change and change > 0) else ('down' if (change and change < 0) else 'neutral'),
-                'formatted': {
-                    'nav': f"₹{nav:.2f}" if nav is not None else 'N/A',
-                    'change': f"{change:+.2f}" if change is not None else 'N/A',
-                    'change_percent': f"{change_percent:+.2f}%" if change_percent is not None else 'N/A',
-                    'expense_ratio': f"{expense_ratio}%" if expense_ratio is not None else 'N/A',
-                    'aum': f"₹{aum/10000000:.2f} Cr" if aum is not None else 'N/A'
-                }
-            }
             
             mutual_funds_data.append(fund_data)
             
-            # Add a small delay to avoid rate limiting
-            time.sleep(0.5)
-            
         except Exception as e:
             if debug:
                 print(f"Error processing mutual fund {fund}: {str(e)}")
@@ -189,6 +120,135 @@ def get_mutual_funds_data(fund_list=None, debug=False):
         
     return mutual_funds_data
 
+def parse_mutual_fund(fund, chart_data, quote_data=None, debug=False):
+    """
+    Build a mutual fund dictionary from chart and quote responses
+
+    Parameters:
+    fund (str): Fund symbol
+    chart_data (dict): Parsed v8/finance/chart response
+    quote_data (dict): Parsed v7/finance/quote response, or None if it failed
+    debug (bool): If True, prints why a fund was skipped
+
+    Returns:
+    dict: Mutual fund data, or None if the chart carries no NAV
+    """
+    # Check if we have actual results
+    if not chart_data.get('chart', {}).get('result'):
+        if debug:
+            print(f"No chart results for {fund}")
+            print(f"Response data: {json.dumps(chart_data)[:500]}...")
+        return None
+        
+    meta = chart_data.get('chart', {}).get('result', [{}])[0].get('meta', {})
+    
+    if not meta:
+        if debug:
+            print(f"No meta data for {fund}")
+        return None
+    
+    quote = {}
+    if quote_data:
+        quotes = quote_data.get('quoteResponse', {}).get('result', [])
+        if quotes:
+            quote = quotes[0]
+    
+    # Extract NAV and changes
+    nav = meta.get('regularMarketPrice')
+    previous_nav = meta.get('previousClose')
+    
+    if nav is None:
+        if debug:
+            print(f"No NAV data for {fund}")
+        return None
+        
+    # Calculate changes
+    if nav is not None and previous_nav is not None:
+        change = nav - previous_nav
+        change_percent = (change / previous_nav) * 100
+    else:
+        change = None
+        change_percent = None
+    
+    # Get fund name
+    fund_name = quote.get('longName') or quote.get('shortName') or meta.get('symbol', fund).replace('-', ' ').replace('.MF', '')
+    
+    # Try to determine category from name
+    name_lower = fund_name.lower()
+    if 'large cap' in name_lower:
+        category = 'Large Cap'
+    elif 'mid cap' in name_lower:
+        category = 'Mid Cap'
+    elif 'small cap' in name_lower:
+        category = 'Small Cap'
+    elif 'debt' in name_lower or 'bond' in name_lower:
+        category = 'Debt'
+    elif 'hybrid' in name_lower or 'balanced' in name_lower:
+        category = 'Hybrid'
+    elif 'index' in name_lower:
+        category = 'Index'
+    else:
+        category = 'Equity'  # Default
+    
+    # Get historical data for calculating returns
+    timestamps = chart_data.get('chart', {}).get('result', [{}])[0].get('timestamp', [])
+    indicators = chart_data.get('chart', {}).get('result', [{}])[0].get('indicators', {})
+    
+    # Check if we have quote data with close prices
+    if not indicators or 'quote' not in indicators or not indicators['quote'] or not indicators['quote'][0].get('close'):
+        if debug:
+            print(f"No price history for {fund}")
+        close_prices = []
+    else:
+        close_prices = indicators['quote'][0]['close']
+    
+    # Calculate returns if enough data points
+    returns = {}
+    if len(close_prices) > 250 and len(close_prices) == len(timestamps):  # Ensure data alignment
+        valid_prices = [(ts, price) for ts, price in zip(timestamps, close_prices) if price is not None]
+        
+        if valid_prices:
+            latest_price = valid_prices[-1][1]
+            
+            # 1-year return
+            one_year_ago = int(time.time()) - 31536000
+            for ts, price in valid_prices:
+                if ts < one_year_ago:
+                    returns['1y'] = ((latest_price / price) - 1) * 100
+                    break
+    
+    # Get AUM and expense ratio
+    aum = quote.get('totalAssets')
+    expense_ratio = quote.get('yield')
+    
+    # Determine risk level based on category
+    risk_level = 'Moderate'
+    if category in ['Large Cap', 'Index', 'Debt']:
+        risk_level = 'Low'
+    elif category in ['Small Cap']:
+        risk_level = 'High'
+    
+    return {
+        'symbol': fund,
+        'name': fund_name,
+        'nav': nav,
+        'change': change,
+        'change_percent': change_percent,
+        'category': category,
+        'risk_level': risk_level,
+        'expense_ratio': expense_ratio,
+        'aum': aum,
+        'return_1y': returns.get('1y'),
+        'trend': 'up' if (change and change > 0) else ('down' if (change and change < 0) else 'neutral'),
+        'formatted': {
+            'nav': f"₹{nav:.2f}" if nav is not None else 'N/A',
+            'change': f"{change:+.2f}" if change is not None else 'N/A',
+            'change_percent': f"{change_percent:+.2f}%" if change_percent is not None else 'N/A',
+            'expense_ratio': f"{expense_ratio}%" if expense_ratio is not None else 'N/A',
+            'aum': f"₹{aum/10000000:.2f} Cr" if aum is not None else 'N/A'
+        }
+    }
+
 def test_mutual_fund_availability(fund_list=None):
     """
     Test if mutual fund data is available from Yahoo Finance
@@ -199,10 +259,6 @@ def test_mutual_fund_availability(fund_list=None):
     Returns:
     dict: Dictionary with test results
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
     # Default mutual funds tickers if none provided or use common Indian Mutual Funds
     if fund_list is None:
         fund_list = [
@@ -219,8 +275,8 @@ def test_mutual_fund_availability(fund_list=None):
         print(f"Testing fund: {fund}")
         
         # Test Chart API
-        chart_url = f"https://query1.finance.yahoo.com/v8/finance/chart/{fund}?interval=1d"
-        chart_response = requests.get(chart_url, headers=headers)
+        chart_url = f"v8/finance/chart/{fund}?interval=1d"
+        chart_response = transport.get(chart_url)
         
         chart_status = chart_response.status_code
         chart_data = None
@@ -228,8 +284,8 @@ def test_mutual_fund_availability(fund_list=None):
             chart_data = chart_response.json()
         
         # Test Quote API
-        quote_url = f"https://query1.finance.yahoo.com/v7/finance/quote?symbols={fund}"
-        quote_response = requests.get(quote_url, headers=headers)
+        quote_url = f"v7/finance/quote?symbols={fund}"
+        quote_response = transport.get(quote_url)
         
         quote_status = quote_response.status_code
         quote_data = None
@@ -243,9 +299,6 @@ def test_mutual_fund_availability(fund_list=None):
             'quote_status': quote_status,
             'quote_has_data': quote_data is not None and 'quoteResponse' in quote_data and 'result' in quote_data['quoteResponse'] and len(quote_data['quoteResponse']['result']) > 0
         }
-        
-        # Add a small delay
-        time.sleep(0.5)
     
     return results
 
@@ -256,10 +309,6 @@ def get_indian_mutual_funds():
     Returns:
     list: List of found mutual fund symbols
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
     # Try different search terms for Indian mutual funds
     search_terms = [
         "HDFC Mutual Fund",
@@ -275,9 +324,9 @@ def get_indian_mutual_funds():
         try:
             # Encode the search term for URL
             encoded_term = requests.utils.quote(term)
-            url = f"https://query1.finance.yahoo.com/v1/finance/search?q={encoded_term}&quotesCount=10&newsCount=0"
+            url = f"v1/finance/search?q={encoded_term}&quotesCount=10&newsCount=0"
             
-            response = requests.get(url, headers=headers)
+            response = transport.get(url)
             if response.status_code == 200:
                 data = response.json()
                 quotes = data.get('quotes', [])
@@ -287,9 +336,6 @@ def get_indian_mutual_funds():
                     if symbol and (symbol.endswith('.MF') or symbol.endswith('.BO') or symbol.endswith('.NS')):
                         fund_symbols.append(symbol)
             
-            # Add delay to avoid rate limiting
-            time.sleep(1)
-            
         except Exception as e:
             print(f"Error searching for {term}: {str(e)}")
     
@@ -333,15 +379,11 @@ def get_upcoming_ipos():
     """
     Get upcoming IPO data from Yahoo Finance
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
     # Yahoo Finance screener URL for upcoming IPOs in India
-    url = "https://query1.finance.yahoo.com/v1/finance/screener/predefined/saved?formatted=true&lang=en-US&region=IN&scrIds=upcoming_ipos&count=25"
+    url = "v1/finance/screener/predefined/saved?formatted=true&lang=en-US&region=IN&scrIds=upcoming_ipos&count=25"
     
     try:
-        response = requests.get(url, headers=headers)
+        response = transport.get(url)
         if response.status_code != 200:
             return []
             
@@ -393,105 +435,294 @@ def get_upcoming_ipos():
             }
         ]
 
-def get_stock_data(symbol):
+def normalize_symbol(symbol):
+    """Append the NSE suffix to symbols without an exchange suffix"""
+    if not (symbol.endswith('.NS') or symbol.endswith('.BO')):
+        symbol = f"{symbol}.NS"
+    return symbol
+
+def build_stock_quote(symbol, name, price, previous_close, volume, day_high=None, day_low=None, market_cap=None):
+    """
+    Build the quote record returned by get_stock_data
+
+    Parameters:
+    symbol (str): Normalized stock symbol
+    name (str): Display name (exchange suffix is stripped)
+    price, previous_close, volume: Raw values, None when missing
+    day_high, day_low (float): Day range, estimated from price when missing
+    market_cap (float): Market cap, estimated from price when missing
+
+    Returns:
+    Quote: Stock quote record; display strings are rendered from it on demand
+    """
+    if market_cap is None and price is not None:
+        market_cap = price * random.randint(10000000, 1000000000)
+    if day_high is None and price is not None:
+        day_high = price * 1.01
+    if day_low is None and price is not None:
+        day_low = price * 0.99
+
+    return Quote(
+        symbol,
+        (name or symbol).replace('.NS', '').replace('.BO', ''),
+        price=price,
+        previous_close=previous_close,
+        volume=volume,
+        day_high=day_high,
+        day_low=day_low,
+        market_cap=market_cap,
+        sector=stock_sector(symbol)
+    )
+
+def get_stock_data(symbol, use_cache=True):
+    """
+    Get stock data, served from the process-wide quote cache when fresh
+
+    Parameters:
+    symbol (str): Stock symbol
+    use_cache (bool): If False, always fetch from Yahoo Finance
+
+    Returns:
+    Quote: Stock quote record
+    """
+    symbol = normalize_symbol(symbol)
+    if use_cache:
+        cached, _ = cached_stock_quotes([symbol])
+        if cached:
+            return cached[symbol]
+
+    data = _fetch_stock_data(symbol)
+    if data and not data.error:
+        store_fetched_quotes({symbol: data})
+    return data
+
+def shared_quote(symbol, price, previous_close, volume, day_high, day_low, market_cap):
+    """Build a quote record from the raw values of a shared quote table slot"""
+    return build_stock_quote(
+        symbol,
+        name=symbol,
+        price=price,
+        previous_close=previous_close,
+        volume=int(volume) if volume is not None else None,
+        day_high=day_high,
+        day_low=day_low,
+        market_cap=market_cap
+    )
+
+def _fetch_stock_data(symbol):
     """
     Get stock data directly from Yahoo Finance API
     """
     if not (symbol.endswith('.NS') or symbol.endswith('.BO')):
         symbol = f"{symbol}.NS"
         
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
-    url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?interval=1d"
+    url = f"v8/finance/chart/{symbol}?interval=1d"
     
     try:
-        response = requests.get(url, headers=headers)
+        response = transport.get(url)
         if response.status_code != 200:
             return None
             
-        data = response.json()
-        meta = data.get('chart', {}).get('result', [{}])[0].get('meta', {})
-        
-        price = meta.get('regularMarketPrice', 'N/A')
-        previous_close = meta.get('previousClose', 'N/A')
-        
-        if price != 'N/A' and previous_close != 'N/A':
-            change = price - previous_close
-            change_percent = (change / previous_close) * 100
-        else:
-            change = 'N/A'
-            change_percent = 'N/A'
-        
-        market_cap = price * random.randint(10000000, 1000000000) if isinstance(price, (int, float)) else 'N/A'
-        volume = meta.get('regularMarketVolume', 'N/A')
-        
-        sectors = ['Information Technology', 'Financial Services', 'Energy', 'Healthcare', 
-                   'Consumer Goods', 'Industrial', 'Telecom', 'Utilities']
-        sector = random.choice(sectors)
-            
-        return {
-            'symbol': symbol,
-            'name': meta.get('symbol', symbol).replace('.NS', '').replace('.BO', ''),
-            'price': price,
-            'change': change,
-            'change_percent': change_percent,
-            'volume': volume,
-            'market_cap': market_cap,
-            'sector': sector,
-            'day_high': meta.get('dayHigh', price * 1.01 if isinstance(price, (int, float)) else 'N/A'),
-            'day_low': meta.get('dayLow', price * 0.99 if isinstance(price, (int, float)) else 'N/A'),
-            'trend': 'up' if (isinstance(change, (int, float)) and change > 0) else 
-                     ('down' if (isinstance(change, (int, float)) and change < 0) else 'neutral'),
-            'formatted': {
-                'price': f"₹{price:.2f}" if isinstance(price, (int, float)) else price,
-                'change': f"{change:+.2f}" if isinstance(change, (int, float)) else change,
-                'change_percent': f"{change_percent:+.2f}%" if isinstance(change_percent, (int, float)) else change_percent,
-                'market_cap': f"₹{market_cap/10000000:.2f}Cr" if isinstance(market_cap, (int, float)) else market_cap,
-                'volume': f"{volume:,}" if isinstance(volume, (int, float)) else volume
-            }
-        }
+        return parse_chart_quote(symbol, response.json())
     except Exception as e:
         print(f"Error fetching {symbol}: {e}")
-        return {
-            'symbol': symbol,
-            'name': symbol.replace('.NS', '').replace('.BO', ''),
-            'price': 'Error',
-            'change': 'N/A',
-            'change_percent': 'N/A',
-            'volume': 'N/A',
-            'market_cap': 'N/A',
-            'sector': 'Unknown',
-            'day_high': 'N/A',
-            'day_low': 'N/A',
-            'trend': 'neutral',
-            'formatted': {
-                'price': 'Error',
-                'change': 'N/A',
-                'change_percent': 'N/A',
-                'market_cap': 'N/A',
-                'volume': 'N/A'
-            }
-        }
+        return error_quote(symbol)
+
+def parse_chart_quote(symbol, data):
+    """Build a quote record from a parsed v8/finance/chart response"""
+    meta = data.get('chart', {}).get('result', [{}])[0].get('meta', {})
+    
+    return build_stock_quote(
+        symbol,
+        name=meta.get('symbol', symbol),
+        price=meta.get('regularMarketPrice'),
+        previous_close=meta.get('previousClose'),
+        volume=meta.get('regularMarketVolume'),
+        day_high=meta.get('dayHigh'),
+        day_low=meta.get('dayLow')
+    )
+
+def error_quote(symbol):
+    """Quote record returned when fetching a symbol failed"""
+    return Quote(symbol, symbol.replace('.NS', '').replace('.BO', ''), error=True)
+
+def get_batch_quotes(symbols, chunk_size=None):
+    """
+    Get quotes for many symbols using the v7/finance/quote batch endpoint
+
+    Symbols are split into chunks and each chunk is fetched with a single
+    request. Symbols missing from a response are simply absent from the result.
+
+    Parameters:
+    symbols (list): List of stock symbols
+    chunk_size (int): Symbols per request. Defaults to BATCH_QUOTE_CHUNK_SIZE
+
+    Returns:
+    dict: Mapping of normalized symbol to quote record
+    """
+    quotes = {}
+
+    for chunk in batch_quote_chunks(symbols, chunk_size):
+        url = f"v7/finance/quote?symbols={','.join(chunk)}"
+
+        try:
+            response = transport.get(url)
+            if response.status_code != 200:
+                continue
+
+            quotes.update(parse_batch_quotes(chunk, response.json()))
+        except Exception as e:
+            print(f"Error fetching batch quotes for {len(chunk)} symbols: {e}")
+
+    return quotes
+
+def parse_batch_quotes(chunk, data):
+    """
+    Build quote records from a parsed v7/finance/quote response
 
-def get_stocks_data(symbols):
+    Parameters:
+    chunk (list): Symbols that were requested; anything else in the response is ignored
+    data (dict): Parsed response
+
+    Returns:
+    dict: Mapping of symbol to quote record for symbols with a price
+    """
+    results = data.get('quoteResponse', {}).get('result', []) or []
+    requested = set(chunk)
+    quotes = {}
+
+    for item in results:
+        symbol = item.get('symbol')
+        if symbol not in requested or item.get('regularMarketPrice') is None:
+            continue
+
+        quotes[symbol] = build_stock_quote(
+            symbol,
+            name=symbol,
+            price=item.get('regularMarketPrice'),
+            previous_close=item.get('regularMarketPreviousClose'),
+            volume=item.get('regularMarketVolume'),
+            day_high=item.get('regularMarketDayHigh'),
+            day_low=item.get('regularMarketDayLow'),
+            market_cap=item.get('marketCap')
+        )
+    return quotes
+
+def batch_quote_chunks(symbols, chunk_size=None):
+    """Split normalized, de-duplicated symbols into v7/finance/quote request chunks"""
+    symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols))
+    chunk_size = max(1, chunk_size or BATCH_QUOTE_CHUNK_SIZE)
+    return [symbols[i:i + chunk_size] for i in range(0, len(symbols), chunk_size)]
+
+def get_stocks_data(symbols, max_workers=None, use_cache=True):
     """
     Get data for multiple Indian stocks
+
+    Fresh quotes are served from the process-wide quote cache, then from
+    the shared quote table when several worker processes run. The rest are
+    fetched in chunks from the batch quote endpoint. Symbols the batch
+    response does not cover fall back to per-symbol chart calls on a
+    bounded thread pool. A failure for one symbol never affects the others.
+
+    Parameters:
+    symbols (list): List of stock symbols
+    max_workers (int): Maximum concurrent fetches. Defaults to MAX_FETCH_WORKERS
+    use_cache (bool): If False, skip the quote cache. Worker processes that
+    read the shared quote table still use it, since keeping it fresh is
+    the writer process's job
+
+    Returns:
+    list: List of quote records sorted by market cap (descending)
     """
-    all_data = []
-    
-    for symbol in symbols:
-        print(f"Fetching data for {symbol}...")
-        data = get_stock_data(symbol)
-        
-        if data:
-            all_data.append(data)
-    
-    # Sort by market cap (descending)
-    all_data.sort(key=lambda x: x['market_cap'] if isinstance(x['market_cap'], (int, float)) else 0, reverse=True)
-            
-    return all_data
+    symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols))
+    if not symbols:
+        return []
+
+    cached_quotes, uncached = cached_stock_quotes(symbols, use_cache)
+
+    batch_quotes = get_batch_quotes(uncached) if uncached else {}
+    missing = [symbol for symbol in uncached if symbol not in batch_quotes]
+
+    def fetch(symbol):
+        try:
+            print(f"Fetching data for {symbol}...")
+            return _fetch_stock_data(symbol)
+        except Exception as e:
+            print(f"Error fetching {symbol}: {e}")
+            return None
+
+    workers = max(1, min(max_workers or MAX_FETCH_WORKERS, len(missing) or 1))
+    if workers == 1:
+        results = [fetch(symbol) for symbol in missing]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(in_current_context(fetch), missing))
+
+    return combine_stock_quotes(symbols, cached_quotes, batch_quotes, results)
+
+def combine_stock_quotes(symbols, cached_quotes, batch_quotes, chart_quotes):
+    """
+    Store the quotes a multi-symbol lookup fetched and assemble its result
+
+    Shared by get_stocks_data and its asyncio counterpart, which only
+    differ in how the batch and chart fetches are waited on.
+
+    Parameters:
+    symbols (list): Normalized symbols in the order they were asked for
+    cached_quotes (dict): Quotes served from the caches, by symbol
+    batch_quotes (dict): Quotes from the batch endpoint, by symbol
+    chart_quotes (list): Results of the per-symbol chart fallback; None for failures
+
+    Returns:
+    list: List of quote records sorted by market cap (descending)
+    """
+    fetched_quotes = dict(batch_quotes)
+    fetched_quotes.update((data.symbol, data) for data in chart_quotes if data)
+    store_fetched_quotes(fetched_quotes)
+
+    all_data = [cached_quotes.get(symbol) or fetched_quotes.get(symbol) for symbol in symbols]
+    all_data = [data for data in all_data if data]
+
+    QUOTES_SERVED.inc(len(batch_quotes), source='batch')
+    QUOTES_SERVED.inc(len(fetched_quotes) - len(batch_quotes), source='chart')
+
+    return sort_by_market_cap(all_data)
+
+def cached_stock_quotes(symbols, use_cache=True):
+    """
+    Look symbols up in the quote cache and then the shared quote table
+
+    Returns:
+    tuple: (dict of symbol to quote for hits, list of symbols that must be fetched)
+    """
+    if use_cache:
+        cached_quotes, uncached = quote_cache.get_many(symbols)
+    else:
+        cached_quotes, uncached = {}, symbols
+    QUOTES_SERVED.inc(len(cached_quotes), source='cache')
+
+    if uncached and (use_cache or not quote_table.is_writer):
+        shared_quotes, uncached = quote_table.get_many(uncached, shared_quote)
+        QUOTES_SERVED.inc(len(shared_quotes), source='shared')
+        for symbol, data in shared_quotes.items():
+            quote_cache.set(symbol, data)
+        cached_quotes.update(shared_quotes)
+    return cached_quotes, uncached
+
+def store_fetched_quotes(quotes):
+    """Put freshly fetched quotes in the quote cache and, in the writer process, the shared table"""
+    valid = [data for data in quotes.values() if not data.error]
+    for data in valid:
+        quote_cache.set(data.symbol, data)
+    quote_table.publish(valid)
+
+def sort_by_market_cap(quotes):
+    """Sort quote records by market cap (descending) in place and return them"""
+    quotes.sort(key=lambda x: x.market_cap or 0, reverse=True)
+    return quotes
+
+def dividends_path(symbol):
+    return f"v8/finance/chart/{symbol}?interval=1mo&range=5y&events=div"
 
 def get_stock_dividends(symbol):
     """
@@ -501,54 +732,59 @@ def get_stock_dividends(symbol):
     symbol (str): Stock symbol
     
     Returns:
-    pandas.DataFrame: Dividend history with Date index
+    pandas.DataFrame: Dividend history with Date index, None if the fetch failed
     """
     if not (symbol.endswith('.NS') or symbol.endswith('.BO')):
         symbol = f"{symbol}.NS"
         
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
-    url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?interval=1mo&range=5y&events=div"
+    url = dividends_path(symbol)
     
     try:
-        response = requests.get(url, headers=headers)
+        response = transport.get(url)
         if response.status_code != 200:
-            return pd.DataFrame(columns=['Dividends'])
+            return None
             
-        data = response.json()
-        events = data.get('chart', {}).get('result', [{}])[0].get('events', {})
-        dividends = events.get('dividends', {})
-        
-        if not dividends:
-            return pd.DataFrame(columns=['Dividends'])
-        
-        dividend_data = []
-        for timestamp, div_data in dividends.items():
-            dividend_data.append({
-                'Date': datetime.fromtimestamp(int(timestamp)).strftime('%Y-%m-%d'),
-                'Dividends': div_data.get('amount', 0)
-            })
-        
-        df = pd.DataFrame(dividend_data)
-        df['Date'] = pd.to_datetime(df['Date'])
-        df.set_index('Date', inplace=True)
-        df.sort_index(ascending=False, inplace=True)
-        
-        return df
+        return parse_dividends(response.json())
         
     except Exception as e:
         print(f"Error fetching dividend data for {symbol}: {e}")
+        return None
+
+def parse_dividends(data):
+    """Build a dividend DataFrame (Date index, newest first) from a parsed chart response"""
+    events = data.get('chart', {}).get('result', [{}])[0].get('events', {})
+    dividends = events.get('dividends', {})
+    
+    if not dividends:
         return pd.DataFrame(columns=['Dividends'])
+    
+    dividend_data = []
+    for timestamp, div_data in dividends.items():
+        dividend_data.append({
+            'Date': datetime.fromtimestamp(int(timestamp)).strftime('%Y-%m-%d'),
+            'Dividends': div_data.get('amount', 0)
+        })
+    
+    df = pd.DataFrame(dividend_data)
+    df['Date'] = pd.to_datetime(df['Date'])
+    df.set_index('Date', inplace=True)
+    df.sort_index(ascending=False, inplace=True)
+    
+    return df
 
-def get_stock_history(symbol, period="1y"):
+def get_stock_history(symbol, period="1y", interval='1d'):
     """
-    Get historical stock data from Yahoo Finance
+    Get historical stock data, served from the local bar store
+
+    Only bars after the last stored timestamp are fetched from Yahoo Finance.
+    A period reaching further back than what is stored triggers a one-off
+    backfill. The period itself is answered as a slice of the store, so
+    when upstream is unavailable the bars stored so far are still served.
 
     Parameters:
     symbol (str): Stock symbol
     period (str): Time period - 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max
+    interval (str): Bar interval - 1m, 5m, 15m, 1h or 1d
 
     Returns:
     pandas.DataFrame: Historical OHLCV price data
@@ -556,10 +792,30 @@ def get_stock_history(symbol, period="1y"):
     if not (symbol.endswith('.NS') or symbol.endswith('.BO')):
         symbol = f"{symbol}.NS"
         
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+    start_time, now = history_window(period, interval)
+    
+    try:
+        sync_stock_history(symbol, start_time, now, interval)
+    except Exception as e:
+        print(f"Error fetching historical data for {symbol}: {e}")
     
+    return history_frame(symbol, start_time, now, interval)
+
+def history_window(period, interval='1d'):
+    """
+    Get the (start, end) epoch seconds covered by a history period
+
+    Intraday windows start at a session open: '1d' is the latest trading
+    session, longer periods start at the open of their first day. They
+    never reach back further than Yahoo Finance serves the interval.
+
+    Parameters:
+    period (str): Time period - 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, max
+    interval (str): Bar interval - 1m, 5m, 15m, 1h or 1d
+
+    Returns:
+    tuple: (start_time, end_time); unknown periods fall back to 1y
+    """
     now = int(time.time())
     
     period_seconds = {
@@ -575,38 +831,133 @@ def get_stock_history(symbol, period="1y"):
     }
     
     start_time = now - period_seconds.get(period, period_seconds['1y'])
-    
-    url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?interval=1d&period1={start_time}&period2={now}"
-    
-    try:
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            return pd.DataFrame(columns=['Date', 'Open', 'High', 'Low', 'Close', 'Volume'])
-            
-        data = response.json()
-        result = data.get('chart', {}).get('result', [{}])[0]
-        
-        timestamps = result.get('timestamp', [])
-        quote_data = result.get('indicators', {}).get('quote', [{}])[0]
-
-        dates = [datetime.fromtimestamp(ts).strftime('%Y-%m-%d') for ts in timestamps]
-
-        df = pd.DataFrame({
-            'Date': dates,
-            'Open': quote_data.get('open', []),
-            'High': quote_data.get('high', []),
-            'Low': quote_data.get('low', []),
-            'Close': quote_data.get('close', []),
-            'Volume': quote_data.get('volume', []),
-        })
+    if interval == '1d':
+        return start_time, now
 
-        df = df.dropna()
-        return df
+    earliest = now - INTRADAY_RETENTION[interval]
+    if period == '1d':
+        start_time = session_start(now)
+    start_time = bucket_start(max(start_time, earliest), '1d')
+    if start_time < earliest:
+        start_time = bucket_start(start_time + 86400, '1d')
+    return start_time, now
 
-    except Exception as e:
-        print(f"Error fetching historical data for {symbol}: {e}")
+def session_start(now):
+    """Get the open of the latest weekday session at or before now (exchange holidays are not known)"""
+    day = bucket_start(now, '1d')
+    if day > now:
+        day = bucket_start(day - 86400, '1d')
+    while time.gmtime(day + EXCHANGE_UTC_OFFSET).tm_wday >= 5:
+        day = bucket_start(day - 86400, '1d')
+    return day
+
+def history_frame(symbol, start_time, end_time, interval='1d'):
+    """Read stored bars as a DataFrame with a 'Date' column, oldest first"""
+    bars = history_store.get_bars(symbol, interval, start_time, end_time)
+    if bars.empty:
         return pd.DataFrame(columns=['Date', 'Open', 'High', 'Low', 'Close', 'Volume'])
 
+    date_format = '%Y-%m-%d' if interval == '1d' else '%Y-%m-%d %H:%M'
+    dates = [datetime.fromtimestamp(ts).strftime(date_format) for ts in bars['ts']]
+    bars.insert(0, 'Date', dates)
+    return bars.drop(columns=['ts'])
+
+def sync_stock_history(symbol, start_time, end_time, interval='1d'):
+    """
+    Bring the stored bars for a symbol up to date
+
+    Intraday intervals are downloaded at the interval chosen by
+    history_source and reach the requested one through the rollup.
+
+    Parameters:
+    symbol (str): Normalized stock symbol
+    start_time (int): Earliest timestamp the caller needs
+    end_time (int): Latest timestamp the caller needs
+    interval (str): Bar interval
+
+    Returns:
+    bool: True if upstream was called
+    """
+    source = history_source(interval, start_time)
+    fetch_from = history_fetch_from(symbol, start_time, source)
+    if fetch_from is None:
+        return False
+
+    response = transport.get(history_path(symbol, source, fetch_from, end_time))
+    if response.status_code != 200:
+        return True
+
+    store_history_bars(symbol, source, response.json(), fetch_from)
+    return True
+
+def history_source(interval, start_time):
+    """
+    Pick the interval to download for a window
+
+    An intraday window is downloaded at the finest interval Yahoo Finance
+    still serves for all of it, and the coarser ones are rolled up from
+    that, so one download fills every resolution of the window. Daily
+    history is always downloaded as daily bars.
+
+    Returns:
+    str: Interval to request from upstream
+    """
+    if interval == '1d':
+        return interval
+    now = time.time()
+    for source in BAR_PYRAMID[:BAR_PYRAMID.index(interval) + 1]:
+        if start_time >= now - INTRADAY_RETENTION[source]:
+            return source
+    return interval
+
+def history_fetch_from(symbol, start_time, interval='1d'):
+    """
+    Decide where an upstream history fetch has to start
+
+    Returns:
+    int: Timestamp to fetch from, or None when the stored bars are fresh enough
+    """
+    coverage = history_store.get_coverage(symbol, interval)
+
+    if coverage is None or coverage['start_ts'] > start_time:
+        # Nothing stored yet, or the period reaches back further than the store
+        return start_time
+    max_age = HISTORY_SYNC_SECONDS if interval == '1d' else INTRADAY_SYNC_SECONDS
+    if time.time() - coverage['synced_at'] < max_age:
+        return None
+    # Refetch the last stored bar too, it may have been incomplete
+    return coverage['last_ts'] if coverage['last_ts'] is not None else start_time
+
+def history_path(symbol, interval, fetch_from, end_time):
+    return f"v8/finance/chart/{symbol}?interval={interval}&period1={fetch_from}&period2={end_time}"
+
+def store_history_bars(symbol, interval, data, fetch_from):
+    """Append the bars of a parsed chart response to the local bar store and roll them up"""
+    result = (data.get('chart', {}).get('result') or [{}])[0]
+
+    # Stamp bars the way rolled-up bars are stamped, so both land on the same rows
+    timestamps = [bucket_start(int(ts), interval) if ts is not None else None
+                  for ts in result.get('timestamp', []) or []]
+    quote_data = result.get('indicators', {}).get('quote', [{}])[0]
+
+    history_store.append(
+        symbol, interval, timestamps,
+        quote_data.get('open', []),
+        quote_data.get('high', []),
+        quote_data.get('low', []),
+        quote_data.get('close', []),
+        quote_data.get('volume', []),
+        start_ts=fetch_from
+    )
+
+    # Refresh the coarser intervals above this one
+    changed_from = fetch_from
+    level = BAR_PYRAMID.index(interval)
+    for child, parent in zip(BAR_PYRAMID[level:], BAR_PYRAMID[level + 1:]):
+        changed_from = history_store.rollup(symbol, child, parent, changed_from)
+        if changed_from is None:
+            break
+
 # Example usage:
 # stock_info = get_stock_data('INFY')
 # print(stock_info)
@@ -0,0 +1,157 @@
+from bisect import bisect_right
+from datetime import datetime
+
+# Holding period in days from which a sale counts as a long-term capital gain
+LONG_TERM_DAYS = 365
+
+def financial_year(date):
+    """
+    Get the Indian financial year (April to March) a date falls in
+
+    Parameters:
+    date (datetime or str): Date, or a 'YYYY-MM-DD' string
+
+    Returns:
+    str: Financial year in 'YYYY-YY' format
+    """
+    if isinstance(date, str):
+        date = datetime.strptime(date, '%Y-%m-%d')
+    start = date.year - 1 if date.month < 4 else date.year
+    return f"{start}-{str(start + 1)[2:]}"
+
+def holding_period(buy_date, sell_date):
+    """Days between two 'YYYY-MM-DD' dates, or 0 if the buy date is unknown"""
+    if not buy_date or buy_date == 'Unknown':
+        return 0
+    try:
+        return (datetime.strptime(sell_date, '%Y-%m-%d') - datetime.strptime(buy_date, '%Y-%m-%d')).days
+    except ValueError:
+        return 0
+
+def consume(lots, quantity):
+    """
+    Take quantity shares from the oldest lots first
+
+    Parameters:
+    lots (list): Open lots, oldest first, as {'date', 'quantity', 'price'} dicts. Modified in place
+    quantity (int): Shares to take
+
+    Returns:
+    list: The consumed parts as lot dicts with the quantity taken from each
+    """
+    taken = []
+    while quantity > 0 and lots:
+        lot = lots[0]
+        used = min(lot['quantity'], quantity)
+        taken.append(dict(lot, quantity=used))
+        lot['quantity'] -= used
+        quantity -= used
+        if lot['quantity'] == 0:
+            lots.pop(0)
+    return taken
+
+def open_lots(position):
+    """
+    Get the open FIFO lots of a position
+
+    Positions carry their lots under 'lots'. Older positions only have a
+    'transaction_history', so the lots are rebuilt from it once and then
+    reconciled with the position's quantity: sales recorded before lots
+    existed are consumed from the oldest lots, and shares without any
+    history become a single lot at the average buy price.
+
+    Parameters:
+    position (dict): Portfolio position
+
+    Returns:
+    list: Open lots, oldest first
+    """
+    if 'lots' in position:
+        return position['lots']
+
+    lots = []
+    for entry in sorted(position.get('transaction_history', []), key=lambda t: t.get('date') or ''):
+        if entry.get('type') == 'buy':
+            lots.append({'date': entry.get('date'), 'quantity': entry['quantity'], 'price': entry['price']})
+        elif entry.get('type') == 'sell':
+            consume(lots, entry['quantity'])
+
+    held = sum(lot['quantity'] for lot in lots)
+    if held > position['quantity']:
+        consume(lots, held - position['quantity'])
+    elif held < position['quantity']:
+        lots.append({
+            'date': position.get('purchase_date', 'Unknown'),
+            'quantity': position['quantity'] - held,
+            'price': position['buy_price']
+        })
+    position['lots'] = lots
+    return lots
+
+def lot_order(lot):
+    """Sort key putting lots in buy-date order; lots of unknown date count as oldest"""
+    date = lot.get('date')
+    return date if date and date != 'Unknown' else ''
+
+def add_lot(position, date, quantity, price):
+    """
+    Add a bought lot to a position, keeping its lots in buy-date order
+
+    A buy entered with an earlier date than existing lots is placed before
+    them, so FIFO sales consume it first.
+
+    Parameters:
+    position (dict): Portfolio position. Its lots are modified in place
+    date (str): Buy date, 'YYYY-MM-DD'
+    quantity (int): Shares bought
+    price (float): Price per share
+    """
+    lots = open_lots(position)
+    lot = {'date': date, 'quantity': quantity, 'price': price}
+    lots.insert(bisect_right([lot_order(l) for l in lots], lot_order(lot)), lot)
+
+def sell_fifo(position, quantity, sell_price, sell_date):
+    """
+    Sell shares of a position FIFO and build one realized record per lot
+
+    Updates the position's lots, quantity and average buy price in place.
+
+    Parameters:
+    position (dict): Portfolio position
+    quantity (int): Shares sold
+    sell_price (float): Price per share
+    sell_date (str): 'YYYY-MM-DD'
+
+    Returns:
+    list: Sold stock records with per-lot buy price, holding period, tax
+    category, profit/loss and financial year
+    """
+    lots = open_lots(position)
+    year = financial_year(sell_date)
+    records = []
+    for lot in consume(lots, quantity):
+        days = holding_period(lot['date'], sell_date)
+        records.append({
+            'symbol': position['symbol'],
+            'company_name': position.get('company_name', position['symbol']),
+            'quantity': lot['quantity'],
+            'buy_price': lot['price'],
+            'sell_price': sell_price,
+            'sell_date': sell_date,
+            'buy_date': lot['date'] or 'Unknown',
+            'holding_period': days,
+            'profit_loss': (sell_price - lot['price']) * lot['quantity'],
+            'tax_category': 'long_term' if days >= LONG_TERM_DAYS else 'short_term',
+            'financial_year': year
+        })
+
+    position['quantity'] = sum(lot['quantity'] for lot in lots)
+    if position['quantity']:
+        position['buy_price'] = round(sum(lot['quantity'] * lot['price'] for lot in lots) / position['quantity'], 2)
+    position.setdefault('transaction_history', []).append({
+        'date': sell_date,
+        'type': 'sell',
+        'quantity': quantity,
+        'price': sell_price
+    })
+    return records